@@ -0,0 +1,356 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+try:
+    from urllib.parse import urlparse, parse_qs
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from urlparse import urlparse, parse_qs
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+# The audits/search endpoint returns at most this many audits per request, like the real API
+SEARCH_PAGE_SIZE = 1000
+
+# Audits are modified one minute apart, starting at this date
+FIRST_MODIFIED_AT = datetime(2018, 1, 1)
+
+ORG_ID = 'role_123456789abcdef0123456789abcdef'
+
+
+class MockApiSettings:
+    """
+    Shape of the data served by MockApi and of the latency and errors injected into its responses
+    """
+
+    def __init__(self, audits=200, items_per_audit=50, media_per_audit=2, report_size_kb=256, media_size_kb=64,
+                 actions=500, users=200, groups=20, latency_ms=0, error_rate=0.0, seed=1):
+        """
+        :param audits:           number of audits served by audits/search
+        :param items_per_audit:  number of question items in every audit
+        :param media_per_audit:  number of media files attached to every audit
+        :param report_size_kb:   size of every exported PDF or Word document
+        :param media_size_kb:    size of every media file
+        :param actions:          number of actions served by actions/search
+        :param users:            number of users in the organisation
+        :param groups:           number of groups, every user belongs to two of them
+        :param latency_ms:       time every response is delayed by
+        :param error_rate:       fraction of requests answered with 503 (the SDK retries these)
+        :param seed:             seed of the random number generator deciding which requests fail
+        """
+        self.audits = audits
+        self.items_per_audit = items_per_audit
+        self.media_per_audit = media_per_audit
+        self.report_size_kb = report_size_kb
+        self.media_size_kb = media_size_kb
+        self.actions = actions
+        self.users = users
+        self.groups = groups
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.seed = seed
+
+
+def format_date(date):
+    return date.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def make_audit_id(index):
+    return 'audit_{0:032x}'.format(index + 1)
+
+
+def make_template_id(index):
+    return 'template_{0:032x}'.format(index % 5 + 1)
+
+
+def make_media_id(audit_index, media_index):
+    return str(uuid.UUID(int=audit_index * 1000 + media_index + 1))
+
+
+def build_audit(index, settings):
+    """
+    Build the JSON of audit number 'index', shaped like the audits returned by the API
+    :param index:     index of the audit
+    :param settings:  MockApiSettings
+    :return:          audit JSON as a dictionary
+    """
+    modified_at = format_date(FIRST_MODIFIED_AT + timedelta(minutes=index))
+    section_id = str(uuid.UUID(int=index * 100000 + 1))
+    items = [{'item_id': section_id, 'label': 'Section', 'type': 'section', 'children': []}]
+    for item_index in range(settings.items_per_audit):
+        item = {
+            'item_id': str(uuid.UUID(int=index * 100000 + item_index + 2)),
+            'parent_id': section_id,
+            'label': 'Question {0}'.format(item_index + 1),
+            'type': 'question',
+            'scoring': {'score': 1, 'max_score': 1, 'score_percentage': 100},
+            'options': {'response_set': '7bb1cb10-7020-11e2-bcfd-0800200c9a66'},
+            'responses': {
+                'selected': [{'id': '8bcfbf00-e11b-11e1-9b23-0800200c9a66', 'label': 'Yes'}],
+                'text': 'Comment on question {0}'.format(item_index + 1)
+            }
+        }
+        if item_index < settings.media_per_audit:
+            media_id = make_media_id(index, item_index)
+            item['media'] = [{'media_id': media_id, 'href': 'https://api.safetyculture.io/audits/{0}/media/{1}'.format(
+                make_audit_id(index), media_id)}]
+        items[0]['children'].append(item['item_id'])
+        items.append(item)
+    return {
+        'template_id': make_template_id(index),
+        'audit_id': make_audit_id(index),
+        'created_at': modified_at,
+        'modified_at': modified_at,
+        'audit_data': {
+            'score': settings.items_per_audit,
+            'total_score': settings.items_per_audit,
+            'score_percentage': 100,
+            'name': 'Benchmark audit {0}'.format(index + 1),
+            'duration': 60,
+            'authorship': {'owner': 'Benchmark', 'author': 'Benchmark'},
+            'date_completed': modified_at,
+            'date_modified': modified_at,
+            'date_started': modified_at
+        },
+        'template_data': {
+            'authorship': {'author': 'Benchmark'},
+            'metadata': {'name': 'Benchmark template', 'description': ''},
+            'response_sets': {}
+        },
+        'header_items': [{
+            'item_id': 'f3245d40-ea77-11e1-aff1-0800200c9a66',
+            'label': 'Audit Title',
+            'type': 'textsingle',
+            'responses': {'text': 'Benchmark audit {0}'.format(index + 1)}
+        }],
+        'items': items
+    }
+
+
+def build_action(index):
+    modified_at = format_date(FIRST_MODIFIED_AT + timedelta(minutes=index))
+    return {
+        'action_id': str(uuid.UUID(int=index + 1)),
+        'title': 'Action {0}'.format(index + 1),
+        'description': 'Benchmark action',
+        'assignees': [{'name': 'Benchmark'}],
+        'priority': 10,
+        'status': 0,
+        'due_at': modified_at,
+        'audit': {'name': 'Benchmark audit', 'audit_id': make_audit_id(index)},
+        'item': {'label': 'Question 1', 'item_id': str(uuid.UUID(int=index + 2))},
+        'created_by': {'name': 'Benchmark', 'user_id': 'user_1'},
+        'created_at': modified_at,
+        'modified_at': modified_at,
+        'completed_at': None,
+        'site': None
+    }
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    routes = [
+        ('GET', re.compile(r'^/audits/search$'), 'search_audits'),
+        ('GET', re.compile(r'^/templates/search$'), 'search_templates'),
+        ('POST', re.compile(r'^/audits/(audit_\w+)/report$'), 'start_export'),
+        ('GET', re.compile(r'^/audits/(audit_\w+)/report/([\w-]+)$'), 'poll_export'),
+        ('GET', re.compile(r'^/audits/(audit_\w+)/media/([\w-]+)$'), 'get_media'),
+        ('GET', re.compile(r'^/audits/(audit_\w+)/web_report_link$'), 'get_web_report_link'),
+        ('GET', re.compile(r'^/audits/(audit_\w+)$'), 'get_audit'),
+        ('GET', re.compile(r'^/downloads/([\w-]+)$'), 'download_export'),
+        ('POST', re.compile(r'^/actions/search$'), 'search_actions'),
+        ('GET', re.compile(r'^/share/connections$'), 'get_connections'),
+        ('GET', re.compile(r'^/groups$'), 'get_groups'),
+        ('GET', re.compile(r'^/groups/(role_\w+)/users$'), 'get_group_users'),
+        ('POST', re.compile(r'^/groups/(role_\w+)/users$'), 'add_group_user'),
+        ('DELETE', re.compile(r'^/groups/(role_\w+)/users/(user_\w+)$'), 'remove_group_user'),
+        ('POST', re.compile(r'^/users$'), 'add_user'),
+        ('PUT', re.compile(r'^/users/(user_\w+)$'), 'update_user'),
+    ]
+
+    def handle_request(self):
+        mock_api = self.server.mock_api
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if mock_api.settings.latency_ms:
+            time.sleep(mock_api.settings.latency_ms / 1000.0)
+        if mock_api.should_fail():
+            return self.send_body(503, b'{"error": "injected failure"}')
+        for method, pattern, handler_name in self.routes:
+            match = pattern.match(url.path)
+            if method == self.command and match:
+                status, payload = getattr(mock_api, handler_name)(parse_qs(url.query), body, *match.groups())
+                return self.send_body(status, payload)
+        self.send_body(404, b'{"error": "not found"}')
+
+    def send_body(self, status, payload):
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = handle_request
+    do_POST = handle_request
+    do_PUT = handle_request
+    do_DELETE = handle_request
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # Concurrent clients open more connections at once than the default backlog of 5 accepts
+    request_queue_size = 64
+
+
+class MockApi:
+    """
+    Local stand-in for the iAuditor API serving generated audits, exports, media, actions, users and groups, and
+    accepting the user and group changes of sync_users without applying them
+    """
+
+    def __init__(self, settings=None):
+        """
+        :param settings:  MockApiSettings, defaults are used if None
+        """
+        self.settings = settings or MockApiSettings()
+        self.random = random.Random(self.settings.seed)
+        self.lock = threading.Lock()
+        self.report = b'%PDF' + b'0' * (self.settings.report_size_kb * 1024 - 4)
+        self.media = b'\xff\xd8' + b'0' * (self.settings.media_size_kb * 1024 - 2)
+        self.audit_cache = {}
+        self.added_users = 0
+        self.writes = 0
+        self.server = None
+        self.url = None
+
+    def start(self):
+        """
+        Start serving on a free local port from a background thread
+        :return:  base URL of the API, to pass as api_url to safetypy.SafetyCulture
+        """
+        self.server = ThreadedHTTPServer(('127.0.0.1', 0), MockApiHandler)
+        self.server.mock_api = self
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:{0}/'.format(self.server.server_address[1])
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def should_fail(self):
+        if not self.settings.error_rate:
+            return False
+        with self.lock:
+            return self.random.random() < self.settings.error_rate
+
+    def record_write(self):
+        with self.lock:
+            self.writes += 1
+
+    def audit_json(self, audit_id):
+        index = int(audit_id[len('audit_'):], 16) - 1
+        if index not in self.audit_cache:
+            self.audit_cache[index] = json.dumps(build_audit(index, self.settings)).encode('utf-8')
+        return self.audit_cache[index]
+
+    def search_audits(self, query, body):
+        modified_after = query.get('modified_after', ['2000-01-01T00:00:00.000Z'])[0]
+        modified_before = query.get('modified_before', ['9999-12-31T23:59:59.999Z'])[0]
+        templates = query.get('template')
+        audits = []
+        for index in range(self.settings.audits):
+            modified_at = format_date(FIRST_MODIFIED_AT + timedelta(minutes=index))
+            template_id = make_template_id(index)
+            if modified_after < modified_at < modified_before and (not templates or template_id in templates):
+                audits.append({'audit_id': make_audit_id(index), 'modified_at': modified_at,
+                               'template_id': template_id})
+        return 200, {'count': min(len(audits), SEARCH_PAGE_SIZE), 'total': len(audits),
+                     'audits': audits[:SEARCH_PAGE_SIZE]}
+
+    def search_templates(self, query, body):
+        templates = [{'template_id': make_template_id(index), 'name': 'Benchmark template',
+                      'modified_at': format_date(FIRST_MODIFIED_AT)}
+                     for index in range(min(5, self.settings.audits))]
+        return 200, {'count': len(templates), 'total': len(templates), 'templates': templates}
+
+    def get_audit(self, query, body, audit_id):
+        return 200, self.audit_json(audit_id)
+
+    def start_export(self, query, body, audit_id):
+        return 200, {'messageId': str(uuid.uuid4())}
+
+    def poll_export(self, query, body, audit_id, export_job_id):
+        return 200, {'status': 'SUCCESS', 'url': self.url + 'downloads/' + export_job_id}
+
+    def download_export(self, query, body, export_job_id):
+        return 200, self.report
+
+    def get_media(self, query, body, audit_id, media_id):
+        return 200, self.media
+
+    def get_web_report_link(self, query, body, audit_id):
+        return 200, {'url': 'https://app.safetyculture.io/report/audit/' + audit_id}
+
+    def search_actions(self, query, body):
+        offset = json.loads(body.decode('utf-8')).get('offset', 0)
+        actions = [build_action(index) for index in range(offset, min(offset + 100, self.settings.actions))]
+        return 200, {'count': len(actions), 'offset': offset, 'total': self.settings.actions, 'actions': actions}
+
+    def get_connections(self, query, body):
+        return 200, {'groups': [{'id': ORG_ID, 'name': 'Benchmark organisation', 'type': 'organisation'}]}
+
+    def group_ids(self):
+        return ['role_{0:032x}'.format(index + 1) for index in range(self.settings.groups)]
+
+    def get_groups(self, query, body):
+        return 200, {'groups': [{'id': group_id, 'name': 'Group {0}'.format(index + 1)}
+                                for index, group_id in enumerate(self.group_ids())]}
+
+    def get_group_users(self, query, body, group_id):
+        if group_id == ORG_ID:
+            members = range(self.settings.users)
+        else:
+            group_index = self.group_ids().index(group_id)
+            members = [index for index in range(self.settings.users)
+                       if self.settings.groups and group_index in (index % self.settings.groups,
+                                                                   (index + 1) % self.settings.groups)]
+        return 200, {'users': [{'email': 'user{0}@example.com'.format(index), 'firstname': 'User',
+                                'lastname': str(index), 'user_id': 'user_{0:032x}'.format(index + 1),
+                                'status': 'active'} for index in members]}
+
+    def add_user(self, query, body):
+        with self.lock:
+            self.added_users += 1
+            user_id = 'user_{0:032x}'.format(self.settings.users + self.added_users)
+        self.record_write()
+        return 200, {'user': {'user_id': user_id}}
+
+    def update_user(self, query, body, user_id):
+        self.record_write()
+        return 200, {'ok': True}
+
+    def add_group_user(self, query, body, group_id):
+        self.record_write()
+        return 200, {'ok': True}
+
+    def remove_group_user(self, query, body, group_id, user_id):
+        self.record_write()
+        return 200, {'ok': True}
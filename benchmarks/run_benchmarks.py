@@ -0,0 +1,424 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+"""
+End to end benchmarks of the exporter, the actions export, the user export and sync_users against a local mock of
+the iAuditor API, of the sync_users reconciliation of a large organisation and of the CSV conversion of a large
+audit. Every scenario runs in its own process so that peak RSS is measured per scenario.
+
+    python benchmarks/run_benchmarks.py                   # run and compare against benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --save-baseline   # run and store the results as the new baseline
+
+The startup scenario measures how long importing the SDK and the exporter takes with python -X importtime.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from benchmarks.mock_api import MockApi, MockApiSettings
+
+SCENARIOS = ['sync_exports', 'export_actions', 'export_users', 'sync_users', 'sync_users_plan', 'large_audit',
+             'startup']
+
+DEFAULT_BASELINE_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# A result more than this fraction worse than the baseline is reported as a regression
+DEFAULT_TOLERANCE = 0.25
+
+# Metrics that fail the comparison with the baseline. Latencies of a local mock API are too noisy to gate on
+# and are only reported.
+GATED_METRICS = ['items_per_second', 'peak_rss_kb', 'safetypy_import_ms', 'exporter_import_ms']
+
+# Modules whose import time the startup scenario measures, by metric
+STARTUP_IMPORTS = [('safetypy_import_ms', 'safetypy.safetypy'), ('exporter_import_ms', 'tools.exporter.exporter')]
+
+# Import times vary between machines far more than throughput, with the speed of the disk and whether bytecode
+# is cached, so they only fail the comparison with the baseline when they are more than this fraction worse
+IMPORT_TIME_TOLERANCE = 1.0
+
+# The startup scenario keeps the fastest of this many imports, the others being slowed down by a cold disk cache
+# or other processes
+STARTUP_RUNS = 5
+
+API_TOKEN = '0' * 64
+
+
+class LatencyRecorder:
+    """
+    request_hook keeping the latency of every request, to compute percentiles, and the bytes received
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, method, url, status_code, elapsed_in_seconds, bytes_received):
+        with self.lock:
+            self.latencies.append(elapsed_in_seconds)
+            self.bytes_received += bytes_received or 0
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return 0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100.0))]
+
+
+def peak_rss_in_kb():
+    """
+    :return:  peak resident set size of this process in kilobytes, None where the resource module is unavailable
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return peak_rss // 1024 if sys.platform == 'darwin' else peak_rss
+
+
+def quiet_logger(name):
+    logger = logging.getLogger(name)
+    logger.handlers = [logging.NullHandler()]
+    logger.propagate = False
+    return logger
+
+
+def create_client(api_url, latency_recorder):
+    from safetypy import safetypy as sp
+    sc_client = sp.SafetyCulture(API_TOKEN, api_url=api_url, request_hook=latency_recorder,
+                                 rate_limiter=sp.RateLimiter(requests_per_second=10000,
+                                                             max_requests_per_second=10000))
+    sc_client.backoff_base_in_seconds = 0.01
+    quiet_logger('sp_logger')
+    return sc_client
+
+
+def run_sync_exports(api_url, latency_recorder, export_formats):
+    """
+    :return:  number of audits exported
+    """
+    from tools.exporter import exporter
+    sc_client = create_client(api_url, latency_recorder)
+    quiet_logger('csvExporter_logger')
+    settings = {
+        exporter.API_TOKEN: API_TOKEN,
+        exporter.EXPORT_PATH: os.path.join(os.getcwd(), 'exports'),
+        exporter.PREFERENCES: {},
+        exporter.FILENAME_ITEM_ID: None,
+        exporter.SYNC_DELAY_IN_SECONDS: 0,
+        exporter.EXPORT_INACTIVE_ITEMS_TO_CSV: True,
+        exporter.MEDIA_SYNC_OFFSET_IN_SECONDS: 0,
+        exporter.EXPORT_FORMATS: export_formats
+    }
+    os.makedirs(settings[exporter.EXPORT_PATH])
+    summary = exporter.sync_exports(quiet_logger('exporter_logger'), settings, sc_client)
+    return summary['audits_processed']
+
+
+def run_export_actions(api_url, latency_recorder):
+    """
+    :return:  number of actions exported
+    """
+    from tools.exporter import exporter
+    sc_client = create_client(api_url, latency_recorder)
+    settings = {exporter.EXPORT_PATH: os.getcwd(), exporter.EXPORT_FORMATS: ['actions']}
+    exporter.export_actions(quiet_logger('exporter_logger'), settings, sc_client)
+    with open(os.path.join(os.getcwd(), exporter.ACTIONS_EXPORT_FILENAME), 'rb') as actions_file:
+        return sum(1 for _ in actions_file) - 1
+
+
+def run_export_users(api_url, latency_recorder):
+    """
+    :return:  number of users exported
+    """
+    from tools.export_users import export_users
+    sc_client = create_client(api_url, latency_recorder)
+    users = export_users.get_all_users_and_groups(sc_client=sc_client)
+    return len(users)
+
+
+def run_sync_users(api_url, latency_recorder, mock_api_settings):
+    """
+    Sync an input file with the users of the mock API, where every tenth user is added, deactivated or moved to
+    another group, downloading the users and groups, then computing and executing the plan
+    :return:  number of users reconciled
+    """
+    import csv
+    from tools.export_users import export_users
+    from tools.sync_users import sync_users
+    sc_client = create_client(api_url, latency_recorder)
+    logger = quiet_logger('sync_users_logger')
+    group_count = max(mock_api_settings.groups, 1)
+    with open('users.csv', 'w') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(sync_users.CSV_HEADER)
+        for index in range(mock_api_settings.users):
+            group_names = ['Group {0}'.format((index + offset) % group_count + 1) for offset in range(2)]
+            if index % 10 == 1:
+                writer.writerow(['new{0}@example.com'.format(index), str(index), 'User', ', '.join(group_names)])
+            if index % 10 == 2:
+                group_names = ['Group {0}'.format((index + 2) % group_count + 1)]
+            if index % 10 != 3:
+                writer.writerow(['user{0}@example.com'.format(index), str(index), 'User', ', '.join(group_names)])
+    desired_state = sync_users.read_desired_state(logger, 'users.csv')
+    all_group_details = json.loads(sc_client.get_all_groups_in_org().content)
+    server_state = export_users.get_all_users_and_groups(sc_client=sc_client)
+    plan = sync_users.compute_sync_plan(server_state, desired_state)
+    failures = sync_users.execute_actions(logger, plan, all_group_details, sc_client)
+    if failures:
+        raise RuntimeError('{0} changes failed'.format(failures))
+    return len(set(server_state) | set(desired_state))
+
+
+def run_sync_users_plan(plan_users, plan_groups):
+    """
+    Reconcile an input file with a generated organisation, where every tenth user is added, deactivated or moved
+    between groups, without executing the plan
+    :return:  number of users reconciled
+    """
+    import csv
+    from tools.sync_users import sync_users
+    server_state = {}
+    with open('users.csv', 'w') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(sync_users.CSV_HEADER)
+        for index in range(plan_users):
+            email = 'user{0}@example.com'.format(index)
+            group_names = ['Group {0}'.format((index + offset) % plan_groups) for offset in range(3)]
+            if index % 10 != 1:
+                server_groups = []
+                for group_name in (group_names if index % 10 != 2 else group_names[1:] + ['Group extra']):
+                    server_groups += [group_name, 'role_' + group_name]
+                server_state[email] = {'groups': server_groups, 'firstname': 'User', 'lastname': str(index),
+                                       'user_id': 'user_{0}'.format(index)}
+            if index % 10 != 3:
+                writer.writerow([email, str(index), 'User', ', '.join(group_names)])
+    desired_state = sync_users.read_desired_state(quiet_logger('sync_users_logger'), 'users.csv')
+    sync_users.compute_sync_plan(server_state, desired_state)
+    return plan_users
+
+
+def run_large_audit(large_audit_items):
+    """
+    Convert a generated audit to CSV, list its media and name its export file, as the exporter does for every audit
+    :return:  number of items of the audit
+    """
+    from tools.exporter import csvExporter
+    from tools.exporter import exporter
+    header_items = [{'item_id': item_id, 'type': 'textsingle', 'label': header_item_type,
+                     'responses': {'text': header_item_type}}
+                    for header_item_type, item_id in sorted(csvExporter.header_field_id.items())]
+    items = []
+    for index in range(large_audit_items):
+        if index % 50 == 0:
+            section_id = 'section_{0}'.format(index)
+            items.append({'item_id': section_id, 'type': 'section', 'label': 'Section {0}'.format(index)})
+            continue
+        item = {'item_id': 'item_{0}'.format(index), 'parent_id': section_id, 'type': 'text',
+                'label': 'Item {0}'.format(index), 'responses': {'text': 'Response {0}'.format(index)}}
+        if index % 10 == 0:
+            item['media'] = [{'media_id': 'media_{0}'.format(index), 'href': 'media_{0}.jpg'.format(index)}]
+        items.append(item)
+    audit_json = {
+        'audit_id': 'audit_large', 'template_id': 'template_large', 'header_items': header_items, 'items': items,
+        'template_data': {'metadata': {'name': 'Large template'}, 'authorship': {'author': 'Author'},
+                          'response_sets': {}},
+        'audit_data': {'name': 'Large audit', 'authorship': {'owner': 'Owner', 'author': 'Author'}, 'score': 0,
+                       'total_score': 0, 'score_percentage': 0, 'duration': 0,
+                       'date_started': '2017-03-03T03:45:58.090Z', 'date_completed': '2017-03-03T03:45:58.090Z',
+                       'date_modified': '2017-03-03T03:45:58.090Z'}
+    }
+    csvExporter.CsvExporter(audit_json)
+    exporter.get_media_from_audit(quiet_logger('exporter_logger'), audit_json)
+    exporter.parse_export_filename(audit_json, csvExporter.header_field_id['DocumentNo'])
+    return len(header_items) + len(items)
+
+
+def run_scenario(scenario, mock_api_settings, export_formats, plan_users=0, plan_groups=0, large_audit_items=0):
+    """
+    Run a single scenario in the current process, in a temporary working directory
+    :return:  dictionary of results
+    """
+    mock_api = MockApi(mock_api_settings)
+    api_url = mock_api.start()
+    latency_recorder = LatencyRecorder()
+    working_directory = os.getcwd()
+    temp_dir = tempfile.mkdtemp()
+    os.chdir(temp_dir)
+    try:
+        start = time.time()
+        if scenario == 'sync_exports':
+            items = run_sync_exports(api_url, latency_recorder, export_formats)
+        elif scenario == 'export_actions':
+            items = run_export_actions(api_url, latency_recorder)
+        elif scenario == 'sync_users':
+            items = run_sync_users(api_url, latency_recorder, mock_api_settings)
+        elif scenario == 'sync_users_plan':
+            items = run_sync_users_plan(plan_users, plan_groups)
+        elif scenario == 'large_audit':
+            items = run_large_audit(large_audit_items)
+        else:
+            items = run_export_users(api_url, latency_recorder)
+        duration = time.time() - start
+    finally:
+        os.chdir(working_directory)
+        shutil.rmtree(temp_dir)
+        mock_api.stop()
+    return {
+        'items': items,
+        'seconds': round(duration, 3),
+        'items_per_second': round(items / duration, 2) if duration else 0,
+        'requests': len(latency_recorder.latencies),
+        'writes': mock_api.writes,
+        'bytes_received': latency_recorder.bytes_received,
+        'p50_latency_ms': round(latency_recorder.percentile(50) * 1000, 2),
+        'p99_latency_ms': round(latency_recorder.percentile(99) * 1000, 2),
+        'peak_rss_kb': peak_rss_in_kb()
+    }
+
+
+def measure_import_time(module):
+    """
+    :param module:  name of the module to import
+    :return:        milliseconds python -X importtime reports for importing the module and everything it imports
+    """
+    command = [sys.executable, '-X', 'importtime', '-c', 'import ' + module]
+    repository = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    output = subprocess.check_output(command, cwd=repository, stderr=subprocess.STDOUT).decode('utf-8')
+    cumulative_times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        cumulative_times[name.strip()] = int(cumulative)
+    top_level_package = module.split('.')[0]
+    return round(cumulative_times[top_level_package] / 1000.0, 1)
+
+
+def run_startup():
+    """
+    :return:  dictionary of the import time of every module of STARTUP_IMPORTS, in milliseconds
+    """
+    return dict((metric, min(measure_import_time(module) for _ in range(STARTUP_RUNS)))
+                for metric, module in STARTUP_IMPORTS)
+
+
+def run_scenario_in_subprocess(scenario, args):
+    command = [sys.executable, os.path.abspath(__file__), '--scenario', scenario] + scenario_arguments(args)
+    output = subprocess.check_output(command)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def scenario_arguments(args):
+    arguments = []
+    for name in ['audits', 'items_per_audit', 'media_per_audit', 'report_size_kb', 'media_size_kb', 'actions',
+                 'users', 'groups', 'plan_users', 'plan_groups', 'large_audit_items', 'latency_ms',
+                 'error_rate']:
+        arguments += ['--' + name.replace('_', '-'), str(getattr(args, name))]
+    return arguments + ['--formats'] + args.formats
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Print every result next to its baseline value
+    :return:  list of regressions, each a (scenario, metric, baseline value, result) tuple
+    """
+    regressions = []
+    higher_is_better = ['items_per_second']
+    lower_is_better = ['seconds', 'bytes_received', 'p50_latency_ms', 'p99_latency_ms', 'peak_rss_kb'] + \
+        [metric for metric, _ in STARTUP_IMPORTS]
+    for scenario, result in sorted(results.items()):
+        for metric in higher_is_better + lower_is_better:
+            if metric not in result:
+                continue
+            baseline_value = baseline.get(scenario, {}).get(metric)
+            value = result.get(metric)
+            if not baseline_value or value is None:
+                print('{0:<16} {1:<18} {2:>12}'.format(scenario, metric, value))
+                continue
+            change = (value - baseline_value) / float(baseline_value)
+            print('{0:<16} {1:<18} {2:>12} {3:>12} {4:>+8.1%}'.format(scenario, metric, value, baseline_value,
+                                                                      change))
+            if metric not in GATED_METRICS:
+                continue
+            metric_tolerance = tolerance
+            if metric in [import_metric for import_metric, _ in STARTUP_IMPORTS]:
+                metric_tolerance = max(tolerance, IMPORT_TIME_TOLERANCE)
+            if (metric in higher_is_better and change < -metric_tolerance) or \
+                    (metric in lower_is_better and change > metric_tolerance):
+                regressions.append((scenario, metric, baseline_value, value))
+    return regressions
+
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark the exporter tools against a local mock API')
+    parser.add_argument('--scenario', choices=SCENARIOS, help='run a single scenario in this process and print its '
+                                                              'results as JSON')
+    parser.add_argument('--only', nargs='*', choices=SCENARIOS, default=SCENARIOS, help='scenarios to run')
+    parser.add_argument('--audits', type=int, default=200)
+    parser.add_argument('--items-per-audit', type=int, default=50)
+    parser.add_argument('--media-per-audit', type=int, default=2)
+    parser.add_argument('--report-size-kb', type=int, default=256)
+    parser.add_argument('--media-size-kb', type=int, default=64)
+    parser.add_argument('--actions', type=int, default=500)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--plan-users', type=int, default=100000, help='users of the sync_users_plan scenario')
+    parser.add_argument('--plan-groups', type=int, default=500, help='groups of the sync_users_plan scenario')
+    parser.add_argument('--large-audit-items', type=int, default=20000, help='items of the large_audit scenario')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--formats', nargs='*', default=['pdf', 'json', 'csv', 'media'],
+                        help='export formats of the sync_exports scenario')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_FILENAME, help='baseline file to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='fraction by which a result may be worse than the baseline')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_command_line_arguments()
+    if args.scenario == 'startup':
+        print(json.dumps(run_startup()))
+        return
+    if args.scenario is not None:
+        mock_api_settings = MockApiSettings(args.audits, args.items_per_audit, args.media_per_audit,
+                                            args.report_size_kb, args.media_size_kb, args.actions, args.users,
+                                            args.groups, args.latency_ms, args.error_rate)
+        print(json.dumps(run_scenario(args.scenario, mock_api_settings, args.formats, args.plan_users,
+                                      args.plan_groups, args.large_audit_items)))
+        return
+
+    results = {}
+    for scenario in args.only:
+        results[scenario] = run_scenario_in_subprocess(scenario, args)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=4, sort_keys=True)
+            baseline_file.write('\n')
+        print('Baseline saved to ' + args.baseline)
+        return
+
+    baseline = json.load(open(args.baseline)) if os.path.isfile(args.baseline) else {}
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        for scenario, metric, baseline_value, value in regressions:
+            print('REGRESSION {0} {1}: {2} -> {3}'.format(scenario, metric, baseline_value, value))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,3 @@
-from .safetypy import *
\ No newline at end of file
+from .safetypy import *
+from . import metrics
+from . import models
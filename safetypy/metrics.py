@@ -0,0 +1,222 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import threading
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+# Upper bounds of the request latency histogram buckets
+DEFAULT_LATENCY_BUCKETS_IN_SECONDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Prefix of every metric name in the Prometheus text format
+PROMETHEUS_METRIC_PREFIX = 'safetyculture_api'
+
+# Names of the metrics in the Prometheus text format
+REQUESTS_METRIC = PROMETHEUS_METRIC_PREFIX + '_requests_total'
+BYTES_METRIC = PROMETHEUS_METRIC_PREFIX + '_response_bytes_total'
+LATENCY_METRIC = PROMETHEUS_METRIC_PREFIX + '_request_duration_seconds'
+
+
+def classify_endpoint(url):
+    """
+    Map a request URL to the class of endpoint it belongs to
+    :param url:  URL of the request
+    :return:     one of audits, report, media, actions, users, templates, response_sets or other
+    """
+    path = urlparse(url).path
+    if path.startswith('/audits/'):
+        if '/media/' in path:
+            return 'media'
+        if '/report' in path or path.endswith('/web_report_link'):
+            return 'report'
+        return 'audits'
+    if path.startswith('/actions'):
+        return 'actions'
+    if path.startswith(('/users', '/groups', '/share/connections')):
+        return 'users'
+    if path.startswith(('/templates', '/preferences')):
+        return 'templates'
+    if path.startswith('/response_sets'):
+        return 'response_sets'
+    return 'other'
+
+
+class EndpointStats:
+    """
+    Request statistics of a single endpoint class
+    """
+
+    def __init__(self, buckets):
+        self.count = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        self.bucket_counts = [0] * len(buckets)
+        self.status_codes = {}
+
+    def as_dict(self, buckets):
+        return {
+            'count': self.count,
+            'bytes_received': self.bytes_received,
+            'latency_sum': self.latency_sum,
+            'latency_buckets': dict(zip(buckets, self.bucket_counts)),
+            'status_codes': dict(self.status_codes)
+        }
+
+
+class RequestMetrics:
+    """
+    Aggregates count, latency histogram, bytes received and status codes per endpoint class.
+
+    Pass an instance as request_hook to safetypy.SafetyCulture. Every HTTP attempt is recorded, so retried
+    requests show up once per attempt with the status code of that attempt. Status code 'error' stands for
+    connection errors and timeouts.
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS_IN_SECONDS, callback=None, labels=None):
+        """
+        :param buckets:   upper bounds of the latency histogram buckets, in seconds
+        :param callback:  optional callable invoked with the endpoint class and all arguments of each record
+        :param labels:    optional dictionary of labels added to every Prometheus sample, e.g. {'tenant': 'acme'}
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.callback = callback
+        self.labels = labels or {}
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, method, url, status_code, elapsed_in_seconds, bytes_received):
+        self.record(method, url, status_code, elapsed_in_seconds, bytes_received)
+
+    def record(self, method, url, status_code, elapsed_in_seconds, bytes_received):
+        """
+        Record a single HTTP attempt
+        :param method:              HTTP method
+        :param url:                 request URL
+        :param status_code:         status code received, None on connection errors
+        :param elapsed_in_seconds:  time until the response headers were received
+        :param bytes_received:      size of the response body
+        """
+        endpoint = classify_endpoint(url)
+        status = str(status_code) if status_code is not None else 'error'
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats(self.buckets)
+            stats.count += 1
+            stats.bytes_received += bytes_received
+            stats.latency_sum += elapsed_in_seconds
+            stats.status_codes[status] = stats.status_codes.get(status, 0) + 1
+            for index, upper_bound in enumerate(self.buckets):
+                if elapsed_in_seconds <= upper_bound:
+                    stats.bucket_counts[index] += 1
+                    break
+        if self.callback is not None:
+            self.callback(endpoint, method, url, status_code, elapsed_in_seconds, bytes_received)
+
+    def snapshot(self):
+        """
+        :return:  dictionary of the statistics recorded so far, keyed by endpoint class
+        """
+        with self.lock:
+            return dict((endpoint, stats.as_dict(self.buckets)) for endpoint, stats in self.endpoints.items())
+
+    def to_prometheus_text(self):
+        """
+        :return:  the statistics recorded so far in the Prometheus text exposition format
+        """
+        return format_prometheus_text([self])
+
+    def prometheus_samples(self):
+        """
+        :return:  dictionary of sample lines in the Prometheus text format, keyed by metric name
+        """
+        snapshot = self.snapshot()
+        constant_labels = ''.join('{0}="{1}",'.format(name, escape_label_value(value))
+                                  for name, value in sorted(self.labels.items()))
+        samples = {REQUESTS_METRIC: [], BYTES_METRIC: [], LATENCY_METRIC: []}
+        for endpoint in sorted(snapshot):
+            labels = '{0}endpoint="{1}"'.format(constant_labels, endpoint)
+            for status, count in sorted(snapshot[endpoint]['status_codes'].items()):
+                samples[REQUESTS_METRIC].append('{0}{{{1},status="{2}"}} {3}'.format(REQUESTS_METRIC, labels,
+                                                                                    status, count))
+            samples[BYTES_METRIC].append('{0}{{{1}}} {2}'.format(BYTES_METRIC, labels,
+                                                                 snapshot[endpoint]['bytes_received']))
+            cumulative_count = 0
+            for upper_bound in self.buckets:
+                cumulative_count += snapshot[endpoint]['latency_buckets'][upper_bound]
+                samples[LATENCY_METRIC].append('{0}_bucket{{{1},le="{2}"}} {3}'.format(LATENCY_METRIC, labels,
+                                                                                      upper_bound, cumulative_count))
+            samples[LATENCY_METRIC].append('{0}_bucket{{{1},le="+Inf"}} {2}'.format(LATENCY_METRIC, labels,
+                                                                                   snapshot[endpoint]['count']))
+            samples[LATENCY_METRIC].append('{0}_sum{{{1}}} {2}'.format(LATENCY_METRIC, labels,
+                                                                       snapshot[endpoint]['latency_sum']))
+            samples[LATENCY_METRIC].append('{0}_count{{{1}}} {2}'.format(LATENCY_METRIC, labels,
+                                                                         snapshot[endpoint]['count']))
+        return samples
+
+
+def escape_label_value(value):
+    """
+    :param value:  value of a Prometheus label
+    :return:       the value with backslashes, double quotes and line feeds escaped
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_prometheus_text(request_metrics_list):
+    """
+    Render one or more RequestMetrics in the Prometheus text exposition format, e.g. one per API token
+    distinguished by their labels
+    :param request_metrics_list:  list of RequestMetrics instances
+    :return:                      the statistics recorded so far in the Prometheus text exposition format
+    """
+    metric_families = [
+        (REQUESTS_METRIC, 'HTTP requests sent to the iAuditor API', 'counter'),
+        (BYTES_METRIC, 'Bytes received from the iAuditor API', 'counter'),
+        (LATENCY_METRIC, 'Latency of requests to the iAuditor API', 'histogram')
+    ]
+    samples = [request_metrics.prometheus_samples() for request_metrics in request_metrics_list]
+    lines = []
+    for metric, description, metric_type in metric_families:
+        lines.append('# HELP {0} {1}'.format(metric, description))
+        lines.append('# TYPE {0} {1}'.format(metric, metric_type))
+        for metrics_samples in samples:
+            lines.extend(metrics_samples[metric])
+    return '\n'.join(lines) + '\n'
+
+
+def start_prometheus_exporter(request_metrics, port, host='127.0.0.1'):
+    """
+    Serve request_metrics in the Prometheus text format from a background thread
+    :param request_metrics:  RequestMetrics instance to expose, or a list of them
+    :param port:             port to listen on, 0 picks a free port
+    :param host:             interface to listen on, local only by default
+    :return:                 the running HTTPServer, call shutdown() on it to stop serving
+    """
+    try:
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+    except ImportError:
+        from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+    request_metrics_list = request_metrics if isinstance(request_metrics, list) else [request_metrics]
+
+    class PrometheusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = format_prometheus_text(request_metrics_list).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((host, port), PrometheusHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
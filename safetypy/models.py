@@ -0,0 +1,201 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+"""
+Lightweight, read-only views of an audit JSON. The views keep a reference to the dicts they wrap rather than copying
+them, and only build an index the first time it is used, so wrapping an audit costs nothing until it is queried.
+"""
+
+
+class Item(object):
+    """
+    View of a single header or non-header item of an audit
+    """
+    __slots__ = ('data', 'is_header', '_media_ids')
+
+    def __init__(self, data, is_header=False):
+        """
+        :param data:       item dict from the header_items or items array of an audit JSON
+        :param is_header:  True if the item is one of the header items
+        """
+        self.data = data
+        self.is_header = is_header
+        self._media_ids = None
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    @property
+    def item_id(self):
+        return self.data.get('item_id')
+
+    @property
+    def parent_id(self):
+        return self.data.get('parent_id')
+
+    @property
+    def type(self):
+        return self.data.get('type')
+
+    @property
+    def label(self):
+        return self.data.get('label')
+
+    @property
+    def responses(self):
+        """
+        :return:  responses of the item, an empty dict if it has none
+        """
+        return self.data.get('responses') or {}
+
+    @property
+    def options(self):
+        """
+        :return:  options of the item, an empty dict if it has none
+        """
+        return self.data.get('options') or {}
+
+    @property
+    def media_ids(self):
+        """
+        :return:  IDs of the media attached to the item: to question and media items, to signature and drawing
+                  items, then to information items
+        """
+        if self._media_ids is None:
+            media_ids = [media['media_id'] for media in self.data.get('media', [])]
+            if 'image' in self.responses:
+                media_ids.append(self.responses['image']['media_id'])
+            if 'media' in self.options:
+                media_ids.append(self.options['media']['media_id'])
+            self._media_ids = media_ids
+        return self._media_ids
+
+    def __repr__(self):
+        return 'Item({0!r}, {1!r})'.format(self.item_id, self.type)
+
+
+class Audit(object):
+    """
+    View of an audit JSON with indexes of its items, built on first use
+    """
+    __slots__ = ('data', '_items', '_header_items', '_item_by_id', '_items_by_type', '_header_item_by_id',
+                 '_header_items_by_type', '_media_ids')
+
+    def __init__(self, data):
+        """
+        :param data:  audit JSON, as returned by the audits endpoint
+        """
+        self.data = data
+        self._items = None
+        self._header_items = None
+        self._item_by_id = None
+        self._items_by_type = None
+        self._header_item_by_id = None
+        self._header_items_by_type = None
+        self._media_ids = None
+
+    @property
+    def audit_id(self):
+        return self.data.get('audit_id')
+
+    @property
+    def template_id(self):
+        return self.data.get('template_id')
+
+    @property
+    def name(self):
+        """
+        :return:  name of the audit from its audit_data, None if it has none
+        """
+        return (self.data.get('audit_data') or {}).get('name')
+
+    @property
+    def header_items(self):
+        """
+        :return:  list of the header items
+        """
+        if self._header_items is None:
+            self._header_items = [Item(item, True) for item in self.data.get('header_items', [])]
+        return self._header_items
+
+    @property
+    def items(self):
+        """
+        :return:  list of all items, the header items first
+        """
+        if self._items is None:
+            self._items = self.header_items + [Item(item) for item in self.data.get('items', [])]
+        return self._items
+
+    @property
+    def item_by_id(self):
+        """
+        :return:  dictionary of every item by item ID, the first item keeping an ID shared by several items
+        """
+        if self._item_by_id is None:
+            self._item_by_id = index_by_id(self.items)
+        return self._item_by_id
+
+    @property
+    def items_by_type(self):
+        """
+        :return:  dictionary of the list of items of every item type, in audit order
+        """
+        if self._items_by_type is None:
+            self._items_by_type = index_by_type(self.items)
+        return self._items_by_type
+
+    @property
+    def header_item_by_id(self):
+        """
+        :return:  dictionary of every header item by item ID, without indexing the non-header items
+        """
+        if self._header_item_by_id is None:
+            self._header_item_by_id = index_by_id(self.header_items)
+        return self._header_item_by_id
+
+    @property
+    def header_items_by_type(self):
+        """
+        :return:  dictionary of the list of header items of every item type
+        """
+        if self._header_items_by_type is None:
+            self._header_items_by_type = index_by_type(self.header_items)
+        return self._header_items_by_type
+
+    @property
+    def media_ids(self):
+        """
+        :return:  IDs of the media attached to all items, in audit order
+        """
+        if self._media_ids is None:
+            self._media_ids = [media_id for item in self.items for media_id in item.media_ids]
+        return self._media_ids
+
+    def __repr__(self):
+        return 'Audit({0!r})'.format(self.audit_id)
+
+
+def index_by_id(items):
+    """
+    :param items:  list of Item
+    :return:       dictionary of the items by item ID, the first item keeping a duplicate ID
+    """
+    item_by_id = {}
+    for item in items:
+        item_id = item.item_id
+        if item_id is not None and item_id not in item_by_id:
+            item_by_id[item_id] = item
+    return item_by_id
+
+
+def index_by_type(items):
+    """
+    :param items:  list of Item
+    :return:       dictionary of the list of items of every item type
+    """
+    items_by_type = {}
+    for item in items:
+        items_by_type.setdefault(item.type, []).append(item)
+    return items_by_type
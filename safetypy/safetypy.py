@@ -4,22 +4,89 @@
 # pylint: disable=E1101
 
 import collections
+import importlib
 import json
 import logging
 import os
+import random
 import re
 import sys
+import threading
 import time
 import errno
 from builtins import input
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 from datetime import datetime
-import requests
-from getpass import getpass
 
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported once one of its attributes is used, so that importing safetypy
+    stays fast for scripts that never send a request
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attribute):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attribute)
+
+
+requests = LazyModule('requests')
+
+DEFAULT_API_URL = 'https://api.safetyculture.io/'
 DEFAULT_EXPORT_FORMAT = 'PDF'
 GUID_PATTERN = '[A-Fa-f0-9]{8}-[A-Fa-f0-9]{4}-[A-Fa-f0-9]{4}-[A-Fa-f0-9]{4}-[A-Fa-f0-9]{12}$'
 HTTP_USER_AGENT_ID = 'safetyculture-python-sdk'
 
+# Number of times a throttled or failed request is retried before giving up
+DEFAULT_MAX_RETRIES = 5
+
+# Retries wait a random time between 0 and base * 2^attempt seconds, capped at the maximum (full jitter)
+DEFAULT_BACKOFF_BASE_IN_SECONDS = 1
+DEFAULT_BACKOFF_MAX_IN_SECONDS = 60
+
+# 429 and 503 mean the request was not processed, so they are safe to retry for every method.
+# The other 5xx codes are only retried for idempotent methods.
+THROTTLED_STATUS_CODES = (429, 503)
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+IDEMPOTENT_HTTP_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+# Request rate the limiter starts at, and the bounds it adapts within (requests per second)
+DEFAULT_REQUESTS_PER_SECOND = 10
+DEFAULT_MIN_REQUESTS_PER_SECOND = 0.5
+DEFAULT_MAX_REQUESTS_PER_SECOND = 50
+
+# The request rate is multiplied by this factor on every 429 response
+RATE_DECREASE_FACTOR = 0.5
+
+# Use a monotonic clock where available so the limiter is immune to wall clock changes
+monotonic_time = getattr(time, 'monotonic', time.time)
+
+# Number of connections kept open per host by a session created with create_session
+DEFAULT_POOL_MAXSIZE = 10
+
+# Streamed downloads are written to disk in chunks of this size, so memory use does not grow with the file size
+DOWNLOAD_CHUNK_SIZE_IN_BYTES = 64 * 1024
+
+# Suffix of the file a download is written to until it is complete
+PARTIAL_DOWNLOAD_SUFFIX = '.part'
+
+# Suffix of the file next to a partial download holding the ETag or Last-Modified value it can be resumed with
+VALIDATOR_SUFFIX = '.validator'
+
+# Export jobs get_exports runs at the same time
+DEFAULT_MAX_EXPORT_JOBS_IN_FLIGHT = 8
+
+# Templates cached by TemplateCache are discovered again once they are older than this
+DEFAULT_TEMPLATE_CACHE_TTL_IN_SECONDS = 900
+
 
 def get_user_api_token(logger):
     """
@@ -27,6 +94,7 @@ def get_user_api_token(logger):
     :param logger:  the logger
     :return:        API Token if authenticated else None
     """
+    from getpass import getpass
     username = input("iAuditor username: ")
     password = getpass()
     generate_token_url = "https://api.safetyculture.io/auth"
@@ -43,19 +111,229 @@ def get_user_api_token(logger):
         return None
 
 
+def create_session(pool_maxsize=DEFAULT_POOL_MAXSIZE):
+    """
+    Create a requests session whose connection pool can be shared between SafetyCulture clients, e.g. one per
+    API token, so their requests reuse the same connections to the API
+    :param pool_maxsize:  number of connections to keep open per host
+    :return:              the session
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def parse_retry_after(retry_after):
+    """
+    Parse the value of a Retry-After header
+    :param retry_after:  header value, either a number of seconds or an HTTP date
+    :return:             number of seconds to wait, or None if the header is missing or malformed
+    """
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        from email.utils import parsedate_tz, mktime_tz
+        parsed_date = parsedate_tz(retry_after)
+        if parsed_date is None:
+            return None
+        return max(0.0, mktime_tz(parsed_date) - time.time())
+
+
+class DeferredFileHandler(logging.FileHandler):
+    """
+    FileHandler that creates the directory of its file and opens the file when the first record is emitted, rather
+    than when it is created
+    """
+
+    def __init__(self, filename):
+        logging.FileHandler.__init__(self, filename, delay=True)
+
+    def _open(self):
+        directory = os.path.dirname(self.baseFilename)
+        try:
+            os.makedirs(directory)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST or not os.path.isdir(directory):
+                raise
+        return logging.FileHandler._open(self)
+
+
+class RateLimiter:
+    """
+    Thread safe token bucket limiting the rate of requests sent to the API.
+
+    The rate adapts to the API (additive increase, multiplicative decrease): every 429 response halves it,
+    every successful request grows it back by roughly one request per second, so throughput settles just
+    below the ceiling the API enforces. A Retry-After received by any request pauses all requests.
+    """
+
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                 min_requests_per_second=DEFAULT_MIN_REQUESTS_PER_SECOND,
+                 max_requests_per_second=DEFAULT_MAX_REQUESTS_PER_SECOND):
+        """
+        :param requests_per_second:      initial request rate
+        :param min_requests_per_second:  the rate never drops below this value
+        :param max_requests_per_second:  the rate never grows above this value
+        """
+        self.min_rate = float(min_requests_per_second)
+        self.max_rate = float(max_requests_per_second)
+        self.rate = min(max(float(requests_per_second), self.min_rate), self.max_rate)
+        self.tokens = 1.0
+        self.last_refill = monotonic_time()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        """
+        Add the tokens accumulated since the last refill. The bucket holds at most one second worth of requests.
+        Must be called with the lock held.
+        :param now:  current monotonic time
+        """
+        self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """
+        Block until a request may be sent
+        """
+        while True:
+            with self.lock:
+                now = monotonic_time()
+                self.refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def on_success(self):
+        """
+        Grow the rate after a request went through without being throttled
+        """
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 1.0 / self.rate)
+
+    def on_throttled(self, retry_after=None):
+        """
+        Cut the rate after a 429 response and pause all requests for retry_after seconds if given
+        :param retry_after:  seconds to wait as requested by the API, or None
+        """
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * RATE_DECREASE_FACTOR)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until, monotonic_time() + retry_after)
+
+
+class TemplateCache:
+    """
+    Thread safe cache of the templates and export preferences of the account, so that repeated lookups cost no
+    requests. The template list is discovered again once it is older than ttl_in_seconds. The preferences of a
+    template in the last discovered template list are kept until its modified_at changes, other preferences until
+    the TTL expires. Looking up preferences never discovers the templates.
+    """
+
+    def __init__(self, sc_client, ttl_in_seconds=DEFAULT_TEMPLATE_CACHE_TTL_IN_SECONDS):
+        """
+        :param sc_client:       SafetyCulture client to send the requests with
+        :param ttl_in_seconds:  time after which the cached template list is discovered again
+        """
+        self.sc_client = sc_client
+        self.ttl_in_seconds = ttl_in_seconds
+        self.templates = None
+        self.templates_fetched_at = None
+        self.preferences = {}
+        self.lock = threading.RLock()
+
+    def is_expired(self, fetched_at):
+        return fetched_at is None or monotonic_time() - fetched_at >= self.ttl_in_seconds
+
+    def get_templates(self):
+        """
+        :return:  dictionary of template search results (template_id, name, modified_at) by template ID, None if
+                  the templates could not be discovered. A failed refresh returns the expired templates.
+        """
+        with self.lock:
+            if self.is_expired(self.templates_fetched_at):
+                result = self.sc_client.discover_templates()
+                if result is not None:
+                    self.templates = dict((template['template_id'], template) for template in result['templates'])
+                    self.templates_fetched_at = monotonic_time()
+            return self.templates
+
+    def get_template(self, template_id):
+        """
+        :param template_id:  ID of the template
+        :return:             template search result, None if the template is unknown
+        """
+        templates = self.get_templates()
+        return templates.get(template_id) if templates is not None else None
+
+    def get_preferences(self, template_id=None):
+        """
+        :param template_id:  template to get the export preferences of, None for the preferences of every template
+        :return:             preference search result as returned by get_preference_ids, None on failure
+        """
+        with self.lock:
+            modified_at = None
+            if template_id is not None and self.templates is not None and template_id in self.templates:
+                modified_at = self.templates[template_id].get('modified_at')
+            cached = self.preferences.get(template_id)
+            if cached is not None and cached['modified_at'] == modified_at and \
+                    (modified_at is not None or not self.is_expired(cached['fetched_at'])):
+                return cached['preferences']
+            preferences = self.sc_client.get_preference_ids(template_id)
+            if preferences is not None:
+                self.preferences[template_id] = {'modified_at': modified_at, 'fetched_at': monotonic_time(),
+                                                 'preferences': preferences}
+            return preferences
+
+    def invalidate(self):
+        """
+        Drop every cached template and preference
+        """
+        with self.lock:
+            self.templates = None
+            self.templates_fetched_at = None
+            self.preferences = {}
+
+
 class SafetyCulture:
-    def __init__(self, api_token):
+    def __init__(self, api_token, api_url=None, max_retries=DEFAULT_MAX_RETRIES, rate_limiter=None,
+                 request_hook=None, session=None, template_cache_ttl_in_seconds=DEFAULT_TEMPLATE_CACHE_TTL_IN_SECONDS):
+        """
+        :param api_token:     iAuditor API token
+        :param api_url:       base URL of the API, defaults to DEFAULT_API_URL
+        :param max_retries:   number of times a throttled or failed request is retried
+        :param rate_limiter:  RateLimiter to share between clients, a new one is created if None
+        :param request_hook:  callable invoked after every HTTP attempt with the method, URL, status code
+                              (None on connection errors), latency in seconds and number of bytes received,
+                              e.g. an instance of safetypy.metrics.RequestMetrics
+        :param session:       requests session to send requests with, see create_session. Without a session every
+                              request opens a new connection
+        :param template_cache_ttl_in_seconds:  time after which template_cache discovers the templates again
+        """
         self.current_dir = os.getcwd()
         self.log_dir = self.current_dir + '/log/'
-        self.api_url = 'https://api.safetyculture.io/'
+        self.api_url = api_url or DEFAULT_API_URL
+        self.max_retries = max_retries
+        self.backoff_base_in_seconds = DEFAULT_BACKOFF_BASE_IN_SECONDS
+        self.backoff_max_in_seconds = DEFAULT_BACKOFF_MAX_IN_SECONDS
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.request_hook = request_hook
+        self.session = session
+        self.template_cache = TemplateCache(self, template_cache_ttl_in_seconds)
         self.audit_url = self.api_url + 'audits/'
-        self.template_search_url = self.api_url + 'templates/search?field=template_id&field=name'
+        self.template_search_url = self.api_url + 'templates/search?field=template_id&field=name&field=modified_at'
         self.response_set_url = self.api_url + 'response_sets'
         self.get_my_groups_url = self.api_url + 'share/connections'
         self.all_groups_url = self.api_url + 'groups'
         self.add_users_url = self.api_url + 'users'
-        
-        self.create_directory_if_not_exists(self.log_dir)
+
         self.configure_logging()
         logger = logging.getLogger('sp_logger')
         try:
@@ -77,23 +355,91 @@ class SafetyCulture:
             logger.error('No valid API token parsed! Exiting.')
             sys.exit(1)
 
-    def authenticated_request_get(self, url):
-        return requests.get(url, headers=self.custom_http_headers)
+    def authenticated_request(self, method, url, data=None, content_type=None, stream=False, headers=None):
+        """
+        Send an authenticated request, retrying throttled (429) and failed (5xx) requests with exponential backoff.
+        Retry-After headers sent by the API take precedence over the computed backoff.
+
+        :param method:        HTTP method
+        :param url:           URL to send the request to
+        :param data:          request body, if any
+        :param content_type:  content-type header to send along with the body, if any
+        :param stream:        if True, do not download the response body immediately
+        :param headers:       further headers to send, if any
+        :return:              the last response received
+        """
+        logger = logging.getLogger('sp_logger')
+        request_headers = dict(self.custom_http_headers)
+        request_headers.update(headers or {})
+        if content_type is not None:
+            request_headers['content-type'] = content_type
+        retry_on = RETRYABLE_STATUS_CODES if method in IDEMPOTENT_HTTP_METHODS else THROTTLED_STATUS_CODES
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            if self.request_hook is not None:
+                start = monotonic_time()
+            try:
+                response = (self.session or requests).request(method, url, data=data, headers=request_headers,
+                                                              stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+                if self.request_hook is not None:
+                    self.request_hook(method, url, None, monotonic_time() - start, 0)
+                if attempt >= self.max_retries or method not in IDEMPOTENT_HTTP_METHODS:
+                    raise
+                delay = self.get_retry_delay(attempt)
+                logger.warning('{0} on {1} {2}, retrying in {3:.1f} seconds'.format(ex, method, url, delay))
+            else:
+                if self.request_hook is not None:
+                    self.request_hook(method, url, response.status_code, monotonic_time() - start,
+                                      self.get_response_size(response, stream))
+                if response.status_code not in retry_on or attempt >= self.max_retries:
+                    if response.status_code != 429:
+                        self.rate_limiter.on_success()
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if response.status_code == 429:
+                    self.rate_limiter.on_throttled(retry_after)
+                delay = retry_after if retry_after is not None else self.get_retry_delay(attempt)
+                logger.warning('{0} status received on {1} {2}, retrying in {3:.1f} seconds ({4}/{5})'.format(
+                    response.status_code, method, url, delay, attempt + 1, self.max_retries))
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def get_response_size(response, stream):
+        """
+        Number of bytes in the response body. Streamed bodies are not read, their size is taken from Content-Length.
+        :param response:  the response
+        :param stream:    whether the body of the response is streamed
+        :return:          body size in bytes, 0 if unknown
+        """
+        content_length = response.headers.get('Content-Length')
+        if content_length is not None and content_length.isdigit():
+            return int(content_length)
+        return 0 if stream else len(response.content)
+
+    def get_retry_delay(self, attempt):
+        """
+        Exponential backoff with full jitter
+        :param attempt:  number of attempts made so far, starting at 0
+        :return:         seconds to wait before the next attempt
+        """
+        ceiling = min(self.backoff_max_in_seconds, self.backoff_base_in_seconds * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def authenticated_request_get(self, url, stream=False):
+        return self.authenticated_request('GET', url, stream=stream)
 
     def authenticated_request_post(self, url, data):
-        self.custom_http_headers['content-type'] = 'application/json'
-        response = requests.post(url, data, headers=self.custom_http_headers)
-        del self.custom_http_headers['content-type']
-        return response
+        return self.authenticated_request('POST', url, data=data, content_type='application/json')
 
     def authenticated_request_put(self, url, data):
-        self.custom_http_headers['content-type'] = 'application/json'
-        response = requests.put(url, data, headers=self.custom_http_headers)
-        del self.custom_http_headers['content-type']
-        return response
+        return self.authenticated_request('PUT', url, data=data, content_type='application/json')
 
     def authenticated_request_delete(self, url):
-        return requests.delete(url, headers=self.custom_http_headers)
+        return self.authenticated_request('DELETE', url)
 
     @staticmethod
     def parse_json(json_to_parse):
@@ -120,16 +466,20 @@ class SafetyCulture:
 
     def configure_logging(self):
         """
-        Configure logging to log to std output as well as to log file
+        Configure logging to log to std output as well as to log file. The log directory and file are only created
+        once the first record is logged.
         """
         log_level = logging.DEBUG
 
         log_filename = datetime.now().strftime('%Y-%m-%d') + '.log'
         sp_logger = logging.getLogger('sp_logger')
+        # every client shares sp_logger, only the first one configures it
+        if sp_logger.handlers:
+            return
         sp_logger.setLevel(log_level)
         formatter = logging.Formatter('%(asctime)s : %(levelname)s : %(message)s')
 
-        fh = logging.FileHandler(filename=self.log_dir + log_filename)
+        fh = DeferredFileHandler(filename=self.log_dir + log_filename)
         fh.setLevel(log_level)
         fh.setFormatter(formatter)
         sp_logger.addHandler(fh)
@@ -156,13 +506,14 @@ class SafetyCulture:
                 self.log_critical_error(ex, 'An error happened trying to create ' + path)
                 raise
 
-    def discover_audits(self, template_id=None, modified_after=None, completed=True):
+    def discover_audits(self, template_id=None, modified_after=None, completed=True, modified_before=None):
         """
         Return IDs of all completed audits if no parameters are passed, otherwise restrict search
         based on parameter values
         :param template_id:     Restrict discovery to this template_id
         :param modified_after:  Restrict discovery to audits modified after this UTC timestamp
         :param completed:       Restrict discovery to audits marked as completed, default to True
+        :param modified_before: Restrict discovery to audits modified before this UTC timestamp
         :return:                JSON object containing IDs of all audits returned by API
         """
 
@@ -170,14 +521,17 @@ class SafetyCulture:
 
         last_modified = modified_after if modified_after is not None else '2000-01-01T00:00:00.000Z'
 
-        search_url = self.audit_url + 'search?field=audit_id&field=modified_at&order=asc&modified_after=' \
-            + last_modified
+        search_url = self.audit_url + 'search?field=audit_id&field=modified_at&field=template_id&order=asc' \
+            '&modified_after=' + last_modified
         log_string = '\nInitiating audit_discovery with the parameters: ' + '\n'
-        log_string += 'template_id    = ' + str(template_id) + '\n'
-        log_string += 'modified_after = ' + str(last_modified) + '\n'
-        log_string += 'completed      = ' + str(completed) + '\n'
+        log_string += 'template_id     = ' + str(template_id) + '\n'
+        log_string += 'modified_after  = ' + str(last_modified) + '\n'
+        log_string += 'modified_before = ' + str(modified_before) + '\n'
+        log_string += 'completed       = ' + str(completed) + '\n'
         logger.info(log_string)
 
+        if modified_before is not None:
+            search_url += '&modified_before=' + modified_before
         if template_id is not None:
             search_url += '&template=' + template_id
         if completed is not False:
@@ -256,6 +610,76 @@ class SafetyCulture:
         self.log_http_status(response.status_code, log_message)
         return result
 
+    def get_exports(self, audit_ids, preference_id=None, export_format=DEFAULT_EXPORT_FORMAT, export_paths=None,
+                    max_jobs_in_flight=DEFAULT_MAX_EXPORT_JOBS_IN_FLIGHT, timing_hook=None, fsync=False):
+        """
+        Export several audits at once. Export jobs are started, polled and downloaded on up to max_jobs_in_flight
+        threads, and each result is yielded as soon as its job has finished. A failed export does not affect the
+        others.
+
+        :param audit_ids:           IDs of the audits to export
+        :param preference_id:       ID of preference to apply to every export
+        :param export_format:       desired format of exported documents
+        :param export_paths:        dictionary of the file to download the export of each audit to, see
+                                    download_to_file. Exports of audits without a path are returned as bytes.
+        :param max_jobs_in_flight:  number of export jobs run at the same time
+        :param timing_hook:         callable invoked for every job with the audit ID, the seconds spent waiting for
+                                    the export job to complete and the seconds spent downloading the export
+        :param fsync:               if True, flush every downloaded file to disk before moving it into place
+        :return:                    generator of (audit ID, path or bytes of the export) tuples in the order the
+                                    exports finish, the export being None if it failed
+        """
+        audit_ids = list(audit_ids)
+        export_paths = export_paths or {}
+        pending_jobs = queue.Queue()
+        for audit_id in audit_ids:
+            pending_jobs.put(audit_id)
+        finished_jobs = queue.Queue()
+
+        def run_export_jobs():
+            while True:
+                try:
+                    audit_id = pending_jobs.get_nowait()
+                except queue.Empty:
+                    return
+                finished_jobs.put(self.run_export_job(audit_id, preference_id, export_format,
+                                                      export_paths.get(audit_id), fsync))
+
+        for _ in range(min(max_jobs_in_flight, len(audit_ids))):
+            worker = threading.Thread(target=run_export_jobs)
+            worker.daemon = True
+            worker.start()
+        for _ in range(len(audit_ids)):
+            audit_id, export, export_seconds, download_seconds = finished_jobs.get()
+            if timing_hook is not None:
+                timing_hook(audit_id, export_seconds, download_seconds)
+            yield audit_id, export
+
+    def run_export_job(self, audit_id, preference_id, export_format, export_path, fsync):
+        """
+        Start an export job, wait for it to complete and download the export
+        :return:  tuple of the audit ID, the path or bytes of the export (None if the export failed), the seconds
+                  spent waiting for the export job and the seconds spent downloading the export
+        """
+        start = monotonic_time()
+        download_start = None
+        export = None
+        try:
+            export_job = self.get_export_job_id(audit_id, preference_id, export_format)
+            export_href = self.poll_for_export(audit_id, export_job['messageId']) if export_job else None
+            download_start = monotonic_time()
+            if export_href is not None:
+                if export_path is None:
+                    export = self.download_export(export_href)
+                elif self.download_to_file(export_href, export_path, fsync) is not None:
+                    export = export_path
+        except Exception as ex:
+            self.log_critical_error(ex, 'Exception occurred while exporting {0} as {1}'.format(audit_id,
+                                                                                            export_format))
+        end = monotonic_time()
+        download_start = download_start or end
+        return audit_id, export, download_start - start, end - download_start
+
     def poll_for_export(self, audit_id, export_job_id):
         """
         Poll API for given export job until job is complete or excessive failed attempts occur
@@ -288,6 +712,9 @@ class SafetyCulture:
                         export_attempts += 1
                         logger.info('attempt # {0} exporting report for: ' + audit_id.format(str(export_attempts)))
                         retry_id = self.get_export_job_id(audit_id)
+                        if retry_id is None:
+                            logger.error('export for ' + audit_id + ' could not be restarted - skipping')
+                            return None
                         return self.poll_for_export(audit_id, retry_id['messageId'])
                     else:
                         logger.error('export for ' + audit_id + ' failed {0} times - skipping'.format(export_attempts))
@@ -316,6 +743,140 @@ class SafetyCulture:
         except Exception as ex:
             self.log_critical_error(ex, 'Exception occurred while attempting download_export({0})'.format(export_href))
 
+    def download_to_file(self, url, path, fsync=False):
+        """
+        Stream a download to a file, holding no more than a chunk of it in memory. The body is written to a
+        partial file next to path, checked against the Content-Length header and then moved to path, so path
+        never holds an incomplete download.
+
+        A download interrupted by a dropped connection is resumed with a Range request, retrying up to
+        max_retries times. If the server identified the file with an ETag or Last-Modified header, a partial
+        file left by a failed download is kept and resumed by the next download to the same path, as long as
+        the server still has the same file.
+
+        :param url:    URL to download
+        :param path:   file to save the download to, replaced if it exists
+        :param fsync:  if True, flush the file to disk before moving it to path
+        :return:       number of bytes written, None if the download failed
+        """
+        logger = logging.getLogger('sp_logger')
+        partial_path = path + PARTIAL_DOWNLOAD_SUFFIX
+        validator_path = partial_path + VALIDATOR_SUFFIX
+        attempt = 0
+        while True:
+            try:
+                bytes_written = self.download_part(url, partial_path, validator_path, fsync)
+                break
+            except (IOError, OSError) as ex:
+                if attempt >= self.max_retries:
+                    self.log_critical_error(ex, 'Exception occurred while downloading {0} to {1}'.format(url, path))
+                    if not os.path.isfile(validator_path):
+                        self.remove_partial_download(partial_path, validator_path)
+                    return None
+                delay = self.get_retry_delay(attempt)
+                logger.warning('{0} while downloading {1}, resuming in {2:.1f} seconds'.format(ex, url, delay))
+                time.sleep(delay)
+                attempt += 1
+        if bytes_written is None:
+            self.remove_partial_download(partial_path, validator_path)
+            return None
+        try:
+            if hasattr(os, 'replace'):
+                os.replace(partial_path, path)
+            else:
+                if os.path.exists(path):
+                    os.remove(path)
+                os.rename(partial_path, path)
+        except OSError as ex:
+            self.log_critical_error(ex, 'Exception occurred while moving the download of {0} to {1}'.format(url, path))
+            self.remove_partial_download(partial_path, validator_path)
+            return None
+        self.remove_partial_download(None, validator_path)
+        return bytes_written
+
+    def download_part(self, url, partial_path, validator_path, fsync):
+        """
+        Download the rest of a file, appending to the partial file if the server can resume it, otherwise
+        rewriting the partial file from the start
+
+        :param url:             URL to download
+        :param partial_path:    file the download is written to
+        :param validator_path:  file holding the ETag or Last-Modified value the partial file was downloaded with
+        :param fsync:           if True, flush the partial file to disk once complete
+        :return:                size of the complete partial file in bytes, None if the server refused the download
+        :raise IOError:         if the download was interrupted and may be resumed
+        """
+        offset = os.path.getsize(partial_path) if os.path.isfile(partial_path) else 0
+        validator = None
+        if offset and os.path.isfile(validator_path):
+            with open(validator_path, 'r') as validator_file:
+                validator = validator_file.read().strip() or None
+        # ranges are byte offsets in the body as sent, so ask for it unencoded
+        headers = {'Accept-Encoding': 'identity'}
+        if validator is not None:
+            headers['Range'] = 'bytes={0}-'.format(offset)
+            headers['If-Range'] = validator
+        response = self.authenticated_request('GET', url, stream=True, headers=headers)
+        try:
+            if response.status_code == requests.codes.partial_content:
+                if not response.headers.get('Content-Range', '').startswith('bytes {0}-'.format(offset)):
+                    self.remove_partial_download(partial_path, validator_path)
+                    raise IOError('unexpected Content-Range ' + str(response.headers.get('Content-Range')))
+                logging.getLogger('sp_logger').info('206 [partial_content] status received on GET for {0}, '
+                                                    'resuming at byte {1}'.format(url, offset))
+                mode = 'ab'
+            elif response.status_code == requests.codes.ok:
+                self.log_http_status(response.status_code, 'on GET for ' + url)
+                offset = 0
+                mode = 'wb'
+                self.save_download_validator(response, validator_path)
+            elif response.status_code == requests.codes.requested_range_not_satisfiable:
+                self.remove_partial_download(partial_path, validator_path)
+                raise IOError('range {0}- of the partial download is not satisfiable'.format(offset))
+            else:
+                self.log_http_status(response.status_code, 'on GET for ' + url)
+                return None
+            bytes_received = 0
+            with open(partial_path, mode) as partial_file:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE_IN_BYTES):
+                    partial_file.write(chunk)
+                    bytes_received += len(chunk)
+                if fsync:
+                    partial_file.flush()
+                    os.fsync(partial_file.fileno())
+            content_length = response.headers.get('Content-Length')
+            # the length of an encoded body is that of the encoded bytes, not of the decoded chunks
+            if content_length is not None and content_length.isdigit() and \
+                    response.headers.get('Content-Encoding', 'identity') == 'identity' and \
+                    int(content_length) != bytes_received:
+                raise IOError('received {0} of {1} bytes'.format(bytes_received, content_length))
+            return offset + bytes_received
+        finally:
+            response.close()
+
+    @staticmethod
+    def save_download_validator(response, validator_path):
+        """
+        Keep the strong ETag, or else the Last-Modified date, of a download so that it can be resumed with If-Range
+        :param response:        response to a download request
+        :param validator_path:  file to save the validator to, removed if the response has none
+        """
+        validator = response.headers.get('ETag')
+        if validator is None or validator.startswith('W/'):
+            validator = response.headers.get('Last-Modified')
+        if validator is None:
+            if os.path.isfile(validator_path):
+                os.remove(validator_path)
+            return
+        with open(validator_path, 'w') as validator_file:
+            validator_file.write(validator)
+
+    @staticmethod
+    def remove_partial_download(partial_path, validator_path):
+        for path in (partial_path, validator_path):
+            if path is not None and os.path.isfile(path):
+                os.remove(path)
+
     def get_export(self, audit_id, preference_id=None, export_format=DEFAULT_EXPORT_FORMAT):
         """
         Obtain exported document from API and return string representation of it
@@ -325,8 +886,13 @@ class SafetyCulture:
         :param export_format:      desired format of exported document
         :return:                   String representation of exported document
         """
-        export_job_id = self.get_export_job_id(audit_id, preference_id, export_format)['messageId']
-        export_href = self.poll_for_export(audit_id, export_job_id)
+        export_job = self.get_export_job_id(audit_id, preference_id, export_format)
+        if export_job is None:
+            self.log_critical_error(ValueError, 'no export job could be started for {0}'.format(audit_id))
+            return None
+        export_href = self.poll_for_export(audit_id, export_job['messageId'])
+        if export_href is None:
+            return None
 
         export_content = self.download_export(export_href)
         return export_content
@@ -340,9 +906,20 @@ class SafetyCulture:
                             and the body of the response is the media itself.
         """
         url = self.audit_url + audit_id + '/media/' + media_id
-        response = requests.get(url, headers=self.custom_http_headers, stream=True)
+        response = self.authenticated_request_get(url, stream=True)
         return response
 
+    def download_media_to_file(self, audit_id, media_id, path, fsync=False):
+        """
+        Stream a media item associated with a specified audit and media ID to a file, see download_to_file
+        :param audit_id:  audit ID of document that contains media
+        :param media_id:  media ID of image to fetch
+        :param path:      file to save the media to, replaced if it exists
+        :param fsync:     if True, flush the file to disk before moving it to path
+        :return:          number of bytes written, None if the download failed
+        """
+        return self.download_to_file(self.audit_url + audit_id + '/media/' + media_id, path, fsync)
+
     def get_web_report(self, audit_id):
         """
         Generate Web Report link associated with a specified audit
@@ -422,12 +999,13 @@ class SafetyCulture:
         """
         Create new response_set
         :param payload:  Name and responses of response_set to create
-        :return:
+        :return:         the response_set created, None if it could not be created
         """
         payload = json.dumps({'name': name, 'responses': responses})
         response = self.authenticated_request_post(self.response_set_url, payload)
         log_message = 'on POST for new response_set: {0}'.format(name)
         self.log_http_status(response.status_code, log_message)
+        return response.content if response.status_code == requests.codes.ok else None
 
     def get_response_sets(self):
         """
@@ -457,24 +1035,26 @@ class SafetyCulture:
         Create response in existing response_set
         :param responseset_id: id of response_set to add response to
         :param response:       response to add
-        :return:               None
+        :return:               the response created, None if it could not be created
         """
         url = '{0}/{1}/responses'.format(self.response_set_url, responseset_id)
         response = self.authenticated_request_post(url, json.dumps(response))
         log_message = 'on POST for new response to: {0}'.format(responseset_id)
         self.log_http_status(response.status_code, log_message)
+        return response.content if response.status_code == requests.codes.ok else None
 
     def delete_response(self, responseset_id, response_id):
         """
         DELETE individual response by id
         :param responseset_id: responseset_id of response_set containing response to be deleted
         :param response_id:    id of response to be deleted
-        :return:               None
+        :return:               the response of the API, None if the response could not be deleted
         """
         url = '{0}/{1}/responses/{2}'.format(self.response_set_url, responseset_id, response_id)
         response = self.authenticated_request_delete(url)
         log_message = 'on DELETE for response_set: {0}'.format(responseset_id)
         self.log_http_status(response.status_code, log_message)
+        return response if response.status_code == requests.codes.ok else None
 
     def get_my_org(self):
         """
@@ -0,0 +1,71 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+import os
+import sys
+import threading
+import time
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'safetypy'))
+import safetypy as sp
+
+VALID_TOKEN = '032d09de1ef9c43eb77f56da82ae23588d1564b9fa6f6f59e9a1849191ef1214'
+
+
+class FakeExportClient(sp.SafetyCulture):
+    """
+    Completes export jobs after the delay set for their audit, failing the audits listed in failing_audit_ids
+    """
+
+    def __init__(self, delays, failing_audit_ids=()):
+        sp.SafetyCulture.__init__(self, VALID_TOKEN, max_retries=0)
+        self.delays = delays
+        self.failing_audit_ids = failing_audit_ids
+        self.lock = threading.Lock()
+        self.jobs_in_flight = 0
+        self.max_jobs_seen_in_flight = 0
+
+    def get_export_job_id(self, audit_id, preference_id=None, export_format='pdf'):
+        with self.lock:
+            self.jobs_in_flight += 1
+            self.max_jobs_seen_in_flight = max(self.max_jobs_seen_in_flight, self.jobs_in_flight)
+        return {'messageId': 'job_' + audit_id}
+
+    def poll_for_export(self, audit_id, export_job_id):
+        time.sleep(self.delays[audit_id])
+        with self.lock:
+            self.jobs_in_flight -= 1
+        if audit_id in self.failing_audit_ids:
+            raise IOError('export job failed')
+        return 'https://example.com/' + audit_id
+
+    def download_export(self, export_href):
+        return export_href.rsplit('/', 1)[1].encode('utf-8')
+
+
+class BulkExportTestCase(unittest.TestCase):
+
+    def test_exports_are_yielded_as_they_finish(self):
+        sc_client = FakeExportClient({'audit_1': 0.3, 'audit_2': 0.0, 'audit_3': 0.1})
+        timings = []
+        exports = list(sc_client.get_exports(['audit_1', 'audit_2', 'audit_3'],
+                                             timing_hook=lambda *timing: timings.append(timing)))
+        self.assertEqual(exports, [('audit_2', b'audit_2'), ('audit_3', b'audit_3'), ('audit_1', b'audit_1')])
+        self.assertEqual([timing[0] for timing in timings], ['audit_2', 'audit_3', 'audit_1'])
+        self.assertGreaterEqual(timings[2][1], 0.3)
+
+    def test_jobs_in_flight_are_limited(self):
+        audit_ids = ['audit_{0}'.format(index) for index in range(6)]
+        sc_client = FakeExportClient(dict((audit_id, 0.05) for audit_id in audit_ids))
+        exports = dict(sc_client.get_exports(audit_ids, max_jobs_in_flight=2))
+        self.assertEqual(sorted(exports.keys()), audit_ids)
+        self.assertEqual(sc_client.max_jobs_seen_in_flight, 2)
+
+    def test_failed_export_does_not_affect_the_others(self):
+        sc_client = FakeExportClient({'audit_1': 0.0, 'audit_2': 0.0}, failing_audit_ids=['audit_1'])
+        exports = dict(sc_client.get_exports(['audit_1', 'audit_2']))
+        self.assertEqual(exports, {'audit_1': None, 'audit_2': b'audit_2'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'safetypy'))
+import safetypy as sp
+
+VALID_TOKEN = '032d09de1ef9c43eb77f56da82ae23588d1564b9fa6f6f59e9a1849191ef1214'
+
+
+class DownloadHandler(BaseHTTPRequestHandler):
+    """
+    Serves the body set on the server, announcing content_length bytes. Honours Range requests whose If-Range
+    matches the ETag of the server, and drops the connection after drop_after bytes while drops are left.
+    """
+
+    def do_GET(self):
+        server = self.server
+        server.ranges.append(self.headers.get('Range'))
+        offset = 0
+        if self.headers.get('Range') and self.headers.get('If-Range') == server.etag:
+            offset = int(self.headers['Range'][len('bytes='):-1])
+        body = server.body[offset:]
+        self.send_response(206 if offset else server.status)
+        if offset:
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(offset, len(server.body) - 1,
+                                                                       len(server.body)))
+        if server.etag is not None:
+            self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(server.content_length - offset))
+        self.end_headers()
+        if server.drops:
+            server.drops -= 1
+            self.wfile.write(body[:server.drop_after])
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'report.pdf')
+        self.server = HTTPServer(('127.0.0.1', 0), DownloadHandler)
+        self.server.status = 200
+        self.server.body = b'%PDF' + b'0' * (3 * sp.DOWNLOAD_CHUNK_SIZE_IN_BYTES)
+        self.server.content_length = len(self.server.body)
+        self.server.etag = None
+        self.server.drops = 0
+        self.server.drop_after = sp.DOWNLOAD_CHUNK_SIZE_IN_BYTES
+        self.server.ranges = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:{0}/report'.format(self.server.server_address[1])
+        self.sc_client = sp.SafetyCulture(VALID_TOKEN, max_retries=0)
+        self.sc_client.backoff_base_in_seconds = 0.01
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_download_replaces_the_existing_file(self):
+        with open(self.path, 'wb') as existing_file:
+            existing_file.write(b'old report')
+        self.assertEqual(self.sc_client.download_to_file(self.url, self.path, fsync=True), len(self.server.body))
+        with open(self.path, 'rb') as report_file:
+            self.assertEqual(report_file.read(), self.server.body)
+        self.assertEqual(os.listdir(self.temp_dir), ['report.pdf'])
+
+    def test_truncated_download_leaves_no_file(self):
+        self.server.content_length = len(self.server.body) + 10
+        self.assertIsNone(self.sc_client.download_to_file(self.url, self.path))
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_error_response_is_not_saved(self):
+        self.server.status = 404
+        self.assertIsNone(self.sc_client.download_to_file(self.url, self.path))
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def assert_downloaded(self):
+        with open(self.path, 'rb') as report_file:
+            self.assertEqual(report_file.read(), self.server.body)
+        self.assertEqual(os.listdir(self.temp_dir), ['report.pdf'])
+
+    def test_dropped_download_is_resumed_from_where_it_stopped(self):
+        self.server.etag = '"report-1"'
+        self.server.drops = 2
+        self.sc_client.max_retries = 2
+        self.assertEqual(self.sc_client.download_to_file(self.url, self.path), len(self.server.body))
+        self.assert_downloaded()
+        chunk_size = sp.DOWNLOAD_CHUNK_SIZE_IN_BYTES
+        self.assertEqual(self.server.ranges, [None, 'bytes={0}-'.format(chunk_size),
+                                              'bytes={0}-'.format(2 * chunk_size)])
+
+    def test_partial_download_is_kept_and_resumed_by_the_next_download(self):
+        self.server.etag = '"report-1"'
+        self.server.drops = 1
+        self.assertIsNone(self.sc_client.download_to_file(self.url, self.path))
+        self.assertEqual(os.path.getsize(self.path + sp.PARTIAL_DOWNLOAD_SUFFIX), self.server.drop_after)
+        self.assertEqual(self.sc_client.download_to_file(self.url, self.path), len(self.server.body))
+        self.assert_downloaded()
+
+    def test_partial_download_of_a_changed_file_starts_again(self):
+        self.server.etag = '"report-1"'
+        self.server.drops = 1
+        self.sc_client.download_to_file(self.url, self.path)
+        self.server.etag = '"report-2"'
+        self.server.body = b'%PDF' + b'1' * (2 * sp.DOWNLOAD_CHUNK_SIZE_IN_BYTES)
+        self.server.content_length = len(self.server.body)
+        self.assertEqual(self.sc_client.download_to_file(self.url, self.path), len(self.server.body))
+        self.assert_downloaded()
+
+    def test_download_without_validator_starts_again(self):
+        self.server.drops = 1
+        self.sc_client.max_retries = 1
+        self.assertEqual(self.sc_client.download_to_file(self.url, self.path), len(self.server.body))
+        self.assert_downloaded()
+        self.assertEqual(self.server.ranges, [None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
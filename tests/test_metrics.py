@@ -0,0 +1,82 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+import os
+import sys
+import unittest
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'safetypy'))
+import metrics
+
+API_URL = 'https://api.safetyculture.io/'
+
+
+class RequestMetricsTestCase(unittest.TestCase):
+
+    def test_classify_endpoint(self):
+        expected_classes = {
+            'audits/search?field=audit_id': 'audits',
+            'audits/audit_1': 'audits',
+            'audits/audit_1/report': 'report',
+            'audits/audit_1/report/job_1': 'report',
+            'audits/audit_1/web_report_link': 'report',
+            'audits/audit_1/media/media_1': 'media',
+            'actions/search': 'actions',
+            'groups/role_1/users': 'users',
+            'share/connections': 'users',
+            'templates/search?field=template_id': 'templates',
+            'response_sets/responseset_1': 'response_sets',
+            'auth': 'other'
+        }
+        for path, endpoint in expected_classes.items():
+            self.assertEqual(metrics.classify_endpoint(API_URL + path), endpoint, msg=path)
+
+    def test_record_aggregates_per_endpoint(self):
+        request_metrics = metrics.RequestMetrics(buckets=(0.1, 1))
+        request_metrics('GET', API_URL + 'audits/audit_1', 200, 0.05, 100)
+        request_metrics('GET', API_URL + 'audits/audit_2', 429, 0.5, 10)
+        request_metrics('GET', API_URL + 'audits/audit_2', None, 5, 0)
+        snapshot = request_metrics.snapshot()
+        self.assertEqual(list(snapshot.keys()), ['audits'])
+        self.assertEqual(snapshot['audits']['count'], 3)
+        self.assertEqual(snapshot['audits']['bytes_received'], 110)
+        self.assertEqual(snapshot['audits']['status_codes'], {'200': 1, '429': 1, 'error': 1})
+        self.assertEqual(snapshot['audits']['latency_buckets'], {0.1: 1, 1: 1})
+
+    def test_callback_receives_endpoint_class(self):
+        calls = []
+        request_metrics = metrics.RequestMetrics(callback=lambda *args: calls.append(args))
+        request_metrics('POST', API_URL + 'actions/search', 200, 0.2, 5)
+        self.assertEqual(calls, [('actions', 'POST', API_URL + 'actions/search', 200, 0.2, 5)])
+
+    def test_prometheus_exporter_serves_histogram(self):
+        request_metrics = metrics.RequestMetrics(buckets=(0.1, 1))
+        request_metrics('GET', API_URL + 'audits/audit_1/media/media_1', 200, 0.5, 2048)
+        server = metrics.start_prometheus_exporter(request_metrics, 0)
+        try:
+            text = urlopen('http://127.0.0.1:{0}/metrics'.format(server.server_address[1])).read().decode('utf-8')
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn('safetyculture_api_requests_total{endpoint="media",status="200"} 1', text)
+        self.assertIn('safetyculture_api_response_bytes_total{endpoint="media"} 2048', text)
+        self.assertIn('safetyculture_api_request_duration_seconds_bucket{endpoint="media",le="0.1"} 0', text)
+        self.assertIn('safetyculture_api_request_duration_seconds_bucket{endpoint="media",le="1"} 1', text)
+        self.assertIn('safetyculture_api_request_duration_seconds_count{endpoint="media"} 1', text)
+
+    def test_labelled_metrics_share_one_exposition(self):
+        acme_metrics = metrics.RequestMetrics(labels={'tenant': 'acme'})
+        other_metrics = metrics.RequestMetrics(labels={'tenant': 'other "org"'})
+        acme_metrics('GET', API_URL + 'audits/audit_1', 200, 0.5, 10)
+        other_metrics('GET', API_URL + 'audits/audit_2', 200, 0.5, 20)
+        text = metrics.format_prometheus_text([acme_metrics, other_metrics])
+        self.assertEqual(text.count('# TYPE safetyculture_api_requests_total counter'), 1)
+        self.assertIn('safetyculture_api_requests_total{tenant="acme",endpoint="audits",status="200"} 1', text)
+        self.assertIn('safetyculture_api_response_bytes_total{tenant="other \\"org\\"",endpoint="audits"} 20', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
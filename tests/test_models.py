@@ -0,0 +1,70 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from safetypy import models
+
+AUDIT_JSON = {
+    'audit_id': 'audit_1',
+    'template_id': 'template_1',
+    'audit_data': {'name': 'Site inspection'},
+    'header_items': [
+        {'item_id': 'title', 'type': 'textsingle', 'responses': {'text': 'Site inspection'}},
+        {'item_id': 'signature', 'type': 'signature', 'responses': {'image': {'media_id': 'media_3'}}}
+    ],
+    'items': [
+        {'item_id': 'section', 'type': 'section', 'label': 'Section'},
+        {'item_id': 'question', 'type': 'question', 'parent_id': 'section',
+         'media': [{'media_id': 'media_1'}, {'media_id': 'media_2'}]},
+        {'item_id': 'information', 'type': 'information', 'parent_id': 'section',
+         'options': {'media': {'media_id': 'media_4'}}},
+        {'item_id': 'question', 'type': 'question', 'label': 'Duplicate'}
+    ]
+}
+
+
+class AuditTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.audit = models.Audit(AUDIT_JSON)
+
+    def test_items_wrap_the_audit_json_header_items_first(self):
+        self.assertEqual([item.item_id for item in self.audit.items],
+                         ['title', 'signature', 'section', 'question', 'information', 'question'])
+        self.assertEqual([item.is_header for item in self.audit.items], [True, True, False, False, False, False])
+        self.assertIs(self.audit.items[0].data, AUDIT_JSON['header_items'][0])
+
+    def test_indexes_are_built_on_first_use(self):
+        audit = models.Audit(AUDIT_JSON)
+        self.assertEqual(audit.header_item_by_id['title'].responses['text'], 'Site inspection')
+        self.assertIsNone(audit._items)
+        self.assertIsNone(audit._item_by_id)
+
+    def test_first_item_keeps_a_duplicate_id(self):
+        self.assertIsNone(self.audit.item_by_id['question'].label)
+        self.assertEqual(self.audit.item_by_id['information'].parent_id, 'section')
+
+    def test_items_by_type(self):
+        self.assertEqual([item.label for item in self.audit.items_by_type['question']], [None, 'Duplicate'])
+        self.assertEqual(list(self.audit.header_items_by_type), ['textsingle', 'signature'])
+
+    def test_media_ids_in_audit_order(self):
+        self.assertEqual(self.audit.media_ids, ['media_3', 'media_1', 'media_2', 'media_4'])
+
+    def test_missing_properties(self):
+        audit = models.Audit({'audit_id': 'audit_2'})
+        self.assertEqual(audit.items, [])
+        self.assertEqual(audit.media_ids, [])
+        self.assertIsNone(audit.name)
+        self.assertEqual(models.Item({}).responses, {})
+
+    def test_views_have_no_instance_dictionary(self):
+        self.assertFalse(hasattr(self.audit, '__dict__'))
+        self.assertFalse(hasattr(self.audit.items[0], '__dict__'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'safetypy'))
+import safetypy as sp
+
+VALID_TOKEN = '032d09de1ef9c43eb77f56da82ae23588d1564b9fa6f6f59e9a1849191ef1214'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Replies with the status codes queued on the server, then with 200 and a small JSON body
+    """
+
+    def reply(self):
+        self.server.requests.append((self.command, self.path))
+        status, headers = self.server.responses.pop(0) if self.server.responses else (200, {})
+        body = json.dumps({'audit_id': 'audit_1', 'template_id': 'template_1'}).encode('utf-8')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = reply
+    do_POST = reply
+
+    def log_message(self, *args):
+        pass
+
+
+class RetryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.responses = []
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        api_url = 'http://127.0.0.1:{0}/'.format(self.server.server_address[1])
+        self.sc_client = sp.SafetyCulture(VALID_TOKEN, api_url=api_url, max_retries=3,
+                                          rate_limiter=sp.RateLimiter(requests_per_second=1000,
+                                                                      max_requests_per_second=1000))
+        self.sc_client.backoff_base_in_seconds = 0.01
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_429_and_503_are_retried_until_success(self):
+        self.server.responses = [(429, {}), (503, {}), (429, {})]
+        audit = self.sc_client.get_audit('audit_1')
+        self.assertEqual(audit['template_id'], 'template_1')
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.responses = [(503, {})] * 10
+        self.assertIsNone(self.sc_client.get_audit('audit_1'))
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_post_is_not_retried_on_500(self):
+        self.server.responses = [(500, {})]
+        self.assertIsNone(self.sc_client.get_export_job_id('audit_1'))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_post_is_retried_on_429(self):
+        self.server.responses = [(429, {})]
+        self.assertIsNotNone(self.sc_client.get_export_job_id('audit_1'))
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_retry_after_is_honoured(self):
+        self.server.responses = [(429, {'Retry-After': '0.3'})]
+        start = time.time()
+        self.assertIsNotNone(self.sc_client.get_audit('audit_1'))
+        self.assertGreaterEqual(time.time() - start, 0.3)
+
+    def test_request_hook_sees_every_attempt(self):
+        attempts = []
+        self.sc_client.request_hook = lambda method, url, status, elapsed, size: attempts.append((method, status))
+        self.server.responses = [(503, {})]
+        self.sc_client.get_audit('audit_1')
+        self.assertEqual(attempts, [('GET', 503), ('GET', 200)])
+
+    def test_429_cuts_the_request_rate(self):
+        rate_before = self.sc_client.rate_limiter.rate
+        self.server.responses = [(429, {})]
+        self.sc_client.get_audit('audit_1')
+        self.assertLess(self.sc_client.rate_limiter.rate, rate_before)
+
+
+class RateLimiterTestCase(unittest.TestCase):
+
+    def test_parse_retry_after(self):
+        self.assertEqual(sp.parse_retry_after('2'), 2.0)
+        self.assertEqual(sp.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+        self.assertIsNone(sp.parse_retry_after(None))
+        self.assertIsNone(sp.parse_retry_after('soon'))
+
+    def test_rate_stays_within_bounds(self):
+        rate_limiter = sp.RateLimiter(requests_per_second=2, min_requests_per_second=1, max_requests_per_second=4)
+        for _ in range(10):
+            rate_limiter.on_throttled()
+        self.assertEqual(rate_limiter.rate, 1)
+        for _ in range(100):
+            rate_limiter.on_success()
+        self.assertEqual(rate_limiter.rate, 4)
+
+    def test_acquire_is_limited_to_the_rate(self):
+        rate_limiter = sp.RateLimiter(requests_per_second=20, max_requests_per_second=20)
+        start = time.time()
+        for _ in range(11):
+            rate_limiter.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.45)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'safetypy'))
+import safetypy as sp
+
+
+class FakeClient:
+
+    def __init__(self):
+        self.templates = [{'template_id': 'template_1', 'name': 'Template 1', 'modified_at': '2018-01-01'}]
+        self.requests = []
+
+    def discover_templates(self):
+        self.requests.append('templates')
+        return {'count': len(self.templates), 'total': len(self.templates), 'templates': self.templates}
+
+    def get_preference_ids(self, template_id=None):
+        self.requests.append(('preferences', template_id))
+        return {'preferences': [{'id': 'preference_1', 'template_id': template_id}]}
+
+
+class TemplateCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sc_client = FakeClient()
+
+    def test_repeated_lookups_send_no_requests(self):
+        cache = sp.TemplateCache(self.sc_client, ttl_in_seconds=60)
+        for _ in range(3):
+            self.assertEqual(cache.get_template('template_1')['name'], 'Template 1')
+            self.assertEqual(cache.get_preferences('template_1')['preferences'][0]['id'], 'preference_1')
+            cache.get_preferences()
+        self.assertEqual(self.sc_client.requests, ['templates', ('preferences', 'template_1'), ('preferences', None)])
+
+    def test_preferences_are_kept_until_the_template_is_modified(self):
+        cache = sp.TemplateCache(self.sc_client, ttl_in_seconds=0)
+        cache.get_templates()
+        cache.get_preferences('template_1')
+        cache.get_templates()
+        cache.get_preferences('template_1')
+        self.assertEqual(self.sc_client.requests.count(('preferences', 'template_1')), 1)
+
+        self.sc_client.templates = [dict(self.sc_client.templates[0], modified_at='2018-02-01')]
+        cache.get_templates()
+        cache.get_preferences('template_1')
+        self.assertEqual(self.sc_client.requests.count(('preferences', 'template_1')), 2)
+
+    def test_preferences_lookup_does_not_discover_templates(self):
+        cache = sp.TemplateCache(self.sc_client, ttl_in_seconds=60)
+        cache.get_preferences('template_1')
+        cache.get_preferences('template_1')
+        self.assertEqual(self.sc_client.requests, [('preferences', 'template_1')])
+
+    def test_preferences_of_templates_missing_from_the_template_list_expire(self):
+        cache = sp.TemplateCache(self.sc_client, ttl_in_seconds=0)
+        cache.get_preferences('template_1')
+        cache.get_preferences('template_1')
+        self.assertEqual(self.sc_client.requests, [('preferences', 'template_1'), ('preferences', 'template_1')])
+
+    def test_invalidate_drops_cached_templates(self):
+        cache = sp.TemplateCache(self.sc_client, ttl_in_seconds=60)
+        cache.get_templates()
+        cache.invalidate()
+        cache.get_templates()
+        self.assertEqual(self.sc_client.requests, ['templates', 'templates'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,15 +2,24 @@ import argparse
 import logging
 import os
 import sys
-reload(sys)
-sys.setdefaultencoding('utf-8')
+if sys.version_info[0] < 3:
+    reload(sys)
+    sys.setdefaultencoding('utf-8')
 import json
 import csv
+import gzip
+import heapq
+import io
+import itertools
+import tempfile
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 from safetypy import safetypy as sp
 from collections import OrderedDict
-import pydash
-from pydash import _
 
 # the file that stores all exported users in CSV format
 USER_EXPORT_FILENAME = 'iauditor_users.csv'
@@ -18,77 +27,180 @@ USER_EXPORT_FILENAME = 'iauditor_users.csv'
 # Possible values here are DEBUG, INFO, WARN, ERROR and CRITICAL
 LOG_LEVEL = logging.DEBUG
 
-def get_all_users_and_groups(api_token):
+# Groups whose users are fetched at the same time
+MAX_GROUP_REQUESTS_IN_FLIGHT = 8
+
+# Users sorted in memory at a time when sorting the export, larger exports are merged from sorted temporary files
+EXTERNAL_SORT_CHUNK_SIZE = 50000
+
+def get_all_users_and_groups(api_token=None, sc_client=None, max_requests_in_flight=MAX_GROUP_REQUESTS_IN_FLIGHT,
+                             group_ids=None):
     """
     Exports a dictionary of all active users from iAuditor organisation and their associated groups
+    :param api_token:               API token used to create a client when sc_client is not given
+    :param sc_client:               instance of safetypy.SafetyCulture class to reuse
+    :param max_requests_in_flight:  number of groups whose users are fetched at the same time
+    :param group_ids:               IDs of the only groups to fetch the users of, all groups if None
     :return: A sorted dictionary of all active users and their associated groups
     """
-    sc_client = sp.SafetyCulture(api_token)
+    if sc_client is None:
+        sc_client = sp.SafetyCulture(api_token)
+    users = iter_users_and_groups(sc_client, max_requests_in_flight, group_ids)
+    return OrderedDict(sorted(users, key=lambda t: t[0]))
+
+def iter_users_and_groups(sc_client, max_requests_in_flight=MAX_GROUP_REQUESTS_IN_FLIGHT, group_ids=None):
+    """
+    Yields every active user of the organisation with their associated groups, in the order of the user listing.
+    Memberships are kept as group indexes until each user is yielded, so that large organisations fit in memory.
+    :param sc_client:               instance of safetypy.SafetyCulture class
+    :param max_requests_in_flight:  number of groups whose users are fetched at the same time
+    :param group_ids:               IDs of the only groups to fetch the users of, all groups if None
+    :return: generator of (email, user) tuples, groups of the user holding the name and ID of every group
+    """
     org_id = sc_client.get_my_org()
-    groups_list = []
-    user_map = {}
+    all_group_details = json.loads(sc_client.get_all_groups_in_org().content)
+    groups = [group for group in all_group_details['groups'] if group_ids is None or group['id'] in group_ids]
+    group_indexes = dict((group['id'], index) for index, group in enumerate(groups))
+
+    memberships = {}
+    for group_id, users_in_group in get_users_of_groups(sc_client, list(group_indexes.keys()),
+                                                        max_requests_in_flight):
+        for user in users_in_group['users']:
+            if user['status'] == 'active':
+                memberships.setdefault(user['email'], []).append(group_indexes[group_id])
 
     users_of_org = json.loads(sc_client.get_users_of_group(org_id))
     for user in users_of_org['users']:
         if user['status'] != 'active':
             continue
-        email = user['email']
-        user_map[email] = {'groups': [], 'firstname': user['firstname'], 'lastname': user['lastname'], 'user_id': user['user_id']}
+        user_groups = []
+        for index in sorted(memberships.pop(user['email'], [])):
+            group_name = str(groups[index]['name'])
+            if group_name not in user_groups[0::2]:
+                user_groups += [group_name, str(groups[index]['id'])]
+        yield user['email'], {'groups': user_groups, 'firstname': user['firstname'], 'lastname': user['lastname'],
+                              'user_id': user['user_id']}
 
-    all_group_details = json.loads(sc_client.get_all_groups_in_org().content)
-    groups_list = [g['id'] for g in all_group_details['groups']]
+def get_users_of_groups(sc_client, group_ids, max_requests_in_flight=MAX_GROUP_REQUESTS_IN_FLIGHT):
+    """
+    Fetches the users of several groups, up to max_requests_in_flight groups at a time
+    :param sc_client: instance of safetypy.SafetyCulture class
+    :param group_ids: IDs of the groups
+    :param max_requests_in_flight: number of groups whose users are fetched at the same time
+    :return: generator of (group ID, users of the group) tuples in the order the requests finish
+    """
+    pending_group_ids = queue.Queue()
+    for group_id in group_ids:
+        pending_group_ids.put(group_id)
+    finished_groups = queue.Queue()
 
-    for group_id in groups_list:
-        users_in_group = json.loads(sc_client.get_users_of_group(group_id))
-        groups = all_group_details['groups']
-        target_group = _.find(groups, {'id': group_id})
-        group_name = target_group['name']
+    def fetch_users_of_groups():
+        while True:
+            try:
+                group_id = pending_group_ids.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                finished_groups.put((group_id, json.loads(sc_client.get_users_of_group(group_id)), None))
+            except Exception as ex:
+                finished_groups.put((group_id, None, ex))
 
-        for user in users_in_group['users']:
-            if user['status'] != 'active':
-                continue
-            email = user['email']
-            user_map[email]['user_id'] = user['user_id']
-            if email in user_map:
-                if group_name not in user_map[email]['groups']:
-                    user_map[email]['groups'].append(str(group_name))
-                    user_map[email]['groups'].append(str(group_id))
-
-            else:
-                user_map[email]['groups'] = [group_name]
-                user_map[email]['groups'] = [group_name]
-
-    sorted_user_map = OrderedDict(sorted(user_map.items(), key=lambda t: t[0]))
-    return sorted_user_map
-
-def save_users_and_groups_to_csv(user_data, csv_output_filepath):
+    for _ in range(min(max_requests_in_flight, len(group_ids))):
+        worker = threading.Thread(target=fetch_users_of_groups)
+        worker.daemon = True
+        worker.start()
+    for _ in range(len(group_ids)):
+        group_id, users_in_group, error = finished_groups.get()
+        if error is not None:
+            raise error
+        yield group_id, users_in_group
+
+def sort_users_externally(users, chunk_size=EXTERNAL_SORT_CHUNK_SIZE):
+    """
+    Sorts users by email, holding no more than chunk_size users in memory. Sorted chunks are written to temporary
+    files and merged.
+    :param users: iterable of (email, user) tuples
+    :param chunk_size: number of users sorted in memory at a time
+    :return: generator of the (email, user) tuples sorted by email
+    """
+    chunk_files = []
+    users = iter(users)
+    while True:
+        chunk = sorted(itertools.islice(users, chunk_size), key=lambda t: t[0])
+        if not chunk:
+            break
+        chunk_file = tempfile.TemporaryFile(mode='w+')
+        for email, user in chunk:
+            chunk_file.write(json.dumps([email, user]) + '\n')
+        chunk_file.seek(0)
+        chunk_files.append(chunk_file)
+
+    def read_chunk(chunk_index, chunk_file):
+        for line_index, line in enumerate(chunk_file):
+            email, user = json.loads(line)
+            yield email, chunk_index, line_index, user
+
+    try:
+        for email, _, _, user in heapq.merge(*[read_chunk(index, chunk_file)
+                                               for index, chunk_file in enumerate(chunk_files)]):
+            yield email, user
+    finally:
+        for chunk_file in chunk_files:
+            chunk_file.close()
+
+def open_csv_output_file(path, compress=False):
     """
-    Creates a CSV file with exported user data
-    :param user_data: The exported user data
+    Opens a file for the csv writer of the running Python version, gzip compressed if compress is True
+    :param path: path of the file
+    :param compress: if True, compress the file with gzip
+    :return: file object
+    """
+    output_file = gzip.open(path, 'wb') if compress else open(path, 'wb')
+    if sys.version_info[0] < 3:
+        return output_file
+    return io.TextIOWrapper(output_file, encoding='utf-8', newline='')
+
+def save_users_and_groups_to_csv(user_data, csv_output_filepath, compress=False):
+    """
+    Creates a CSV file with exported user data, writing users as they are read
+    :param user_data: The exported user data, a dictionary of users by email or an iterable of (email, user) tuples
     :param csv_output_filepath: The output file to save
-    :return: None
+    :param compress: if True, compress the file with gzip
+    :return: number of users written
     """
+    if isinstance(user_data, dict):
+        user_data = sorted(user_data.items())
     full_output_path = os.path.join(os.getcwd(), csv_output_filepath)
-    with open(full_output_path, 'wb') as f:
+    user_count = 0
+    with open_csv_output_file(full_output_path, compress) as f:
         fields = ['email', 'lastname', 'firstname', 'groups']
         w = csv.DictWriter(f, fields)
         w.writeheader()
-        for key, val in sorted(user_data.items()):
-            val['groups'] = ", ".join(val['groups'][0::2])
-            row = {'email': key}
-            row.update(val)
-            w.writerow(row)
+        for key, val in user_data:
+            w.writerow({'email': key, 'lastname': val['lastname'], 'firstname': val['firstname'],
+                        'groups': ", ".join(val['groups'][0::2])})
+            user_count += 1
+    return user_count
 
 
-if __name__ == '__main__':
+def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-t', '--token', required=True)
+    parser.add_argument('-o', '--output', default=USER_EXPORT_FILENAME, help='file to save the users to')
+    parser.add_argument('--gzip', action='store_true', help='compress the output file with gzip')
+    parser.add_argument('--unsorted', action='store_true',
+                        help='write users in the order they are listed instead of sorting them by email')
     args = parser.parse_args()
-    api_token = args.token
 
-    exported_users = get_all_users_and_groups(api_token)
-    for user in exported_users:
-        # removing the user ID to keep the CSV output user-friendly
-        del exported_users[user]['user_id']
-    save_users_and_groups_to_csv(exported_users, csv_output_filepath=USER_EXPORT_FILENAME)
+    sc_client = sp.SafetyCulture(args.token)
+    exported_users = iter_users_and_groups(sc_client)
+    if not args.unsorted:
+        exported_users = sort_users_externally(exported_users)
+    output_filepath = args.output
+    if args.gzip and not output_filepath.endswith('.gz'):
+        output_filepath += '.gz'
+    save_users_and_groups_to_csv(exported_users, output_filepath, compress=args.gzip)
+
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import export_users as eu
+
+
+def user(lastname, *groups):
+    memberships = []
+    for group in groups:
+        memberships += [group, 'role_' + group]
+    return {'firstname': 'First', 'lastname': lastname, 'user_id': 'user_' + lastname, 'groups': memberships}
+
+
+class GroupsResponse:
+
+    def __init__(self, groups):
+        self.content = json.dumps({'groups': groups})
+
+
+class FakeOrganisation:
+    """
+    Serves the users of an organisation and of its groups
+    """
+
+    def __init__(self, users, groups):
+        """
+        :param users:   list of (email, status, list of group IDs) tuples, in the order of the user listing
+        :param groups:  list of group dictionaries with a name and an id
+        """
+        self.users = users
+        self.groups = groups
+
+    def get_my_org(self):
+        return 'organisation'
+
+    def get_all_groups_in_org(self):
+        return GroupsResponse(self.groups)
+
+    def get_users_of_group(self, group_id):
+        return json.dumps({'users': [{'email': email, 'status': status, 'firstname': 'First', 'lastname': email,
+                                      'user_id': 'user_' + email}
+                                     for email, status, group_ids in self.users
+                                     if group_id == 'organisation' or group_id in group_ids]})
+
+
+class IterUsersAndGroupsTestCase(unittest.TestCase):
+
+    def test_active_users_are_yielded_in_listing_order_with_their_groups(self):
+        sc_client = FakeOrganisation([('b@example.com', 'active', ['role_2', 'role_1']),
+                                      ('c@example.com', 'inactive', ['role_1']),
+                                      ('a@example.com', 'active', [])],
+                                     [{'name': 'Group 1', 'id': 'role_1'}, {'name': 'Group 2', 'id': 'role_2'}])
+        users = list(eu.iter_users_and_groups(sc_client, max_requests_in_flight=2))
+        self.assertEqual([email for email, _ in users], ['b@example.com', 'a@example.com'])
+        self.assertEqual(users[0][1]['groups'], ['Group 1', 'role_1', 'Group 2', 'role_2'])
+        self.assertEqual(users[1][1]['groups'], [])
+
+    def test_groups_sharing_a_name_are_listed_once(self):
+        sc_client = FakeOrganisation([('a@example.com', 'active', ['role_1', 'role_2'])],
+                                     [{'name': 'Group', 'id': 'role_1'}, {'name': 'Group', 'id': 'role_2'}])
+        self.assertEqual(eu.get_all_users_and_groups(sc_client=sc_client)['a@example.com']['groups'],
+                         ['Group', 'role_1'])
+
+
+class SortUsersExternallyTestCase(unittest.TestCase):
+
+    def test_users_are_merged_across_chunks(self):
+        emails = ['g@example.com', 'c@example.com', 'e@example.com', 'a@example.com', 'f@example.com',
+                  'b@example.com', 'd@example.com']
+        users = [(email, user(email)) for email in emails]
+        self.assertEqual(list(eu.sort_users_externally(iter(users), chunk_size=2)), sorted(users))
+
+    def test_users_fitting_in_one_chunk_or_none(self):
+        users = [('b@example.com', user('b')), ('a@example.com', user('a'))]
+        self.assertEqual(list(eu.sort_users_externally(users, chunk_size=10)), sorted(users))
+        self.assertEqual(list(eu.sort_users_externally([], chunk_size=2)), [])
+
+
+@unittest.skipIf(sys.version_info[0] < 3, 'csv reads bytes on Python 2')
+class SaveUsersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.users = {'b@example.com': user('Bé', 'Group A', 'Group B'), 'a@example.com': user('A')}
+        self.expected_rows = [['email', 'lastname', 'firstname', 'groups'],
+                              ['a@example.com', 'A', 'First', ''],
+                              ['b@example.com', 'Bé', 'First', 'Group A, Group B']]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_users_are_written_sorted_by_email(self):
+        path = os.path.join(self.temp_dir, 'users.csv')
+        self.assertEqual(eu.save_users_and_groups_to_csv(self.users, path), 2)
+        with io.open(path, encoding='utf-8', newline='') as csv_file:
+            self.assertEqual(list(csv.reader(csv_file)), self.expected_rows)
+
+    def test_compressed_file_is_a_gzip_csv(self):
+        path = os.path.join(self.temp_dir, 'users.csv.gz')
+        self.assertEqual(eu.save_users_and_groups_to_csv(iter(sorted(self.users.items())), path, compress=True), 2)
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as csv_file:
+            self.assertEqual(list(csv.reader(csv_file)), self.expected_rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
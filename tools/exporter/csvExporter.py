@@ -1,10 +1,12 @@
-import unicodecsv as csv
+import argparse
 import json
 import logging
 import sys
 import os
 import copy
 from datetime import datetime
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from safetypy import models
 
 CSV_HEADER_ROW = [
     'ItemType',
@@ -49,6 +51,9 @@ CSV_HEADER_ROW = [
     'AuditRegion'
 ]
 
+# column of the item category, the only common audit data column that depends on the item
+ITEM_CATEGORY_COLUMN = CSV_HEADER_ROW.index('ItemCategory')
+
 # audit item empty response 
 EMPTY_RESPONSE = ''
 
@@ -140,6 +145,9 @@ header_field_id = {
     'ClientSite': 'f3245d41-ea77-11e1-aff1-0800200c9a66'
 }
 
+# Responses holding the answer of a standard header item, in the order they are looked up
+HEADER_RESPONSE_TYPES = ['text', 'datetime', 'location_text']
+
 
 def get_json_property(obj, *args):
     """
@@ -177,6 +185,7 @@ class CsvExporter:
         """
         self.configure_logging()
         self.audit_json = audit_json
+        self.audit = models.Audit(audit_json)
         self.export_inactive_items = export_inactive_items
         self.item_category = EMPTY_RESPONSE
         self.item_map = {}
@@ -191,10 +200,13 @@ class CsvExporter:
 
         log_filename = datetime.now().strftime('%Y-%m-%d') + '.log'
         csvExporter_logger = logging.getLogger('csvExporter_logger')
+        # every CsvExporter shares csvExporter_logger, only the first one configures it
+        if csvExporter_logger.handlers:
+            return
         csvExporter_logger.setLevel(log_level)
         formatter = logging.Formatter('%(asctime)s : %(levelname)s : %(message)s')
 
-        fh = logging.FileHandler(filename=os.getcwd() + log_filename)
+        fh = logging.FileHandler(filename=os.getcwd() + log_filename, delay=True)
         fh.setLevel(log_level)
         fh.setFormatter(formatter)
         csvExporter_logger.addHandler(fh)
@@ -214,19 +226,19 @@ class CsvExporter:
         """
         :return:    All audit items, including header and non-header items
         """
-        return self.audit_json['header_items'] + self.audit_json['items']
+        return [item.data for item in self.audit.items]
 
     def map_items(self):
         """
         Creates a dictionary which maps each item to it's parent ID, Label, and Type.
         This tree can then be traversed recursively to find the Category or Section of a given item.
         """
-        for item in self.audit_items():
-            if item.get('item_id'):
-                self.item_map[item['item_id']] = {
-                    'parent_id': item.get('parent_id') or EMPTY_RESPONSE,
-                    'label': item.get('label') or EMPTY_RESPONSE,
-                    'type': item.get('type') or EMPTY_RESPONSE
+        for item in self.audit.items:
+            if item.item_id:
+                self.item_map[item.item_id] = {
+                    'parent_id': item.parent_id or EMPTY_RESPONSE,
+                    'label': item.label or EMPTY_RESPONSE,
+                    'type': item.type or EMPTY_RESPONSE
                 }
 
     def get_item_category(self, item_id):
@@ -261,7 +273,6 @@ class CsvExporter:
         audit_data_property = self.audit_json['audit_data']
         template_data_property = self.audit_json['template_data']
         audit_date_completed = audit_data_property['date_completed']
-        header_data = self.audit_json['header_items']
         audit_data_as_list = list()
         audit_data_as_list.append(audit_data_property['authorship']['owner'])
         audit_data_as_list.append(audit_data_property['authorship']['author'])
@@ -281,12 +292,12 @@ class CsvExporter:
             audit_data_as_list.append('Untitled Template')
         audit_data_as_list.append(template_data_property['authorship']['author'])
         audit_data_as_list.append(self.item_category)
-        audit_data_as_list.append(self.get_header_item(header_data, 'DocumentNo'))
-        audit_data_as_list.append(self.get_header_item(header_data, 'ConductedOn'))
-        audit_data_as_list.append(self.get_header_item(header_data, 'PreparedBy'))
-        audit_data_as_list.append(self.get_header_item(header_data, 'Location'))
-        audit_data_as_list.append(self.get_header_item(header_data, 'Personnel'))
-        audit_data_as_list.append(self.get_header_item(header_data, 'ClientSite'))
+        audit_data_as_list.append(self.get_header_item_response('DocumentNo'))
+        audit_data_as_list.append(self.get_header_item_response('ConductedOn'))
+        audit_data_as_list.append(self.get_header_item_response('PreparedBy'))
+        audit_data_as_list.append(self.get_header_item_response('Location'))
+        audit_data_as_list.append(self.get_header_item_response('Personnel'))
+        audit_data_as_list.append(self.get_header_item_response('ClientSite'))
         audit_data_as_list.append(get_json_property(audit_data_property, 'site', 'name'))
         audit_data_as_list.append(get_json_property(audit_data_property, 'site', 'area', 'name'))
         audit_data_as_list.append(get_json_property(audit_data_property, 'site', 'region', 'name'))
@@ -304,14 +315,22 @@ class CsvExporter:
             if item.get('item_id') == header_field_id.get(header_item_type):
                 if 'responses' not in item.keys():
                     return EMPTY_RESPONSE
-                if 'text' in item['responses'].keys():
-                    return get_json_property(item, 'responses', 'text')
-                if 'datetime' in item['responses'].keys():
-                    return get_json_property(item, 'responses', 'datetime')
-                if 'location_text' in item['responses'].keys():
-                    return get_json_property(item, 'responses', 'location_text')
+                for response_type in HEADER_RESPONSE_TYPES:
+                    if response_type in item['responses'].keys():
+                        return get_json_property(item, 'responses', response_type)
         return EMPTY_RESPONSE
 
+    def get_header_item_response(self, header_item_type):
+        """
+        Return standard header item response string, looked up in the header item index of the audit
+        :param header_item_type:    Header type whose response is to be returned
+        :return:    Header item response string
+        """
+        item = self.audit.header_item_by_id.get(header_field_id.get(header_item_type))
+        if item is None:
+            return EMPTY_RESPONSE
+        return self.get_header_item([item.data], header_item_type)
+
     @staticmethod
     def format_date_time(date):
         """
@@ -333,14 +352,18 @@ class CsvExporter:
         :return:    2 dimensional list, each list is a single item, which corresponds to a single row
         """
         self.audit_table = []
-        for item in self.audit_items():
+        # Only the item category of the common audit data changes from an item to the next
+        common_audit_data = self.common_audit_data()
+        for audit_item in self.audit.items:
+            item = audit_item.data
+            if get_json_property(item, INACTIVE) and not self.export_inactive_items:
+                continue
             if item.get('parent_id'):
                 self.item_category = self.get_item_category(item['parent_id'])
             else:
                 self.item_category = EMPTY_RESPONSE
-            row_array = self.item_properties_as_list(item) + self.common_audit_data()
-            if get_json_property(item, INACTIVE) and not self.export_inactive_items:
-                continue
+            row_array = self.item_properties_as_list(item) + common_audit_data
+            row_array[ITEM_CATEGORY_COLUMN] = self.item_category
             self.audit_table.append(row_array)
         return self.audit_table
 
@@ -376,6 +399,7 @@ class CsvExporter:
         :param output_csv_path: the full path to file to save
         :param mode:    write ('wb') or append ('ab') mode
         """
+        import unicodecsv as csv
         csvExporter_logger = logging.getLogger('csvExporter_logger')
         try:
             csv_file = open(output_csv_path, mode)
@@ -598,11 +622,32 @@ def main():
     """
     saves JSON file as CSV. Path to JSON file provided as command line argument
     """
-    for arg in sys.argv[1:]:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('json_files', nargs='+', help='audit JSON files to convert to CSV')
+    parser.add_argument('--profile', help='profile the conversion and write a pstats file, or a speedscope file if '
+                                          'the name ends with .speedscope.json (requires pyinstrument)')
+    parser.add_argument('--profile-sample-audits', type=int, help='only profile the conversion of this many audits')
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile is not None:
+        try:
+            from tools.exporter import profiling
+        except ImportError:
+            import profiling
+        profiler = profiling.Profiler(args.profile, args.profile_sample_audits or len(args.json_files))
+
+    for arg in args.json_files:
         audit_json = json.load(open(arg, 'r'))
-        csv_exporter = CsvExporter(audit_json)
+        if profiler is not None:
+            with profiler.sample():
+                csv_exporter = CsvExporter(audit_json)
+        else:
+            csv_exporter = CsvExporter(audit_json)
         csv_exporter.save_converted_audit_to_file(os.path.splitext(arg.split('/')[-1])[0] + '.csv',
                                                   allow_overwrite=True)
+    if profiler is not None and profiler.close():
+        print('Profile written to ' + args.profile)
     print('Exiting')
 
 
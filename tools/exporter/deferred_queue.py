@@ -0,0 +1,100 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import heapq
+import json
+import os
+
+
+class DeferredAuditQueue:
+    """
+    Audits that were discovered but not yet exported because they were modified too recently for their media to
+    have synced, ordered by the time they become eligible for export.
+
+    The queue is saved to a JSON file every time it changes, so the sync marker can move past deferred audits
+    without them being lost when the exporter stops.
+    """
+
+    def __init__(self, path):
+        """
+        :param path:  JSON file the queue is loaded from and saved to
+        """
+        self.path = path
+        self.entries = {}
+        self.heap = []
+        if os.path.isfile(path):
+            with open(path, 'r') as queue_file:
+                for entry in json.load(queue_file):
+                    self.entries[entry['audit_id']] = entry
+            self.heap = [(entry['eligible_at'], audit_id) for audit_id, entry in self.entries.items()]
+            heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, audit_id):
+        return audit_id in self.entries
+
+    def push(self, audit, eligible_at):
+        """
+        Add an audit to the queue, replacing any earlier entry for the same audit, and save the queue
+        :param audit:        audit search result with audit_id, modified_at and, if known, template_id
+        :param eligible_at:  POSIX timestamp at which the audit becomes eligible for export
+        """
+        entry = {'audit_id': audit['audit_id'], 'modified_at': audit['modified_at'], 'eligible_at': eligible_at}
+        if 'template_id' in audit:
+            entry['template_id'] = audit['template_id']
+        self.entries[entry['audit_id']] = entry
+        heapq.heappush(self.heap, (eligible_at, entry['audit_id']))
+        self.save()
+
+    def discard(self, audit_ids):
+        """
+        Remove audits from the queue, e.g. because they have been discovered again after a later modification
+        :param audit_ids:  IDs of the audits to remove, IDs not in the queue are ignored
+        """
+        removed = [audit_id for audit_id in audit_ids if self.entries.pop(audit_id, None) is not None]
+        if removed:
+            self.save()
+
+    def pop_eligible(self, now):
+        """
+        Remove and return the audits that are eligible for export, earliest first
+        :param now:  current POSIX timestamp
+        :return:     list of audit dictionaries with audit_id, modified_at and, if known, template_id
+        """
+        eligible = []
+        while self.heap and self.heap[0][0] <= now:
+            eligible_at, audit_id = heapq.heappop(self.heap)
+            entry = self.entries.get(audit_id)
+            # skip heap entries of audits that were discarded or pushed again since
+            if entry is None or entry['eligible_at'] != eligible_at:
+                continue
+            del self.entries[audit_id]
+            eligible.append(dict((key, value) for key, value in entry.items() if key != 'eligible_at'))
+        if eligible:
+            self.save()
+        return eligible
+
+    def next_eligible_at(self):
+        """
+        :return:  POSIX timestamp at which the first audit in the queue becomes eligible, None if the queue is empty
+        """
+        if not self.entries:
+            return None
+        return min(entry['eligible_at'] for entry in self.entries.values())
+
+    def save(self):
+        """
+        Write the queue to its file, replacing the previous version atomically where the platform allows it
+        """
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as queue_file:
+            json.dump(sorted(self.entries.values(), key=lambda entry: entry['eligible_at']), queue_file)
+        if hasattr(os, 'replace'):
+            os.replace(temp_path, self.path)
+        else:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(temp_path, self.path)
@@ -12,17 +12,22 @@ import sys
 import time
 from datetime import datetime
 from datetime import timedelta
-import dateutil.parser
-import yaml
-import pytz
 import shutil
+import tempfile
+import threading
 # noinspection PyUnresolvedReferences
 from builtins import input
-from tzlocal import get_localzone
-import unicodecsv as csv
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 from safetypy import safetypy as sp
+from safetypy import metrics
+from safetypy import models
 from tools import csvExporter
+from tools.exporter import run_summary as rs
+from tools.exporter import profiling
+from tools.exporter import scheduler
+from tools.exporter import deferred_queue as dq
+from tools.exporter import tenants as tn
+from tools.exporter import sharding
 
 # Possible values here are DEBUG, INFO, WARN, ERROR and CRITICAL
 LOG_LEVEL = logging.DEBUG
@@ -39,12 +44,45 @@ DEFAULT_MEDIA_SYNC_OFFSET_IN_SECONDS = 600
 # The file that stores the "date modified" of the last successfully synced audit
 SYNC_MARKER_FILENAME = 'last_successful.txt'
 
+# The file that stores audits skipped because of the media sync offset, to be exported once they are eligible
+DEFERRED_AUDITS_FILENAME = 'deferred_audits.json'
+
 # The file that stores the ISO date/time string of the last successful actions export
 ACTIONS_SYNC_MARKER_FILENAME = 'last_successful_actions_export.txt'
 
 # the file that stores all exported actions in CSV format
 ACTIONS_EXPORT_FILENAME = 'iauditor_actions.csv'
 
+# Export formats produced by export jobs on the server, run for a batch of audits at a time
+DOCUMENT_EXPORT_FORMATS = ['pdf', 'docx']
+
+# Prefix of the hidden directory of the export path that a batch of PDF and Word exports is downloaded to, before
+# each export is moved to its export filename
+BATCH_DIRECTORY_PREFIX = '.export_batch_'
+
+# Export formats built from the audit JSON. Other formats only need the template ID returned by the audit search,
+# so the audit JSON is not downloaded when none of these is exported.
+AUDIT_JSON_EXPORT_FORMATS = ['json', 'csv', 'media', 'web-report-link']
+
+# Directory, relative to the state directory, holding the sync marker and deferred audits of every template stream
+TEMPLATE_STREAMS_DIRECTORY = 'templates'
+
+# Default directory, relative to the state directory, of the plan, markers and exports of a sharded export
+DEFAULT_SHARD_DIRECTORY = 'shards'
+
+# Seconds the coordinator of a sharded export waits between checks on shards leased by other nodes
+SHARD_POLL_INTERVAL_IN_SECONDS = 30
+
+# Number of configurations synced at the same time when the exporter is given several
+DEFAULT_MAX_CONCURRENT_TENANTS = 4
+
+# The file in the log directory that per-audit timings and the summary of every sync run are appended to
+RUN_SUMMARY_FILENAME = 'run_summary.jsonl'
+
+# Template streams export on separate threads into the same export path, so the check for an existing Web Report
+# links file and every write to it are made under this lock
+WEB_REPORT_LINKS_LOCK = threading.Lock()
+
 # Whether to export inactive items to CSV
 DEFAULT_EXPORT_INACTIVE_ITEMS_TO_CSV = True
 
@@ -63,8 +101,30 @@ FILENAME_ITEM_ID = 'filename_item_id'
 SYNC_DELAY_IN_SECONDS = 'sync_delay_in_seconds'
 EXPORT_INACTIVE_ITEMS_TO_CSV = 'export_inactive_items_to_csv'
 MEDIA_SYNC_OFFSET_IN_SECONDS = 'media_sync_offset_in_seconds'
+TEMPLATES = 'templates'
 EXPORT_FORMATS = 'export_formats'
 
+# Directory of the sync marker files, the deferred audit queue and the run summary, defaults to the current
+# working directory. Set to the directory of each configuration file when running several at once.
+STATE_DIRECTORY = 'state_directory'
+
+# Restrict the audit search of a shard to audits modified before this date, and to this template
+MODIFIED_BEFORE = 'modified_before'
+TEMPLATE_ID = 'template_id'
+
+# Properties kept in settings dictionary which take their values from the command line
+METRICS_PORT = 'metrics_port'
+MAX_CONCURRENT_TENANTS = 'max_concurrent_tenants'
+FSYNC_DOWNLOADS = 'fsync_downloads'
+SHARDS = 'shards'
+SHARD_BY = 'shard_by'
+SHARD_WORKERS = 'shard_workers'
+SHARD_DIRECTORY = 'shard_directory'
+SHARD_WORKER_ONLY = 'shard_worker_only'
+PROFILE_PATH = 'profile_path'
+PROFILE_SAMPLE_AUDITS = 'profile_sample_audits'
+PROFILER = 'profiler'
+
 # Used to create a default config file for new users
 DEFAULT_CONFIG_FILE_YAML = [
     'API:',
@@ -77,6 +137,7 @@ DEFAULT_CONFIG_FILE_YAML = [
     '\n    preferences:',
     '\n    sync_delay_in_seconds:',
     '\n    media_sync_offset_in_seconds:',
+    '\n    templates:',
 ]
 
 
@@ -226,6 +287,31 @@ def load_setting_media_sync_offset(logger, config_settings):
         return DEFAULT_MEDIA_SYNC_OFFSET_IN_SECONDS
 
 
+def load_setting_templates(logger, config_settings):
+    """
+    Attempt to parse the list of templates to export from config settings
+
+    :param logger:           the logger
+    :param config_settings:  config settings loaded from config file
+    :return:                 list of template IDs without duplicates, None to export audits of every template
+    """
+    try:
+        templates = config_settings['export_options'].get('templates')
+        if not templates:
+            return None
+        if not isinstance(templates, list):
+            templates = str(templates).split()
+        template_ids = []
+        for template_id in templates:
+            if template_id not in template_ids:
+                template_ids.append(template_id)
+        return template_ids
+    except Exception as ex:
+        log_critical_error(logger, ex, 'Exception parsing templates from the configuration file, exporting every '
+                                       'template')
+        return None
+
+
 def configure_logging(path_to_log_directory):
     """
     Configure logger
@@ -276,30 +362,32 @@ def save_web_report_link_to_file(logger, export_dir, web_report_data):
     :param export_dir:      path to directory for exports
     :param web_report_data:     Data to write to CSV: Template ID, Template name, Audit ID, Audit name, Web Report link
     """
-    if not os.path.exists(export_dir):
-        logger.info("Creating directory at {0} for Web Report links.".format(export_dir))
-        os.makedirs(export_dir)
+    import unicodecsv as csv
     file_path = os.path.join(export_dir, 'web-report-links.csv')
-    if os.path.isfile(file_path):
-        logger.info('Appending Web Report link to ' + file_path)
-        try:
-            with open(file_path, 'ab') as web_report_link_csv:
-                wr = csv.writer(web_report_link_csv, dialect='excel', quoting=csv.QUOTE_ALL)
-                wr.writerow(web_report_data)
-                web_report_link_csv.close()
-        except Exception as ex:
-            log_critical_error(logger, ex, 'Exception while writing' + file_path + ' to file')
-    else:
-        logger.info('Creating ' + file_path)
-        logger.info('Appending web report to ' + file_path)
-        try:
-            with open(file_path, 'wb') as web_report_link_csv:
-                wr = csv.writer(web_report_link_csv, dialect='excel', quoting=csv.QUOTE_ALL)
-                wr.writerow(['Template ID', 'Template Name', 'Audit ID', 'Audit Name',  'Web Report Link'])
-                wr.writerow(web_report_data)
-                web_report_link_csv.close()
-        except Exception as ex:
-            log_critical_error(logger, ex, 'Exception while writing' + file_path + ' to file')
+    with WEB_REPORT_LINKS_LOCK:
+        if not os.path.exists(export_dir):
+            logger.info("Creating directory at {0} for Web Report links.".format(export_dir))
+            os.makedirs(export_dir)
+        if os.path.isfile(file_path):
+            logger.info('Appending Web Report link to ' + file_path)
+            try:
+                with open(file_path, 'ab') as web_report_link_csv:
+                    wr = csv.writer(web_report_link_csv, dialect='excel', quoting=csv.QUOTE_ALL)
+                    wr.writerow(web_report_data)
+                    web_report_link_csv.close()
+            except Exception as ex:
+                log_critical_error(logger, ex, 'Exception while writing' + file_path + ' to file')
+        else:
+            logger.info('Creating ' + file_path)
+            logger.info('Appending web report to ' + file_path)
+            try:
+                with open(file_path, 'wb') as web_report_link_csv:
+                    wr = csv.writer(web_report_link_csv, dialect='excel', quoting=csv.QUOTE_ALL)
+                    wr.writerow(['Template ID', 'Template Name', 'Audit ID', 'Audit Name',  'Web Report Link'])
+                    wr.writerow(web_report_data)
+                    web_report_link_csv.close()
+            except Exception as ex:
+                log_critical_error(logger, ex, 'Exception while writing' + file_path + ' to file')
 
 
 def save_exported_actions_to_csv_file(logger, export_path, actions_array):
@@ -312,6 +400,7 @@ def save_exported_actions_to_csv_file(logger, export_path, actions_array):
     if not actions_array:
         logger.info('No actions returned after ' + get_last_successful_actions_export(logger))
         return
+    import unicodecsv as csv
     filename = ACTIONS_EXPORT_FILENAME
     file_path = os.path.join(export_path, filename)
     logger.info('Exporting ' + str(len(actions_array)) + ' actions to ' + file_path)
@@ -360,28 +449,44 @@ def transform_action_object_to_list(action):
     return actions_list
 
 
-def save_exported_media_to_file(logger, export_dir, media_file, filename, extension):
+def download_media_to_file(logger, sc_client, settings, export_dir, audit_id, media_id, extension):
     """
-    Write exported media item to disk at specified location with specified file name.
+    Stream a media item to disk at specified location, named after its media ID.
     Any existing file with the same name will be overwritten.
     :param logger:      the logger
+    :param sc_client:   instance of safetypy.SafetyCulture class
+    :param settings:    Settings from command line and configuration file
     :param export_dir:  path to directory for exports
-    :param media_file:  media file to write to disc
-    :param filename:    filename to give exported image
+    :param audit_id:    Unique audit UUID
+    :param media_id:    ID of the media item
     :param extension:   extension to give exported image
+    :return:            number of bytes written, None if the download failed
     """
     if not os.path.exists(export_dir):
         logger.info("Creating directory at {0} for media files.".format(export_dir))
         os.makedirs(export_dir)
-    file_path = os.path.join(export_dir, filename + '.' + extension)
+    file_path = os.path.join(export_dir, media_id + '.' + extension)
     if os.path.isfile(file_path):
         logger.info('Overwriting existing report at ' + file_path)
-    try:
-        with open(file_path, 'wb') as out_file:
-            shutil.copyfileobj(media_file.raw, out_file)
-        del media_file
-    except Exception as ex:
-        log_critical_error(logger, ex, 'Exception while writing' + file_path + ' to file')
+    return sc_client.download_media_to_file(audit_id, media_id, file_path, settings.get(FSYNC_DOWNLOADS, False))
+
+
+def download_exported_document(logger, sc_client, settings, export_href, filename, extension):
+    """
+    Stream an exported document to disk at specified location with specified file name.
+    Any existing file with the same name will be overwritten.
+    :param logger:       the logger
+    :param sc_client:    instance of safetypy.SafetyCulture class
+    :param settings:     Settings from command line and configuration file
+    :param export_href:  href of the exported document
+    :param filename:     filename to give exported document
+    :param extension:    extension to give exported document
+    :return:             number of bytes written, None if the download failed
+    """
+    file_path = os.path.join(settings[EXPORT_PATH], filename + '.' + extension)
+    if os.path.isfile(file_path):
+        logger.info('Overwriting existing report at ' + file_path)
+    return sc_client.download_to_file(export_href, file_path, settings.get(FSYNC_DOWNLOADS, False))
 
 
 def save_exported_document(logger, export_dir, export_doc, filename, extension):
@@ -393,6 +498,7 @@ def save_exported_document(logger, export_dir, export_doc, filename, extension):
     :param export_doc:  export document to write
     :param filename:    filename to give exported document
     :param extension:   extension to give exported document
+    :return:            number of bytes written, None if writing failed
     """
     file_path = os.path.join(export_dir, filename + '.' + extension)
     if os.path.isfile(file_path):
@@ -400,72 +506,86 @@ def save_exported_document(logger, export_dir, export_doc, filename, extension):
     try:
         with open(file_path, 'wb') as export_file:
             export_file.write(export_doc)
+        return len(export_doc)
     except Exception as ex:
         log_critical_error(logger, ex, 'Exception while writing' + file_path + ' to file')
 
 
-def update_sync_marker_file(date_modified):
+def get_state_path(settings, filename):
+    """
+    :param settings:  Settings from command line and configuration file
+    :param filename:  name of a sync marker or other state file
+    :return:          path of the file in the state directory of the settings
+    """
+    return os.path.join(settings.get(STATE_DIRECTORY) or os.getcwd(), filename)
+
+
+def update_sync_marker_file(date_modified, path=SYNC_MARKER_FILENAME):
     """
     Replaces the contents of the sync marker file with the most
     recent modified_at date time value from audit JSON data
 
     :param date_modified:   modified_at value from most recently downloaded audit JSON
+    :param path:            path of the sync marker file
     :return:
     """
-    with open(SYNC_MARKER_FILENAME, 'w') as sync_marker_file:
+    with open(path, 'w') as sync_marker_file:
         sync_marker_file.write(date_modified)
 
 
-def get_last_successful(logger):
+def get_last_successful(logger, path=SYNC_MARKER_FILENAME):
     """
     Read the date and time of the last successfully exported audit data from the sync marker file
 
     :param logger:  the logger
+    :param path:    path of the sync marker file
     :return:        A datetime value (or 2000-01-01 if syncing since the 'beginning of time')
     """
-    if os.path.isfile(SYNC_MARKER_FILENAME):
-        with open(SYNC_MARKER_FILENAME, 'r+') as last_run:
+    if os.path.isfile(path):
+        with open(path, 'r+') as last_run:
             last_successful = last_run.readlines()[0]
             last_successful = last_successful.strip()
 
     else:
         beginning_of_time = '2000-01-01T00:00:00.000Z'
         last_successful = beginning_of_time
-        with open(SYNC_MARKER_FILENAME, 'w') as last_run:
+        with open(path, 'w') as last_run:
             last_run.write(last_successful)
         logger.info('Searching for audits since the beginning of time: ' + beginning_of_time)
     return last_successful
 
 
-def update_actions_sync_marker_file(logger, date_modified):
+def update_actions_sync_marker_file(logger, date_modified, path=ACTIONS_SYNC_MARKER_FILENAME):
     """
     Replaces the contents of the actions sync marker file with the the date/time string provided
     :param logger:   The logger
     :param date_modified:   ISO string
+    :param path:     path of the actions sync marker file
     """
     try:
-        with open(ACTIONS_SYNC_MARKER_FILENAME, 'w') as actions_sync_marker_file:
+        with open(path, 'w') as actions_sync_marker_file:
             actions_sync_marker_file.write(date_modified)
     except Exception as ex:
-        log_critical_error(logger, ex, 'Unable to open ' + ACTIONS_SYNC_MARKER_FILENAME + ' for writing')
+        log_critical_error(logger, ex, 'Unable to open ' + path + ' for writing')
         exit()
 
 
-def get_last_successful_actions_export(logger):
+def get_last_successful_actions_export(logger, path=ACTIONS_SYNC_MARKER_FILENAME):
     """
     Reads the actions sync marker file to determine the date and time of the most last successfully exported action.
     The actions sync marker file is expected to contain a single ISO formatted datetime string.
     :param logger:  the logger
+    :param path:    path of the actions sync marker file
     :return:        A datetime value (or 2000-01-01 if syncing since the 'beginning of time')
     """
-    if os.path.isfile(ACTIONS_SYNC_MARKER_FILENAME):
-        with open(ACTIONS_SYNC_MARKER_FILENAME, 'r+') as last_run:
+    if os.path.isfile(path):
+        with open(path, 'r+') as last_run:
             last_successful_actions_export = last_run.readlines()[0]
             logger.info('Searching for actions modified after ' + last_successful_actions_export)
     else:
         beginning_of_time = '2000-01-01T00:00:00.000Z'
         last_successful_actions_export = beginning_of_time
-        with open(ACTIONS_SYNC_MARKER_FILENAME, 'w') as last_run:
+        with open(path, 'w') as last_run:
             last_run.write(last_successful_actions_export)
         logger.info('Searching for actions since the beginning of time: ' + beginning_of_time)
     return last_successful_actions_export
@@ -475,7 +595,7 @@ def parse_export_filename(audit_json, filename_item_id):
     """
     Get 'response' value of specified header item to use for export file name
 
-    :param header_items:      header_items array from audit JSON
+    :param audit_json:        audit JSON
     :param filename_item_id:  item_id from config settings
     :return:                  'response' value of specified item from audit JSON
     """
@@ -485,11 +605,9 @@ def parse_export_filename(audit_json, filename_item_id):
     # When this item ID is specified in the custom export filename configuration, the audit_data.name property will be used to populate the data as it covers all cases.
     if filename_item_id == AUDIT_TITLE_ITEM_ID and 'audit_data' in audit_json.keys() and 'name' in audit_json['audit_data'].keys():
         return audit_json['audit_data']['name'].replace('/','_')
-    for item in audit_json['header_items']:
-        if item['item_id'] == filename_item_id:
-            if 'responses' in item.keys():
-                if 'text' in item['responses'].keys() and item['responses']['text'].strip() != '':
-                    return item['responses']['text']
+    item = models.Audit(audit_json).header_item_by_id.get(filename_item_id)
+    if item is not None and item.responses.get('text', '').strip() != '':
+        return item.responses['text']
     return None
 
 
@@ -534,8 +652,9 @@ def load_config_settings(logger, path_to_config_file):
     :return:                    settings dictionary containing values for:
                                 api_token, export_path, preferences,
                                 filename_item_id, sync_delay_in_seconds loaded from
-                                config file, media_sync_offset_in_seconds
+                                config file, media_sync_offset_in_seconds, templates
     """
+    import yaml
     config_settings = yaml.safe_load(open(path_to_config_file))
     settings = {
         API_TOKEN: load_setting_api_access_token(logger, config_settings),
@@ -544,24 +663,32 @@ def load_config_settings(logger, path_to_config_file):
         FILENAME_ITEM_ID: get_filename_item_id(logger, config_settings),
         SYNC_DELAY_IN_SECONDS: load_setting_sync_delay(logger, config_settings),
         EXPORT_INACTIVE_ITEMS_TO_CSV: load_export_inactive_items_to_csv(logger, config_settings),
-        MEDIA_SYNC_OFFSET_IN_SECONDS: load_setting_media_sync_offset(logger, config_settings)
+        MEDIA_SYNC_OFFSET_IN_SECONDS: load_setting_media_sync_offset(logger, config_settings),
+        TEMPLATES: load_setting_templates(logger, config_settings)
     }
 
     return settings
 
 
-def configure(logger, path_to_config_file, export_formats):
+def configure(logger, path_to_config_file, export_formats, command_line_options=None):
     """
     instantiate and configure logger, load config settings from file, instantiate SafetyCulture SDK
-    :param logger:              the logger
-    :param path_to_config_file: path to config file
-    :param export_formats:      desired export formats
-    :return:                    instance of SafetyCulture SDK object, config settings
+    :param logger:               the logger
+    :param path_to_config_file:  path to config file
+    :param export_formats:       desired export formats
+    :param command_line_options: dictionary of further settings passed on the command line
+    :return:                     instance of SafetyCulture SDK object, config settings
     """
 
     config_settings = load_config_settings(logger, path_to_config_file)
     config_settings[EXPORT_FORMATS] = export_formats
-    sc_client = sp.SafetyCulture(config_settings[API_TOKEN])
+    config_settings.update(command_line_options or {})
+    request_metrics = None
+    if config_settings.get(METRICS_PORT) is not None:
+        request_metrics = metrics.RequestMetrics()
+        metrics.start_prometheus_exporter(request_metrics, config_settings[METRICS_PORT])
+        logger.info('Serving API request metrics on port {0}'.format(config_settings[METRICS_PORT]))
+    sc_client = sp.SafetyCulture(config_settings[API_TOKEN], request_hook=request_metrics)
 
     if config_settings[EXPORT_PATH] is not None:
         create_directory_if_not_exists(logger, config_settings[EXPORT_PATH])
@@ -573,19 +700,109 @@ def configure(logger, path_to_config_file, export_formats):
     return sc_client, config_settings
 
 
+def create_tenants(logger, name, settings, sc_client, request_metrics=None):
+    """
+    Create the Tenant syncing a configuration, or one Tenant per template if the configuration lists templates.
+    Template streams share the client and export path of the configuration but each has its own sync marker,
+    deferred audits and schedule, so a template with a large backlog does not hold up the others. Actions are
+    exported by a stream of their own.
+    :param logger:           the logger
+    :param name:             name of the configuration, None if it is the only one
+    :param settings:         settings of the configuration
+    :param sc_client:        SafetyCulture client of the configuration
+    :param request_metrics:  RequestMetrics of the configuration's API requests, if any
+    :return:                 list of Tenant
+    """
+    if not settings.get(TEMPLATES):
+        sync_scheduler = scheduler.AdaptiveScheduler(settings[SYNC_DELAY_IN_SECONDS])
+        return [tn.Tenant(name, settings, sc_client, logger, sync_scheduler, request_metrics)]
+
+    streams = []
+    if 'actions' in settings[EXPORT_FORMATS]:
+        actions_settings = dict(settings)
+        actions_settings[EXPORT_FORMATS] = ['actions']
+        streams.append(('actions', actions_settings))
+    audit_export_formats = [export_format for export_format in settings[EXPORT_FORMATS] if export_format != 'actions']
+    sync_marker_path = get_state_path(settings, SYNC_MARKER_FILENAME)
+    for template_id in settings[TEMPLATES] if audit_export_formats else []:
+        stream_settings = dict(settings)
+        stream_settings.update({
+            STATE_DIRECTORY: get_state_path(settings, os.path.join(TEMPLATE_STREAMS_DIRECTORY, template_id)),
+            EXPORT_FORMATS: audit_export_formats,
+            TEMPLATE_ID: template_id
+        })
+        create_directory_if_not_exists(logger, stream_settings[STATE_DIRECTORY])
+        stream_sync_marker_path = get_state_path(stream_settings, SYNC_MARKER_FILENAME)
+        # a new template stream carries on from where the export of every template had got to
+        if not os.path.isfile(stream_sync_marker_path) and os.path.isfile(sync_marker_path):
+            shutil.copyfile(sync_marker_path, stream_sync_marker_path)
+        streams.append((template_id, stream_settings))
+
+    tenants = []
+    for stream_name, stream_settings in streams:
+        sync_scheduler = scheduler.AdaptiveScheduler(stream_settings[SYNC_DELAY_IN_SECONDS])
+        tenant_name = stream_name if name is None else name + '/' + stream_name
+        tenants.append(tn.Tenant(tenant_name, stream_settings, sc_client, logger, sync_scheduler, request_metrics))
+    return tenants
+
+
+def configure_tenants(logger, config_filenames, export_formats, command_line_options):
+    """
+    Load several config files to be exported side by side. Each tenant keeps its sync markers in the directory of
+    its config file and gets its own SafetyCulture client and rate limiter, while the connection pool is shared.
+    :param logger:                the logger
+    :param config_filenames:      paths to the config files, each in its own directory
+    :param export_formats:        desired export formats
+    :param command_line_options:  dictionary of further settings passed on the command line
+    :return:                      list of Tenant
+    """
+    # Every tenant synced at the same time runs up to DEFAULT_MAX_EXPORT_JOBS_IN_FLIGHT export jobs on the session
+    max_concurrent_tenants = command_line_options.get(MAX_CONCURRENT_TENANTS) or DEFAULT_MAX_CONCURRENT_TENANTS
+    session = sp.create_session(pool_maxsize=max_concurrent_tenants * sp.DEFAULT_MAX_EXPORT_JOBS_IN_FLIGHT)
+    tenants = []
+    tenant_metrics = []
+    for config_filename in config_filenames:
+        state_directory = os.path.dirname(os.path.abspath(config_filename))
+        name = os.path.relpath(state_directory)
+        settings = load_config_settings(logger, config_filename)
+        settings[EXPORT_FORMATS] = export_formats
+        settings[STATE_DIRECTORY] = state_directory
+        settings.update(command_line_options)
+        if settings[EXPORT_PATH] is None:
+            logger.info('Invalid export path was found in ' + config_filename + ', defaulting to /exports')
+            settings[EXPORT_PATH] = 'exports'
+        # relative export paths are relative to the config file rather than the current working directory
+        settings[EXPORT_PATH] = os.path.join(state_directory, settings[EXPORT_PATH])
+        create_directory_if_not_exists(logger, settings[EXPORT_PATH])
+        request_metrics = None
+        if settings.get(METRICS_PORT) is not None:
+            request_metrics = metrics.RequestMetrics(labels={'tenant': name})
+            tenant_metrics.append(request_metrics)
+        sc_client = sp.SafetyCulture(settings[API_TOKEN], request_hook=request_metrics, session=session)
+        tenants.extend(create_tenants(logger, name, settings, sc_client, request_metrics))
+
+    if command_line_options.get(METRICS_PORT) is not None:
+        metrics.start_prometheus_exporter(tenant_metrics, command_line_options[METRICS_PORT])
+        logger.info('Serving API request metrics on port {0}'.format(command_line_options[METRICS_PORT]))
+    return tenants
+
+
 def parse_command_line_arguments(logger):
     """
     Parse command line arguments received, if any
     Print example if invalid arguments are passed
 
     :param logger:  the logger
-    :return:        config_filename passed as argument if any, else DEFAULT_CONFIG_FILENAME
+    :return:        list of config filenames passed as argument if any, else [DEFAULT_CONFIG_FILENAME]
                     export_formats passed as argument if any, else 'pdf'
                     list_epreferences if passed as argument, else None
                     do_loop False if passed as argument, else True
+                    dictionary of further settings passed as arguments, e.g. metrics_port
     """
     parser = argparse.ArgumentParser()
-    parser.add_argument('--config', help='config file to use, defaults to ' + DEFAULT_CONFIG_FILENAME)
+    parser.add_argument('--config', nargs='+', help='config file to use, defaults to ' + DEFAULT_CONFIG_FILENAME +
+                                                    '. Several config files, each in its own directory, are exported '
+                                                    'side by side in this process')
     parser.add_argument('--format', nargs='*', help='formats to download, valid options are pdf, '
                                                     'json, docx, csv, media, web-report-link, actions')
     parser.add_argument('--list_preferences', nargs='*', help='display all preferences, or restrict to specific'
@@ -594,22 +811,55 @@ def parse_command_line_arguments(logger):
     parser.add_argument('--setup', action='store_true', help='Automatically create new directory containing the '
                                                              'necessary config file.'
                         'Directory will be named iAuditor Audit Exports, and will be placed in your current directory')
+    parser.add_argument('--metrics-port', type=int, help='serve API request metrics in the Prometheus text format '
+                                                         'on this local port')
+    parser.add_argument('--max-concurrent-tenants', type=int, default=DEFAULT_MAX_CONCURRENT_TENANTS,
+                        help='number of config files synced at the same time, defaults to '
+                             + str(DEFAULT_MAX_CONCURRENT_TENANTS))
+    parser.add_argument('--fsync', action='store_true', help='flush every downloaded report and media file to disk '
+                                                             'before moving it into place')
+    parser.add_argument('--shards', type=int, help='split the export into this many shards, exported by '
+                                                   '--shard-workers processes and merged when all are done')
+    parser.add_argument('--shard-by', choices=['time', 'template'], default='time',
+                        help='split the modified date range (default) or the templates between the shards')
+    parser.add_argument('--shard-workers', type=int, help='number of worker processes to start, defaults to the '
+                                                          'number of shards')
+    parser.add_argument('--shard-dir', help='directory of the shard plan, markers and exports, defaults to '
+                                            + DEFAULT_SHARD_DIRECTORY + '. Put it on a shared file system to export '
+                                            'shards from several nodes')
+    parser.add_argument('--shard-worker', action='store_true', help='only export shards of the plan in --shard-dir, '
+                                                                     'without creating a plan or merging the shards')
+    parser.add_argument('--profile', nargs='?', const=profiling.DEFAULT_PROFILE_FILENAME,
+                        help='profile the run and write a pstats file, or a speedscope file if the name ends with '
+                             + profiling.SPEEDSCOPE_SUFFIX + ' (requires pyinstrument), defaults to '
+                             + profiling.DEFAULT_PROFILE_FILENAME)
+    parser.add_argument('--profile-sample-audits', type=int, help='only profile the CSV conversion of this many '
+                                                                  'audits')
     args = parser.parse_args()
 
-    config_filename = DEFAULT_CONFIG_FILENAME
+    config_filenames = [DEFAULT_CONFIG_FILENAME]
 
     if args.setup:
         initial_setup(logger)
         exit()
 
     if args.config is not None:
-        if os.path.isfile(args.config):
-            config_filename = args.config
-            logger.debug(config_filename + ' passed as config argument')
-        else:
-            logger.error(config_filename + ' is not a valid config file')
+        for config_filename in args.config:
+            if os.path.isfile(config_filename):
+                logger.debug(config_filename + ' passed as config argument')
+            else:
+                logger.error(config_filename + ' is not a valid config file')
+                sys.exit(1)
+        config_filenames = args.config
+        config_directories = [os.path.dirname(os.path.abspath(config_filename)) for config_filename in args.config]
+        if len(set(config_directories)) < len(config_directories):
+            logger.error('Every config file must be in its own directory when exporting several at once')
             sys.exit(1)
 
+    if args.max_concurrent_tenants < 1:
+        logger.error('--max-concurrent-tenants must be a positive number')
+        sys.exit(1)
+
     export_formats = ['pdf']
     if args.format is not None and len(args.format) > 0:
         valid_export_formats = ['json', 'docx', 'pdf', 'csv', 'media', 'web-report-link', 'actions']
@@ -624,7 +874,34 @@ def parse_command_line_arguments(logger):
 
     loop_enabled = True if args.loop is not None else False
 
-    return config_filename, export_formats, args.list_preferences, loop_enabled
+    if args.shards is not None and args.shards < 1:
+        logger.error('--shards must be a positive number')
+        sys.exit(1)
+    if (args.shards is not None or args.shard_worker) and (loop_enabled or len(config_filenames) > 1):
+        logger.error('Sharded exports take a single config file and cannot be combined with --loop')
+        sys.exit(1)
+
+    if args.profile_sample_audits is not None and args.profile_sample_audits < 1:
+        logger.error('--profile-sample-audits must be a positive number')
+        sys.exit(1)
+    profile_path = args.profile
+    if args.profile_sample_audits is not None and profile_path is None:
+        profile_path = profiling.DEFAULT_PROFILE_FILENAME
+
+    command_line_options = {
+        METRICS_PORT: args.metrics_port,
+        MAX_CONCURRENT_TENANTS: args.max_concurrent_tenants,
+        FSYNC_DOWNLOADS: args.fsync,
+        SHARDS: args.shards,
+        SHARD_BY: args.shard_by,
+        SHARD_WORKERS: args.shard_workers,
+        SHARD_DIRECTORY: args.shard_dir,
+        SHARD_WORKER_ONLY: args.shard_worker,
+        PROFILE_PATH: profile_path,
+        PROFILE_SAMPLE_AUDITS: args.profile_sample_audits
+    }
+
+    return config_filenames, export_formats, args.list_preferences, loop_enabled, command_line_options
 
 
 def initial_setup(logger):
@@ -693,7 +970,7 @@ def show_preferences_and_exit(list_preferences, sc_client):
 
     if len(list_preferences) > 0:
         for template_id in list_preferences:
-            preferences = sc_client.get_preference_ids(template_id)
+            preferences = sc_client.template_cache.get_preferences(template_id)
             for preference in preferences['preferences']:
                 preference_id = str(preference['id'])
                 preference_name = str(preference['label'])[:35]
@@ -703,7 +980,7 @@ def show_preferences_and_exit(list_preferences, sc_client):
                 print(row_boundary)
         sys.exit()
     else:
-        preferences = sc_client.get_preference_ids()
+        preferences = sc_client.template_cache.get_preferences()
         for preference in preferences['preferences']:
             preference_id = str(preference['id'])
             preference_name = str(preference['label'])[:35]
@@ -713,21 +990,27 @@ def show_preferences_and_exit(list_preferences, sc_client):
             print(row_boundary)
         sys.exit(0)
 
-def export_actions(logger, settings, sc_client):
+def export_actions(logger, settings, sc_client, run_summary=None):
     """
     Export all actions created after date specified
     :param logger:      The logger
     :param settings:    Settings from command line and configuration file
     :param sc_client:   instance of safetypy.SafetyCulture class
+    :param run_summary: RunSummary collecting timings of the current run
     """
+    run_summary = run_summary or rs.RunSummary()
     logger.info('Exporting iAuditor actions')
-    last_successful_actions_export = get_last_successful_actions_export(logger)
-    actions_array = sc_client.get_audit_actions(last_successful_actions_export)
-    if actions_array is not None:
-        logger.info('Found ' + str(len(actions_array)) + ' actions')
-        save_exported_actions_to_csv_file(logger, settings[EXPORT_PATH], actions_array)
-        utc_iso_datetime_now = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        update_actions_sync_marker_file(logger, utc_iso_datetime_now)
+    with run_summary.stage('actions'):
+        actions_sync_marker_path = get_state_path(settings, ACTIONS_SYNC_MARKER_FILENAME)
+        last_successful_actions_export = get_last_successful_actions_export(logger, actions_sync_marker_path)
+        actions_array = sc_client.get_audit_actions(last_successful_actions_export)
+        if actions_array is not None:
+            logger.info('Found ' + str(len(actions_array)) + ' actions')
+            save_exported_actions_to_csv_file(logger, settings[EXPORT_PATH], actions_array)
+            utc_iso_datetime_now = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z')
+            update_actions_sync_marker_file(logger, utc_iso_datetime_now, actions_sync_marker_path)
+        else:
+            run_summary.record_failure('actions', None, 'Unable to retrieve actions')
 
 
 def sync_exports(logger, settings, sc_client):
@@ -737,21 +1020,141 @@ def sync_exports(logger, settings, sc_client):
     :param logger:    the logger
     :param settings:  Settings from command line and configuration file
     :param sc_client: Instance of SDK object
+    :return:          summary dictionary of the run, see RunSummary.as_dict
     """
+    log_dir = get_state_path(settings, 'log')
+    create_directory_if_not_exists(logger, log_dir)
+    run_summary = rs.RunSummary(os.path.join(log_dir, RUN_SUMMARY_FILENAME))
     if 'actions' in settings[EXPORT_FORMATS]:
-        export_actions(logger, settings, sc_client)
-    if not bool(set(settings[EXPORT_FORMATS]) & {'pdf', 'docx', 'csv', 'media', 'web-report-link', 'json'}):
-        return
-    last_successful = get_last_successful(logger)
-    list_of_audits = sc_client.discover_audits(modified_after=last_successful)
-    if list_of_audits is not None:
-        logger.info(str(list_of_audits['total']) + ' audits discovered')
-        export_count = 1
-        export_total = list_of_audits['total']
-        for audit in list_of_audits['audits']:
-            logger.info('Processing audit (' + str(export_count) + '/' + str(export_total) + ')')
-            process_audit(logger, settings, sc_client, audit)
-            export_count += 1
+        export_actions(logger, settings, sc_client, run_summary)
+    if bool(set(settings[EXPORT_FORMATS]) & {'pdf', 'docx', 'csv', 'media', 'web-report-link', 'json'}):
+        deferred_audits = dq.DeferredAuditQueue(get_state_path(settings, DEFERRED_AUDITS_FILENAME))
+        last_successful = get_last_successful(logger, get_state_path(settings, SYNC_MARKER_FILENAME))
+        with run_summary.stage('discovery'):
+            list_of_audits = sc_client.discover_audits(modified_after=last_successful,
+                                                       modified_before=settings.get(MODIFIED_BEFORE),
+                                                       template_id=settings.get(TEMPLATE_ID))
+        if list_of_audits is not None:
+            logger.info(str(list_of_audits['total']) + ' audits discovered')
+            run_summary.increment(rs.AUDITS_DISCOVERED, list_of_audits['total'])
+            # audits modified again since they were deferred are handled with the rest of the discovered audits
+            deferred_audits.discard([audit['audit_id'] for audit in list_of_audits['audits']])
+        else:
+            run_summary.record_failure('discovery', None, 'Unable to discover audits')
+        export_deferred_audits(logger, settings, sc_client, deferred_audits, run_summary)
+        if list_of_audits is not None:
+            export_discovered_audits(logger, settings, sc_client, list_of_audits, deferred_audits, run_summary)
+        run_summary.set_deferred(len(deferred_audits), deferred_audits.next_eligible_at())
+    summary = run_summary.finish()
+    run_summary.log(logger)
+    return summary
+
+
+def export_discovered_audits(logger, settings, sc_client, list_of_audits, deferred_audits, run_summary):
+    """
+    Export discovered audits in order of modification, deferring those modified too recently. The sync marker
+    moves past every audit that has been exported or deferred.
+    :param logger:          the logger
+    :param settings:        Settings from command line and configuration file
+    :param sc_client:       instance of safetypy.SafetyCulture class
+    :param list_of_audits:  audit search result
+    :param deferred_audits: DeferredAuditQueue of audits to export once they are eligible
+    :param run_summary:     RunSummary collecting timings of the current run
+    """
+    export_count = 1
+    export_total = list_of_audits['total']
+    audits = list_of_audits['audits']
+    batch_size = sp.DEFAULT_MAX_EXPORT_JOBS_IN_FLIGHT
+    for batch in [audits[index:index + batch_size] for index in range(0, len(audits), batch_size)]:
+        eligible_audit_ids = set(audit['audit_id'] for audit in batch
+                                 if check_if_media_sync_offset_satisfied(logger, settings, audit))
+        # Exports not moved to their export filename when the cycle stops are removed with the batch directory
+        batch_directory = tempfile.mkdtemp(prefix=BATCH_DIRECTORY_PREFIX, dir=settings[EXPORT_PATH])
+        try:
+            exported_documents = export_documents(logger, settings, sc_client,
+                                                  [audit for audit in batch
+                                                   if audit['audit_id'] in eligible_audit_ids],
+                                                  batch_directory, run_summary)
+            for audit in batch:
+                if audit['audit_id'] not in eligible_audit_ids:
+                    eligible_at = get_media_sync_eligible_time(settings, audit)
+                    deferred_audits.push(audit, eligible_at)
+                    run_summary.defer(audit['audit_id'], eligible_at)
+                else:
+                    logger.info('Processing audit (' + str(export_count) + '/' + str(export_total) + ')')
+                    audit_start_time = time.time()
+                    processed = process_audit(logger, settings, sc_client, audit, run_summary, exported_documents)
+                    run_summary.emit('audit', audit_id=audit['audit_id'], index=export_count, total=export_total,
+                                     seconds=round(time.time() - audit_start_time, 3), processed=processed)
+                    if not processed:
+                        logger.error('Stopping sync cycle, audit {0} will be retried on the next cycle'.format(
+                            audit['audit_id']))
+                        return
+                logger.debug('setting last modified to ' + audit['modified_at'])
+                update_sync_marker_file(audit['modified_at'], get_state_path(settings, SYNC_MARKER_FILENAME))
+                export_count += 1
+        finally:
+            shutil.rmtree(batch_directory, ignore_errors=True)
+
+
+def export_documents(logger, settings, sc_client, audits, batch_directory, run_summary):
+    """
+    Export a batch of audits in the PDF and Word formats of the settings, running their export jobs concurrently.
+    Every export is downloaded to the batch directory, named after its audit ID.
+    :param logger:           the logger
+    :param settings:         Settings from command line and configuration file
+    :param sc_client:        instance of safetypy.SafetyCulture class
+    :param audits:           audit search results, audits without a template_id are left to process_audit
+    :param batch_directory:  directory of the export path to download the exports to
+    :param run_summary:      RunSummary collecting timings of the current run
+    :return:                 dictionary of the path of every export by (audit ID, export format), None if it
+                             failed
+    """
+    def record_timing(audit_id, export_seconds, download_seconds):
+        run_summary.add_stage_time('export_queue_wait', export_seconds)
+        run_summary.add_stage_time(export_format, export_seconds + download_seconds)
+
+    exported_documents = {}
+    audits = [audit for audit in audits if 'template_id' in audit]
+    for export_format in [export_format for export_format in settings[EXPORT_FORMATS]
+                          if export_format in DOCUMENT_EXPORT_FORMATS]:
+        audit_ids_by_preference = {}
+        for audit in audits:
+            preference_id = get_preference_id(settings, audit['template_id'], sc_client, logger)
+            audit_ids_by_preference.setdefault(preference_id, []).append(audit['audit_id'])
+        for preference_id, audit_ids in audit_ids_by_preference.items():
+            export_paths = dict((audit_id, os.path.join(batch_directory, audit_id + '.' + export_format))
+                                for audit_id in audit_ids)
+            for audit_id, export_path in sc_client.get_exports(audit_ids, preference_id, export_format,
+                                                               export_paths, timing_hook=record_timing,
+                                                               fsync=settings.get(FSYNC_DOWNLOADS, False)):
+                exported_documents[(audit_id, export_format)] = export_path
+    return exported_documents
+
+
+def export_deferred_audits(logger, settings, sc_client, deferred_audits, run_summary):
+    """
+    Export the deferred audits that have become eligible since they were deferred
+    :param logger:          the logger
+    :param settings:        Settings from command line and configuration file
+    :param sc_client:       instance of safetypy.SafetyCulture class
+    :param deferred_audits: DeferredAuditQueue of audits to export once they are eligible
+    :param run_summary:     RunSummary collecting timings of the current run
+    """
+    eligible_audits = deferred_audits.pop_eligible(time.time())
+    if eligible_audits:
+        logger.info(str(len(eligible_audits)) + ' deferred audits are now eligible for export')
+    for index, audit in enumerate(eligible_audits):
+        audit_start_time = time.time()
+        processed = process_audit(logger, settings, sc_client, audit, run_summary)
+        run_summary.emit('audit', audit_id=audit['audit_id'], deferred=True,
+                         seconds=round(time.time() - audit_start_time, 3), processed=processed)
+        if not processed:
+            logger.error('Unable to export deferred audits, they will be retried on the next cycle')
+            for failed_audit in eligible_audits[index:]:
+                deferred_audits.push(failed_audit, get_media_sync_eligible_time(settings, failed_audit))
+            break
+        run_summary.increment(rs.DEFERRED_AUDITS_PROCESSED)
 
 
 def check_if_media_sync_offset_satisfied(logger, settings, audit):
@@ -764,6 +1167,8 @@ def check_if_media_sync_offset_satisfied(logger, settings, audit):
     :param audit:     Audit JSON
     :return:          Boolean - True if the media sync offset is satisfied, otherwise, returns false.
     """
+    import dateutil.parser
+    import pytz
     modified_at = dateutil.parser.parse(audit['modified_at'])
     now = datetime.utcnow()
     elapsed_time_difference = (pytz.utc.localize(now) - modified_at)
@@ -775,41 +1180,145 @@ def check_if_media_sync_offset_satisfied(logger, settings, audit):
     return True
 
 
-def process_audit(logger, settings, sc_client, audit):
+def get_media_sync_eligible_time(settings, audit):
+    """
+    :param settings:  Settings from command line and configuration file
+    :param audit:     Audit JSON
+    :return:          POSIX timestamp at which the media sync offset of the audit is satisfied
+    """
+    import dateutil.parser
+    import pytz
+    modified_at = dateutil.parser.parse(audit['modified_at'])
+    epoch = datetime(1970, 1, 1, tzinfo=pytz.utc)
+    return (modified_at - epoch).total_seconds() + settings[MEDIA_SYNC_OFFSET_IN_SECONDS]
+
+
+def process_audit(logger, settings, sc_client, audit, run_summary=None, exported_documents=None):
     """
     Export audit in the format specified in settings. Formats include PDF, JSON, CSV, MS Word (docx), media, or
     web report link.
-    :param logger:      The logger
-    :param settings:    Settings from command line and configuration file
-    :param sc_client:   instance of safetypy.SafetyCulture class
-    :param audit:       Audit JSON to be exported
-    """
-    if not check_if_media_sync_offset_satisfied(logger, settings, audit):
-        return
+    :param logger:              The logger
+    :param settings:            Settings from command line and configuration file
+    :param sc_client:           instance of safetypy.SafetyCulture class
+    :param audit:               Audit search result with the audit_id of the audit to be exported
+    :param run_summary:         RunSummary collecting timings of the current run
+    :param exported_documents:  PDF and Word exports of the audit already made by export_documents, if any
+    :return:                    False if the audit could not be downloaded or one of its PDF and Word exports
+                                failed, otherwise True
+    """
+    exported_documents = exported_documents or {}
+    run_summary = run_summary or rs.RunSummary()
     audit_id = audit['audit_id']
-    logger.info('downloading ' + audit_id)
-    audit_json = sc_client.get_audit(audit_id)
-    template_id = audit_json['template_id']
-    preference_id = None
-    if settings[PREFERENCES] is not None and template_id in settings[PREFERENCES].keys():
-        preference_id = settings[PREFERENCES][template_id]
-    export_filename = parse_export_filename(audit_json, settings[FILENAME_ITEM_ID]) or audit_id
+    if is_audit_json_needed(settings, audit):
+        logger.info('downloading ' + audit_id)
+        with run_summary.stage('audit_json'):
+            audit_json = sc_client.get_audit(audit_id)
+        if audit_json is None:
+            logger.error('Unable to download audit ' + audit_id)
+            run_summary.increment(rs.AUDITS_FAILED)
+            run_summary.record_failure('audit_json', audit_id, 'Unable to download audit')
+            return False
+        template_id = audit_json['template_id']
+        export_filename = parse_export_filename(audit_json, settings[FILENAME_ITEM_ID]) or audit_id
+    else:
+        audit_json = None
+        template_id = audit['template_id']
+        export_filename = audit_id
+    preference_id = get_preference_id(settings, template_id, sc_client, logger)
+    documents_exported = True
     for export_format in settings[EXPORT_FORMATS]:
-        if export_format in ['pdf', 'docx']:
-            export_audit_pdf_word(logger, sc_client, settings, audit_id, preference_id, export_format, export_filename)
-        elif export_format == 'json':
-            export_audit_json(logger, settings, audit_json, export_filename)
-        elif export_format == 'csv':
-            export_audit_csv(settings, audit_json)
-        elif export_format == 'media':
-            export_audit_media(logger, sc_client, settings, audit_json, audit_id, export_filename)
-        elif export_format == 'web-report-link':
-            export_audit_web_report_link(logger, settings, sc_client, audit_json, audit_id, template_id)
-    logger.debug('setting last modified to ' + audit['modified_at'])
-    update_sync_marker_file(audit['modified_at'])
-
-
-def export_audit_pdf_word(logger, sc_client, settings, audit_id, preference_id, export_format, export_filename):
+        if (audit_id, export_format) in exported_documents:
+            documents_exported = save_batch_exported_document(
+                logger, settings, audit_id, export_format, export_filename,
+                exported_documents[(audit_id, export_format)], run_summary) and documents_exported
+            continue
+        with run_summary.stage(export_format):
+            if export_format in ['pdf', 'docx']:
+                documents_exported = export_audit_pdf_word(logger, sc_client, settings, audit_id, preference_id,
+                                                           export_format, export_filename,
+                                                           run_summary) and documents_exported
+            elif export_format == 'json':
+                export_audit_json(logger, settings, audit_json, export_filename, run_summary)
+            elif export_format == 'csv':
+                export_audit_csv(settings, audit_json, run_summary)
+            elif export_format == 'media':
+                export_audit_media(logger, sc_client, settings, audit_json, audit_id, export_filename, run_summary)
+            elif export_format == 'web-report-link':
+                export_audit_web_report_link(logger, settings, sc_client, audit_json, audit_id, template_id)
+    if not documents_exported:
+        run_summary.increment(rs.AUDITS_FAILED)
+        return False
+    run_summary.increment(rs.AUDITS_PROCESSED)
+    return True
+
+
+def get_preference_id(settings, template_id, sc_client=None, logger=None):
+    """
+    :param settings:     Settings from command line and configuration file
+    :param template_id:  template of the audit to export
+    :param sc_client:    if given, the configured preference is checked against the export preferences of the
+                         template kept by the template cache of the client
+    :param logger:       the logger, required with sc_client
+    :return:             ID of the export preference configured for the template, None if there is none or the
+                         template no longer has it
+    """
+    if settings[PREFERENCES] is None or template_id not in settings[PREFERENCES].keys():
+        return None
+    preference_id = settings[PREFERENCES][template_id]
+    if sc_client is not None:
+        preferences = sc_client.template_cache.get_preferences(template_id)
+        if preferences is not None and \
+                preference_id not in [preference['id'] for preference in preferences.get('preferences', [])]:
+            logger.warning('Export preference {0} of template {1} no longer exists, using the default '
+                           'preference'.format(preference_id, template_id))
+            return None
+    return preference_id
+
+
+def save_batch_exported_document(logger, settings, audit_id, export_format, export_filename, export_path,
+                                 run_summary):
+    """
+    Give a document exported by export_documents its export filename and record the outcome of its export
+    :param logger:           the logger
+    :param settings:         Settings from command line and configuration file
+    :param audit_id:         Unique audit UUID
+    :param export_format:    'pdf' or 'docx' string
+    :param export_filename:  String indicating what to name the exported audit file
+    :param export_path:      path the document was downloaded to, None if the export failed
+    :param run_summary:      RunSummary collecting timings of the current run
+    :return:                 True if the document was exported, otherwise False
+    """
+    if export_path is None:
+        logger.error('Unable to export {0} as {1}'.format(audit_id, export_format))
+        run_summary.record_failure(export_format, audit_id, 'Unable to export audit')
+        return False
+    file_path = os.path.join(settings[EXPORT_PATH], export_filename + '.' + export_format)
+    if os.path.isfile(file_path):
+        logger.info('Overwriting existing report at ' + file_path)
+    # the batch directory is in the export path, so the existing report is replaced atomically
+    if hasattr(os, 'replace'):
+        os.replace(export_path, file_path)
+    else:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        os.rename(export_path, file_path)
+    run_summary.add_bytes_written(export_format, os.path.getsize(file_path))
+    return True
+
+
+def is_audit_json_needed(settings, audit):
+    """
+    :param settings:  Settings from command line and configuration file
+    :param audit:     Audit search result
+    :return:          True if the audit JSON must be downloaded to export the audit in the formats of the settings
+    """
+    if 'template_id' not in audit or settings[FILENAME_ITEM_ID] is not None:
+        return True
+    return any(export_format in AUDIT_JSON_EXPORT_FORMATS for export_format in settings[EXPORT_FORMATS])
+
+
+def export_audit_pdf_word(logger, sc_client, settings, audit_id, preference_id, export_format, export_filename,
+                          run_summary=None):
     """
     Save Audit to disk in PDF or MS Word format
     :param logger:      The logger
@@ -819,37 +1328,65 @@ def export_audit_pdf_word(logger, sc_client, settings, audit_id, preference_id,
     :param preference_id:   Unique preference UUID
     :param export_format:       'pdf' or 'docx' string
     :param export_filename:     String indicating what to name the exported audit file
-    """
-    export_doc = sc_client.get_export(audit_id, preference_id, export_format)
-    save_exported_document(logger, settings[EXPORT_PATH], export_doc, export_filename, export_format)
+    :param run_summary: RunSummary collecting timings of the current run
+    :return:            True if the document was exported, otherwise False
+    """
+    run_summary = run_summary or rs.RunSummary()
+    bytes_written = None
+    with run_summary.stage('export_queue_wait'):
+        export_job = sc_client.get_export_job_id(audit_id, preference_id, export_format)
+        export_href = sc_client.poll_for_export(audit_id, export_job['messageId']) if export_job else None
+    if export_href is not None:
+        bytes_written = download_exported_document(logger, sc_client, settings, export_href, export_filename,
+                                                   export_format)
+    if bytes_written is None:
+        logger.error('Unable to export {0} as {1}'.format(audit_id, export_format))
+        run_summary.record_failure(export_format, audit_id, 'Unable to export audit')
+        return False
+    run_summary.add_bytes_written(export_format, bytes_written)
+    return True
 
 
-def export_audit_json(logger, settings, audit_json, export_filename):
+def export_audit_json(logger, settings, audit_json, export_filename, run_summary=None):
     """
     Save audit JSON to disk
     :param logger:      The logger
     :param settings:    Settings from the command line and configuration file
     :param audit_json:  Audit JSON
     :param export_filename:     String indicating what to name the exported audit file
+    :param run_summary: RunSummary collecting timings of the current run
     """
+    run_summary = run_summary or rs.RunSummary()
     export_format = 'json'
     export_doc = json.dumps(audit_json, indent=4)
-    save_exported_document(logger, settings[EXPORT_PATH], export_doc.encode(), export_filename, export_format)
+    bytes_written = save_exported_document(logger, settings[EXPORT_PATH], export_doc.encode(), export_filename,
+                                           export_format)
+    run_summary.add_bytes_written(export_format, bytes_written or 0)
 
 
-def export_audit_csv(settings, audit_json):
+def export_audit_csv(settings, audit_json, run_summary=None):
     """
     Save audit CSV to disk.
     :param settings:    Settings from command line and configuration file
     :param audit_json:  Audit JSON
+    :param run_summary: RunSummary collecting timings of the current run
     """
-    csv_exporter = csvExporter.CsvExporter(audit_json, settings[EXPORT_INACTIVE_ITEMS_TO_CSV])
+    run_summary = run_summary or rs.RunSummary()
+    profiler = settings.get(PROFILER)
+    if profiler is not None and profiler.sample_limit is not None:
+        with profiler.sample():
+            csv_exporter = csvExporter.CsvExporter(audit_json, settings[EXPORT_INACTIVE_ITEMS_TO_CSV])
+    else:
+        csv_exporter = csvExporter.CsvExporter(audit_json, settings[EXPORT_INACTIVE_ITEMS_TO_CSV])
     csv_export_filename = audit_json['template_id']
-    csv_exporter.append_converted_audit_to_bulk_export_file(
-        os.path.join(settings[EXPORT_PATH], csv_export_filename + '.csv'))
+    csv_export_path = os.path.join(settings[EXPORT_PATH], csv_export_filename + '.csv')
+    size_before = os.path.getsize(csv_export_path) if os.path.isfile(csv_export_path) else 0
+    csv_exporter.append_converted_audit_to_bulk_export_file(csv_export_path)
+    if os.path.isfile(csv_export_path):
+        run_summary.add_bytes_written('csv', os.path.getsize(csv_export_path) - size_before)
 
 
-def export_audit_media(logger, sc_client, settings, audit_json, audit_id, export_filename):
+def export_audit_media(logger, sc_client, settings, audit_json, audit_id, export_filename, run_summary=None):
     """
     Save audit media files to disk
     :param logger:      The logger
@@ -858,15 +1395,21 @@ def export_audit_media(logger, sc_client, settings, audit_json, audit_id, export
     :param audit_json:  Audit JSON
     :param audit_id:    Unique audit UUID
     :param export_filename:     String indicating what to name the exported audit file
+    :param run_summary: RunSummary collecting timings of the current run
     """
+    run_summary = run_summary or rs.RunSummary()
     media_export_path = os.path.join(settings[EXPORT_PATH], 'media', export_filename)
     extension = 'jpg'
     media_id_list = get_media_from_audit(logger, audit_json)
     for media_id in media_id_list:
         logger.info("Saving media_{0} to disc.".format(media_id))
-        media_file = sc_client.get_media(audit_id, media_id)
-        media_export_filename = media_id
-        save_exported_media_to_file(logger, media_export_path, media_file, media_export_filename, extension)
+        bytes_written = download_media_to_file(logger, sc_client, settings, media_export_path, audit_id, media_id,
+                                               extension)
+        if bytes_written is None:
+            run_summary.record_failure('media', audit_id, 'Unable to save media ' + media_id)
+        else:
+            run_summary.increment(rs.MEDIA_FILES)
+            run_summary.add_bytes_written('media', bytes_written)
 
 
 def export_audit_web_report_link(logger, settings, sc_client, audit_json, audit_id, template_id):
@@ -897,50 +1440,328 @@ def get_media_from_audit(logger, audit_json):
     :param audit_json: single audit JSON
     :return: list of media IDs
     """
-    media_id_list = []
-    for item in audit_json['header_items'] + audit_json['items']:
-        # This condition checks for media attached to question and media type fields.
-        if 'media' in item.keys():
-            for media in item['media']:
-                media_id_list.append(media['media_id'])
-        # This condition checks for media attached to signature and drawing type fields.
-        if 'responses' in item.keys() and 'image' in item['responses'].keys():
-            media_id_list.append(item['responses']['image']['media_id'])
-        # This condition checks for media attached to information type fields.
-        if 'options' in item.keys() and 'media' in item['options'].keys():
-            media_id_list.append(item['options']['media']['media_id'])
+    # Media attached to question and media fields, signature and drawing fields, and information fields
+    media_id_list = models.Audit(audit_json).media_ids
     logger.info("Discovered {0} media files associated with {1}.".format(len(media_id_list), audit_json['audit_id']))
     return media_id_list
 
 
 def loop(logger, sc_client, settings):
     """
-    Loop sync until interrupted by user
+    Loop sync until interrupted by user, waiting between cycles as decided by an AdaptiveScheduler
     :param logger:     the logger
     :param sc_client:  instance of SafetyCulture SDK object
     :param settings:   dictionary containing config settings values
     """
-    sync_delay_in_seconds = settings[SYNC_DELAY_IN_SECONDS]
+    sync_scheduler = scheduler.AdaptiveScheduler(settings[SYNC_DELAY_IN_SECONDS])
     while True:
-        sync_exports(logger, settings, sc_client)
-        logger.info('Next check will be in ' + str(sync_delay_in_seconds) + ' seconds. Waiting...')
+        summary = sync_exports(logger, settings, sc_client)
+        sync_delay_in_seconds = sync_scheduler.next_delay(summary.get(rs.AUDITS_DISCOVERED), summary['backlog'],
+                                                          summary['next_eligible_at'])
+        logger.info('Next check will be in ' + str(int(round(sync_delay_in_seconds))) + ' seconds. Waiting...')
         time.sleep(sync_delay_in_seconds)
 
 
+def plan_shards(logger, settings, sc_client, shard_directory):
+    """
+    Split the export of audits modified since the last successful sync, up to now, into shards
+    :param logger:           the logger
+    :param settings:         Settings from command line and configuration file
+    :param sc_client:        instance of SafetyCulture SDK object
+    :param shard_directory:  directory to save the plan to
+    :return:                 the plan dictionary, None if the templates could not be discovered
+    """
+    modified_after = get_last_successful(logger, get_state_path(settings, SYNC_MARKER_FILENAME))
+    modified_before = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    template_ids = None
+    if settings[SHARD_BY] == 'template':
+        templates = sc_client.template_cache.get_templates()
+        if templates is None:
+            logger.error('Unable to discover templates to shard by')
+            return None
+        template_ids = list(templates.keys())
+    export_formats = [export_format for export_format in settings[EXPORT_FORMATS] if export_format != 'actions']
+    plan = sharding.create_plan(shard_directory, modified_after, modified_before, settings[SHARDS], export_formats,
+                                template_ids)
+    logger.info('Split the export of audits modified between {0} and {1} into {2} shards by {3}'.format(
+        modified_after, modified_before, len(plan['shards']), settings[SHARD_BY]))
+    return plan
+
+
+def sync_shard(logger, settings, sc_client, shard_directory, plan, shard):
+    """
+    Export every audit of a shard into the shard's own exports directory. Each shard, and each template of a shard
+    sharded by template, has its own sync marker, so an interrupted shard resumes where it stopped.
+    :param logger:           the logger
+    :param settings:         Settings from command line and configuration file
+    :param sc_client:        instance of SafetyCulture SDK object
+    :param shard_directory:  directory of the shard plan
+    :param plan:             the plan dictionary
+    :param shard:            the shard to export
+    :return:                 True if every audit of the shard has been exported or deferred
+    """
+    shard_path = sharding.get_shard_path(shard_directory, shard)
+    for template_id in shard['template_ids'] or [None]:
+        shard_settings = dict(settings)
+        shard_settings.update({
+            STATE_DIRECTORY: shard_path if template_id is None else os.path.join(shard_path, template_id),
+            EXPORT_PATH: os.path.join(shard_path, sharding.SHARD_EXPORTS_DIRECTORY),
+            EXPORT_FORMATS: plan['export_formats'],
+            MODIFIED_BEFORE: shard['modified_before'],
+            TEMPLATE_ID: template_id
+        })
+        create_directory_if_not_exists(logger, shard_settings[STATE_DIRECTORY])
+        create_directory_if_not_exists(logger, shard_settings[EXPORT_PATH])
+        sync_marker_path = get_state_path(shard_settings, SYNC_MARKER_FILENAME)
+        if not os.path.isfile(sync_marker_path):
+            update_sync_marker_file(shard['modified_after'], sync_marker_path)
+        while True:
+            summary = sync_exports(logger, shard_settings, sc_client)
+            if rs.AUDITS_DISCOVERED not in summary:
+                return False
+            if summary['backlog'] == 0:
+                break
+            if summary[rs.AUDITS_PROCESSED] + summary[rs.AUDITS_SKIPPED] == 0:
+                return False
+    return True
+
+
+def run_shard_worker(logger, settings, sc_client, shard_directory):
+    """
+    Lease and export shards of the plan in shard_directory until none is left that this worker can lease.
+    A shard that fails is left to other workers.
+    :param logger:           the logger
+    :param settings:         Settings from command line and configuration file
+    :param sc_client:        instance of SafetyCulture SDK object
+    :param shard_directory:  directory of the shard plan
+    :return:                 number of shards exported by this worker
+    """
+    plan = sharding.load_plan(shard_directory)
+    worker_id = sharding.get_worker_id()
+    failed_shard_ids = set()
+    shards_exported = 0
+    while True:
+        lease = None
+        for shard in plan['shards']:
+            if shard['shard_id'] in failed_shard_ids or sharding.is_done(shard_directory, shard):
+                continue
+            lease = sharding.ShardLease(shard_directory, shard, worker_id)
+            if lease.acquire():
+                break
+            lease = None
+        if lease is None:
+            return shards_exported
+        logger.info('Worker {0} exporting {1}'.format(worker_id, shard['shard_id']))
+        try:
+            with lease.keep_alive():
+                exported = sync_shard(logger, settings, sc_client, shard_directory, plan, shard)
+            if exported:
+                sharding.mark_done(shard_directory, shard)
+                shards_exported += 1
+            else:
+                logger.error('Unable to export {0}, leaving it to other workers'.format(shard['shard_id']))
+                failed_shard_ids.add(shard['shard_id'])
+        finally:
+            lease.release()
+
+
+def shard_worker_process(path_to_config_file, shard_directory):
+    """
+    Entry point of the worker processes started by run_sharded
+    :param path_to_config_file:  path to config file
+    :param shard_directory:      directory of the shard plan
+    """
+    logger = logging.getLogger('exporter_logger')
+    # forked workers inherit the handlers of the coordinator
+    if not logger.handlers:
+        logger = configure_logger()
+    sc_client, settings = configure(logger, path_to_config_file, [])
+    run_shard_worker(logger, settings, sc_client, shard_directory)
+
+
+def merge_shards(logger, settings, shard_directory, plan):
+    """
+    Merge the exports of every shard into the export path in shard order, move the audits the shards deferred to
+    the deferred audit queue, and move the sync marker to the end of the sharded range
+    :param logger:           the logger
+    :param settings:         Settings from command line and configuration file
+    :param shard_directory:  directory of the shard plan
+    :param plan:             the plan dictionary
+    """
+    deferred_audits = dq.DeferredAuditQueue(get_state_path(settings, DEFERRED_AUDITS_FILENAME))
+    for shard in plan['shards']:
+        shard_path = sharding.get_shard_path(shard_directory, shard)
+        if os.path.isfile(os.path.join(shard_path, sharding.MERGED_FILENAME)):
+            continue
+        merged_files = sharding.merge_exports(os.path.join(shard_path, sharding.SHARD_EXPORTS_DIRECTORY),
+                                              settings[EXPORT_PATH])
+        for template_id in shard['template_ids'] or [None]:
+            state_directory = shard_path if template_id is None else os.path.join(shard_path, template_id)
+            shard_deferred_audits = dq.DeferredAuditQueue(os.path.join(state_directory, DEFERRED_AUDITS_FILENAME))
+            for audit in shard_deferred_audits.pop_eligible(float('inf')):
+                deferred_audits.push(audit, get_media_sync_eligible_time(settings, audit))
+        open(os.path.join(shard_path, sharding.MERGED_FILENAME), 'w').close()
+        logger.info('Merged {0} files of {1}'.format(merged_files, shard['shard_id']))
+    update_sync_marker_file(plan['modified_before'], get_state_path(settings, SYNC_MARKER_FILENAME))
+    shutil.rmtree(shard_directory)
+
+
+def run_sharded(logger, path_to_config_file, sc_client, settings):
+    """
+    Export audits in shards: create a plan or resume the existing one, export the shards from worker processes
+    and from this process, wait for shards leased by workers on other nodes, and merge the shards once all are done
+    :param logger:               the logger
+    :param path_to_config_file:  path to config file, passed on to the worker processes
+    :param sc_client:            instance of SafetyCulture SDK object
+    :param settings:             Settings from command line and configuration file
+    """
+    import multiprocessing
+    if settings.get(TEMPLATES):
+        logger.error('Sharded exports cannot be combined with the templates setting, use --shard-by template instead')
+        sys.exit(1)
+    shard_directory = settings.get(SHARD_DIRECTORY) or get_state_path(settings, DEFAULT_SHARD_DIRECTORY)
+    plan = sharding.load_plan(shard_directory)
+    if settings.get(SHARD_WORKER_ONLY):
+        if plan is None:
+            logger.error('No shard plan found in ' + shard_directory)
+            sys.exit(1)
+        logger.info('Exported {0} shards'.format(run_shard_worker(logger, settings, sc_client, shard_directory)))
+        return
+    if plan is None:
+        plan = plan_shards(logger, settings, sc_client, shard_directory)
+        if plan is None:
+            sys.exit(1)
+    else:
+        logger.info('Resuming the sharded export in ' + shard_directory)
+    if 'actions' in settings[EXPORT_FORMATS]:
+        export_actions(logger, settings, sc_client)
+
+    worker_count = settings.get(SHARD_WORKERS)
+    if worker_count is None:
+        worker_count = len(plan['shards'])
+    workers = [multiprocessing.Process(target=shard_worker_process, args=(path_to_config_file, shard_directory))
+               for _ in range(worker_count)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    while True:
+        run_shard_worker(logger, settings, sc_client, shard_directory)
+        remaining_shards = [shard for shard in plan['shards'] if not sharding.is_done(shard_directory, shard)]
+        if not remaining_shards:
+            break
+        if not any(sharding.is_leased(shard_directory, shard) for shard in remaining_shards):
+            logger.error('{0} shards could not be exported, run the exporter again to resume'.format(
+                len(remaining_shards)))
+            sys.exit(1)
+        logger.info('Waiting for {0} shards exported by other workers'.format(len(remaining_shards)))
+        time.sleep(SHARD_POLL_INTERVAL_IN_SECONDS)
+    merge_shards(logger, settings, shard_directory, plan)
+    logger.info('Completed sharded export of {0} shards'.format(len(plan['shards'])))
+
+
+def sync_tenant(tenant):
+    """
+    Sync a single tenant once
+    :param tenant:  the Tenant
+    :return:        number of seconds to wait before syncing the tenant again
+    """
+    summary = sync_exports(tenant.logger, tenant.settings, tenant.sc_client)
+    return tenant.scheduler.next_delay(summary.get(rs.AUDITS_DISCOVERED), summary['backlog'],
+                                       summary['next_eligible_at'])
+
+
+def run(logger, sc_client, settings, loop_enabled):
+    """
+    Sync once or loop until interrupted, profiling the run if requested on the command line
+    :param logger:        the logger
+    :param sc_client:     instance of SafetyCulture SDK object
+    :param settings:      dictionary containing config settings values
+    :param loop_enabled:  if True, loop sync until interrupted
+    """
+    run_profiled(logger, [settings], lambda: sync_or_loop(logger, sc_client, settings, loop_enabled))
+
+
+def run_tenants(logger, tenants, loop_enabled):
+    """
+    Sync several tenants once or loop until interrupted, profiling the run if requested on the command line.
+    Profiled runs sync one tenant at a time.
+    :param logger:        the logger
+    :param tenants:       list of Tenant
+    :param loop_enabled:  if True, loop sync until interrupted
+    """
+    settings = tenants[0].settings
+    max_workers = 1 if settings.get(PROFILE_PATH) is not None else settings[MAX_CONCURRENT_TENANTS]
+    runner = tn.TenantRunner(tenants, sync_tenant, max_workers)
+    run_profiled(logger, [tenant.settings for tenant in tenants], lambda: runner.run(loop_enabled))
+    if not loop_enabled:
+        logger.info('Completed sync process, exiting')
+
+
+def run_profiled(logger, settings_list, function):
+    """
+    Call function, profiling it if requested on the command line
+    :param logger:         the logger
+    :param settings_list:  settings of every tenant the function syncs, the profiler is added to each of them
+    :param function:       function to call
+    """
+    settings = settings_list[0]
+    profiler = None
+    if settings.get(PROFILE_PATH) is not None:
+        try:
+            profiler = profiling.Profiler(settings[PROFILE_PATH], settings.get(PROFILE_SAMPLE_AUDITS))
+        except ImportError as ex:
+            log_critical_error(logger, ex, 'Unable to start profiler')
+            sys.exit(1)
+        for tenant_settings in settings_list:
+            tenant_settings[PROFILER] = profiler
+
+    try:
+        if profiler is not None and profiler.sample_limit is None:
+            with profiler.profile():
+                function()
+            logger.info('Profile written to ' + profiler.output_path)
+        else:
+            function()
+    finally:
+        if profiler is not None and profiler.sample_limit is not None and profiler.close():
+            logger.info('Profile of {0} CSV conversions written to {1}'.format(profiler.samples_taken,
+                                                                              profiler.output_path))
+
+
+def sync_or_loop(logger, sc_client, settings, loop_enabled):
+    if loop_enabled:
+        loop(logger, sc_client, settings)
+    else:
+        sync_exports(logger, settings, sc_client)
+        logger.info('Completed sync process, exiting')
+
+
 def main():
     try:
         logger = configure_logger()
-        path_to_config_file, export_formats, preferences_to_list, loop_enabled = parse_command_line_arguments(logger)
-        sc_client, settings = configure(logger, path_to_config_file, export_formats)
+        config_filenames, export_formats, preferences_to_list, loop_enabled, command_line_options = \
+            parse_command_line_arguments(logger)
+        if len(config_filenames) > 1:
+            if preferences_to_list is not None:
+                logger.error('--list_preferences takes a single config file')
+                sys.exit(1)
+            run_tenants(logger, configure_tenants(logger, config_filenames, export_formats, command_line_options),
+                        loop_enabled)
+            return
+        sc_client, settings = configure(logger, config_filenames[0], export_formats, command_line_options)
+        if settings.get(SHARDS) is not None or settings.get(SHARD_WORKER_ONLY):
+            run_sharded(logger, config_filenames[0], sc_client, settings)
+            return
 
         if preferences_to_list is not None:
             show_preferences_and_exit(preferences_to_list, sc_client)
 
-        if loop_enabled:
-            loop(logger, sc_client, settings)
+        if settings.get(TEMPLATES):
+            run_tenants(logger, create_tenants(logger, None, settings, sc_client), loop_enabled)
         else:
-            sync_exports(logger, settings, sc_client)
-            logger.info('Completed sync process, exiting')
+            run(logger, sc_client, settings, loop_enabled)
 
     except KeyboardInterrupt:
         print("Interrupted by user, exiting.")
@@ -0,0 +1,101 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import cProfile
+from contextlib import contextmanager
+
+# Profiles written to a file ending with this suffix are in the speedscope format (requires pyinstrument),
+# all other files are written in the pstats format
+SPEEDSCOPE_SUFFIX = '.speedscope.json'
+
+DEFAULT_PROFILE_FILENAME = 'exporter_profile.pstats'
+
+
+class Profiler:
+    """
+    Opt-in profiler for the exporter tools, writing a pstats file readable with the pstats module or snakeviz,
+    or a speedscope file when the output path ends with SPEEDSCOPE_SUFFIX and pyinstrument is installed.
+
+    Either profile a whole run with profile(), or only the first sample_limit calls wrapped in sample().
+    """
+
+    def __init__(self, output_path, sample_limit=None):
+        """
+        :param output_path:   file to write the profile to
+        :param sample_limit:  number of calls to sample() to profile, None to profile nothing but profile() blocks
+        """
+        self.output_path = output_path
+        self.sample_limit = sample_limit
+        self.samples_taken = 0
+        self.speedscope = output_path.endswith(SPEEDSCOPE_SUFFIX)
+        if self.speedscope:
+            try:
+                from pyinstrument import Profiler as SamplingProfiler
+            except ImportError:
+                raise ImportError('pyinstrument is required to write speedscope profiles: pip install pyinstrument')
+            self.profiler = SamplingProfiler()
+        else:
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        if self.speedscope:
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.speedscope:
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+    @contextmanager
+    def profile(self):
+        """
+        Profile the enclosed block and save the profile when it exits, even if it raised
+        """
+        self.start()
+        try:
+            yield
+        finally:
+            self.stop()
+            self.save()
+
+    @contextmanager
+    def sample(self):
+        """
+        Profile the enclosed block if fewer than sample_limit samples have been taken so far.
+        The profile is saved once the limit is reached.
+        """
+        if self.sample_limit is None or self.samples_taken >= self.sample_limit:
+            yield
+            return
+        self.start()
+        try:
+            yield
+        finally:
+            self.stop()
+            self.samples_taken += 1
+            if self.samples_taken == self.sample_limit:
+                self.save()
+
+    def save(self):
+        """
+        Write the profile collected so far to output_path
+        """
+        if self.speedscope:
+            from pyinstrument.renderers import SpeedscopeRenderer
+            with open(self.output_path, 'w') as profile_file:
+                profile_file.write(self.profiler.output(renderer=SpeedscopeRenderer()))
+        else:
+            self.profiler.dump_stats(self.output_path)
+
+    def close(self):
+        """
+        Save the samples taken so far if the run ended before sample_limit was reached
+        :return:  True if a sample profile has been saved, at any point, otherwise False
+        """
+        if self.sample_limit is not None and 0 < self.samples_taken < self.sample_limit:
+            self.save()
+        return self.samples_taken > 0
@@ -0,0 +1,185 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# audits processed, skipped because of the media sync offset, or failed
+AUDITS_PROCESSED = 'audits_processed'
+AUDITS_SKIPPED = 'audits_skipped'
+AUDITS_FAILED = 'audits_failed'
+MEDIA_FILES = 'media_files'
+
+# audits returned by the audit search, only counted when the search succeeded
+AUDITS_DISCOVERED = 'audits_discovered'
+
+# audits exported from the deferred queue, also counted in AUDITS_PROCESSED
+DEFERRED_AUDITS_PROCESSED = 'deferred_audits_processed'
+
+
+class RunSummary:
+    """
+    Collects per-stage timings and counters of a single exporter run, and optionally emits them as JSON lines.
+
+    Stages are named after what they time: the export formats (pdf, docx, json, csv, media, web-report-link,
+    actions), plus discovery, audit_json and export_queue_wait (time an export job spends waiting to complete,
+    which is also counted in the pdf/docx stage it belongs to).
+    """
+
+    def __init__(self, json_lines_path=None):
+        """
+        :param json_lines_path:  file to append one JSON object per event to, None to keep the summary in memory
+        """
+        self.json_lines_path = json_lines_path
+        self.start_time = time.time()
+        self.end_time = None
+        self.stages = {}
+        self.counters = {AUDITS_PROCESSED: 0, AUDITS_SKIPPED: 0, AUDITS_FAILED: 0, MEDIA_FILES: 0}
+        self.failures = []
+        self.next_eligible_at = None
+        self.deferred_audits = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the enclosed block and add it to the total of stage 'name'
+        :param name:  name of the stage
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.time() - start)
+
+    def stage_stats(self, name):
+        """
+        Must be called with the lock held
+        :param name:  name of the stage
+        :return:      statistics dictionary of the stage, created if needed
+        """
+        if name not in self.stages:
+            self.stages[name] = {'seconds': 0.0, 'count': 0, 'bytes_written': 0}
+        return self.stages[name]
+
+    def add_stage_time(self, name, seconds):
+        with self.lock:
+            stats = self.stage_stats(name)
+            stats['seconds'] += seconds
+            stats['count'] += 1
+
+    def add_bytes_written(self, name, number_of_bytes):
+        """
+        :param name:             stage that wrote the bytes
+        :param number_of_bytes:  number of bytes written to disk
+        """
+        with self.lock:
+            self.stage_stats(name)['bytes_written'] += number_of_bytes
+
+    def increment(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def defer(self, audit_id, eligible_at):
+        """
+        Count an audit skipped because it is not yet eligible for export
+        :param audit_id:     the skipped audit
+        :param eligible_at:  POSIX timestamp at which the audit becomes eligible
+        """
+        with self.lock:
+            self.counters[AUDITS_SKIPPED] += 1
+            if self.next_eligible_at is None or eligible_at < self.next_eligible_at:
+                self.next_eligible_at = eligible_at
+        self.emit('deferred', audit_id=audit_id, eligible_at=eligible_at)
+
+    def set_deferred(self, deferred_audits, next_eligible_at):
+        """
+        Record the state of the deferred audit queue at the end of the run
+        :param deferred_audits:   number of audits waiting in the queue
+        :param next_eligible_at:  POSIX timestamp at which the first of them becomes eligible, None if there are none
+        """
+        with self.lock:
+            self.deferred_audits = deferred_audits
+            self.next_eligible_at = next_eligible_at
+
+    def record_failure(self, stage, audit_id, message):
+        """
+        :param stage:     stage that failed
+        :param audit_id:  audit the failure relates to, if any
+        :param message:   description of the failure
+        """
+        failure = {'stage': stage, 'audit_id': audit_id, 'message': message}
+        with self.lock:
+            self.failures.append(failure)
+        self.emit('failure', **failure)
+
+    def emit(self, event, **fields):
+        """
+        Append an event to the JSON lines file, if any
+        :param event:   name of the event
+        :param fields:  further properties of the event
+        """
+        if self.json_lines_path is None:
+            return
+        fields['event'] = event
+        fields['timestamp'] = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        line = json.dumps(fields, sort_keys=True) + '\n'
+        with self.lock:
+            with open(self.json_lines_path, 'a') as json_lines_file:
+                json_lines_file.write(line)
+
+    def finish(self):
+        """
+        Stop the run clock and emit the summary
+        :return:  the summary dictionary
+        """
+        self.end_time = time.time()
+        summary = self.as_dict()
+        self.emit('run_summary', **summary)
+        return summary
+
+    def as_dict(self):
+        """
+        :return:  dictionary with the run duration, audits per second, counters, failures, stage statistics, the
+                  number of discovered audits left unprocessed (backlog), the number of deferred audits and when
+                  the first of them becomes eligible (next_eligible_at)
+        """
+        with self.lock:
+            duration = (self.end_time or time.time()) - self.start_time
+            summary = dict(self.counters)
+            summary['duration_in_seconds'] = round(duration, 3)
+            summary['audits_per_second'] = round(self.counters[AUDITS_PROCESSED] / duration, 3) if duration else 0
+            summary['bytes_written'] = sum(stats['bytes_written'] for stats in self.stages.values())
+            summary['failures'] = len(self.failures)
+            discovered_audits_processed = self.counters[AUDITS_PROCESSED] - \
+                self.counters.get(DEFERRED_AUDITS_PROCESSED, 0)
+            summary['backlog'] = max(0, self.counters.get(AUDITS_DISCOVERED, 0) - discovered_audits_processed -
+                                     self.counters[AUDITS_SKIPPED])
+            summary['deferred_audits'] = self.deferred_audits
+            summary['next_eligible_at'] = self.next_eligible_at
+            summary['stages'] = dict((name, {
+                'seconds': round(stats['seconds'], 3),
+                'count': stats['count'],
+                'bytes_written': stats['bytes_written']
+            }) for name, stats in self.stages.items())
+            return summary
+
+    def log(self, logger):
+        """
+        Write a human readable summary to the log, slowest stage first
+        :param logger:  the logger
+        """
+        summary = self.as_dict()
+        logger.info('Run summary: {0} audits processed, {1} skipped, {2} failed, {3} media files, {4} bytes written '
+                    'in {5} seconds ({6} audits/second)'.format(summary[AUDITS_PROCESSED], summary[AUDITS_SKIPPED],
+                                                                summary[AUDITS_FAILED], summary[MEDIA_FILES],
+                                                                summary['bytes_written'],
+                                                                summary['duration_in_seconds'],
+                                                                summary['audits_per_second']))
+        for name, stats in sorted(summary['stages'].items(), key=lambda stage: -stage[1]['seconds']):
+            logger.info('  {0:<18} {1:>10.3f} s {2:>7} calls {3:>14} bytes'.format(
+                name, stats['seconds'], stats['count'], stats['bytes_written']))
@@ -0,0 +1,68 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import time
+
+# Shortest wait between two sync cycles, used while discovered audits are left to process
+DEFAULT_MIN_DELAY_IN_SECONDS = 60
+
+# Longest wait between two sync cycles, reached by backing off while searches find no audits
+DEFAULT_MAX_DELAY_IN_SECONDS = 3600
+
+# Factor the wait grows by after every sync cycle that found no audits
+IDLE_BACKOFF_FACTOR = 2
+
+# Wait this much longer than the eligibility time of a deferred audit, so it is past its media sync offset
+ELIGIBILITY_MARGIN_IN_SECONDS = 1
+
+
+class AdaptiveScheduler:
+    """
+    Decides how long the exporter waits between sync cycles, based on the outcome of the last cycle:
+
+    - while discovered audits are left unprocessed (more than one page of results, or a cycle stopped by a
+      failure), the next cycle starts after min_delay_in_seconds
+    - when the search finds no audits, the wait grows by IDLE_BACKOFF_FACTOR every cycle, up to
+      max_delay_in_seconds
+    - otherwise the configured sync delay is used
+    - when audits were skipped because of the media sync offset, the next cycle starts no later than when the
+      first of them becomes eligible
+    """
+
+    def __init__(self, sync_delay_in_seconds, min_delay_in_seconds=DEFAULT_MIN_DELAY_IN_SECONDS,
+                 max_delay_in_seconds=DEFAULT_MAX_DELAY_IN_SECONDS):
+        """
+        :param sync_delay_in_seconds:  configured wait between two cycles
+        :param min_delay_in_seconds:   wait while there is a backlog, never more than sync_delay_in_seconds
+        :param max_delay_in_seconds:   longest wait when idle, never less than sync_delay_in_seconds
+        """
+        self.sync_delay = sync_delay_in_seconds
+        self.min_delay = min(min_delay_in_seconds, sync_delay_in_seconds)
+        self.max_delay = max(max_delay_in_seconds, sync_delay_in_seconds)
+        self.idle_delay = sync_delay_in_seconds
+
+    def next_delay(self, audits_discovered, backlog=0, next_eligible_at=None, now=None):
+        """
+        :param audits_discovered:  number of audits the last search returned, None if no search succeeded
+        :param backlog:            number of discovered audits left unprocessed by the last cycle
+        :param next_eligible_at:   POSIX timestamp at which the first deferred audit becomes eligible, if any
+        :param now:                current POSIX timestamp, defaults to time.time()
+        :return:                   number of seconds to wait before the next cycle
+        """
+        if audits_discovered is None:
+            delay = self.sync_delay
+        elif backlog:
+            delay = self.min_delay
+            self.idle_delay = self.sync_delay
+        elif audits_discovered == 0:
+            delay = self.idle_delay
+            self.idle_delay = min(self.idle_delay * IDLE_BACKOFF_FACTOR, self.max_delay)
+        else:
+            delay = self.sync_delay
+            self.idle_delay = self.sync_delay
+
+        if next_eligible_at is not None:
+            now = time.time() if now is None else now
+            delay = min(delay, max(0, next_eligible_at - now) + ELIGIBILITY_MARGIN_IN_SECONDS)
+        return delay
@@ -0,0 +1,286 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import errno
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+# Files kept in the shard directory, shared by every worker taking part in a sharded export
+PLAN_FILENAME = 'plan.json'
+LEASE_FILENAME = 'lease'
+DONE_FILENAME = 'done'
+MERGED_FILENAME = 'merged'
+
+# Directory of a shard that its audits are exported to, merged into the export path once every shard is done
+SHARD_EXPORTS_DIRECTORY = 'exports'
+
+# Precision of audit modified_at values. discover_audits excludes both ends of a modified_at range, so the end of a
+# shard is moved this much later for the shard to include audits modified exactly at its end.
+MODIFIED_AT_PRECISION = timedelta(milliseconds=1)
+
+# A lease not renewed for this long is considered abandoned and may be taken over by another worker
+DEFAULT_LEASE_TTL_IN_SECONDS = 300
+
+
+def parse_date(date):
+    """
+    :param date:  ISO date in UTC, as found in audit modified_at values
+    :return:      naive datetime in UTC
+    """
+    import dateutil.parser
+    return dateutil.parser.parse(date).replace(tzinfo=None)
+
+
+def format_date(date):
+    """
+    :param date:  naive datetime in UTC
+    :return:      ISO date with milliseconds, as found in audit modified_at values
+    """
+    return date.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def include_end(modified_before):
+    """
+    :param modified_before:  ISO date, the last modified_at value a shard includes
+    :return:                 modified_before bound that discover_audits needs to include audits modified at that date
+    """
+    return format_date(parse_date(modified_before) + MODIFIED_AT_PRECISION)
+
+
+def split_time_range(modified_after, modified_before, shard_count):
+    """
+    Split a modified_at range into consecutive ranges of equal duration. Every range excludes its start and includes
+    its end, so an audit modified exactly at the end of a range is exported by that range only.
+    :param modified_after:   start of the range, ISO date as used in the sync marker
+    :param modified_before:  end of the range, ISO date
+    :param shard_count:      number of ranges
+    :return:                 list of (modified_after, modified_before) tuples to pass to discover_audits, in order
+    """
+    start = parse_date(modified_after)
+    duration = parse_date(modified_before) - start
+    boundaries = [modified_after]
+    for index in range(1, shard_count):
+        boundaries.append(format_date(start + duration * index // shard_count))
+    boundaries.append(modified_before)
+    return [(start_date, include_end(end_date)) for start_date, end_date in zip(boundaries[:-1], boundaries[1:])]
+
+
+def split_templates(template_ids, shard_count):
+    """
+    Deal templates out to shards
+    :param template_ids:  IDs of the templates to export
+    :param shard_count:   number of shards
+    :return:              list of non-empty lists of template IDs
+    """
+    template_ids = sorted(template_ids)
+    shards = [template_ids[index::shard_count] for index in range(shard_count)]
+    return [shard for shard in shards if shard]
+
+
+def create_plan(shard_directory, modified_after, modified_before, shard_count, export_formats, template_ids=None):
+    """
+    Split an export into shards and save the plan to the shard directory
+    :param shard_directory:  directory shared by every worker
+    :param modified_after:   audits modified after this ISO date are exported
+    :param modified_before:  audits modified before this ISO date are exported
+    :param shard_count:      number of shards
+    :param export_formats:   formats every worker exports
+    :param template_ids:     split this list of templates between the shards rather than the time range
+    :return:                 the plan dictionary
+    """
+    shards = []
+    if template_ids is None:
+        for modified_range in split_time_range(modified_after, modified_before, shard_count):
+            shards.append({'modified_after': modified_range[0], 'modified_before': modified_range[1],
+                           'template_ids': None})
+    else:
+        for shard_template_ids in split_templates(template_ids, shard_count):
+            shards.append({'modified_after': modified_after, 'modified_before': include_end(modified_before),
+                           'template_ids': shard_template_ids})
+    for index, shard in enumerate(shards):
+        shard['shard_id'] = 'shard_{0:04d}'.format(index)
+    plan = {'modified_after': modified_after, 'modified_before': modified_before, 'export_formats': export_formats,
+            'shards': shards}
+    if not os.path.isdir(shard_directory):
+        os.makedirs(shard_directory)
+    temp_path = os.path.join(shard_directory, PLAN_FILENAME + '.tmp')
+    with open(temp_path, 'w') as plan_file:
+        json.dump(plan, plan_file, indent=4, sort_keys=True)
+    os.rename(temp_path, os.path.join(shard_directory, PLAN_FILENAME))
+    return plan
+
+
+def load_plan(shard_directory):
+    """
+    :param shard_directory:  directory shared by every worker
+    :return:                 the plan dictionary, None if no plan has been created
+    """
+    plan_path = os.path.join(shard_directory, PLAN_FILENAME)
+    if not os.path.isfile(plan_path):
+        return None
+    with open(plan_path, 'r') as plan_file:
+        return json.load(plan_file)
+
+
+def get_shard_path(shard_directory, shard, filename=None):
+    path = os.path.join(shard_directory, shard['shard_id'])
+    return path if filename is None else os.path.join(path, filename)
+
+
+def is_done(shard_directory, shard):
+    return os.path.isfile(get_shard_path(shard_directory, shard, DONE_FILENAME))
+
+
+def mark_done(shard_directory, shard):
+    open(get_shard_path(shard_directory, shard, DONE_FILENAME), 'w').close()
+
+
+def is_leased(shard_directory, shard, ttl_in_seconds=DEFAULT_LEASE_TTL_IN_SECONDS):
+    """
+    :return:  True if a worker holds a lease on the shard that has been renewed within ttl_in_seconds
+    """
+    try:
+        return time.time() - os.path.getmtime(get_shard_path(shard_directory, shard, LEASE_FILENAME)) <= \
+               ttl_in_seconds
+    except OSError:
+        return False
+
+
+def get_worker_id():
+    """
+    :return:  ID of this worker process, unique across the nodes sharing a shard directory
+    """
+    return '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+
+class ShardLease:
+    """
+    Exclusive claim of a worker on a shard, held as a file in the shard's directory. The lease is created
+    atomically, renewed by updating its modification time, and may be taken over once it has not been renewed
+    for ttl_in_seconds. Nodes sharing the shard directory must have reasonably synchronised clocks.
+    """
+
+    def __init__(self, shard_directory, shard, worker_id, ttl_in_seconds=DEFAULT_LEASE_TTL_IN_SECONDS):
+        """
+        :param shard_directory:  directory shared by every worker
+        :param shard:            the shard to lease
+        :param worker_id:        ID of the worker taking the lease, see get_worker_id
+        :param ttl_in_seconds:   time after which a lease that has not been renewed is abandoned
+        """
+        self.path = get_shard_path(shard_directory, shard, LEASE_FILENAME)
+        self.worker_id = worker_id
+        self.ttl_in_seconds = ttl_in_seconds
+        self.held = False
+
+    def acquire(self):
+        """
+        :return:  True if the lease has been acquired, False if another worker holds it
+        """
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+        for _ in range(2):
+            try:
+                lease_file = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+                if not self.take_over_abandoned_lease():
+                    return False
+                continue
+            os.write(lease_file, self.worker_id.encode('utf-8'))
+            os.close(lease_file)
+            self.held = True
+            return True
+        return False
+
+    def take_over_abandoned_lease(self):
+        """
+        Remove the lease file if it has not been renewed within the TTL. Of several workers doing so at once only
+        one succeeds in moving the file away.
+        :return:  True if the abandoned lease has been removed
+        """
+        try:
+            if time.time() - os.path.getmtime(self.path) <= self.ttl_in_seconds:
+                return False
+            abandoned_path = self.path + '.' + self.worker_id.replace(':', '_')
+            os.rename(self.path, abandoned_path)
+            os.remove(abandoned_path)
+            return True
+        except OSError:
+            return False
+
+    def renew(self):
+        if self.held:
+            os.utime(self.path, None)
+
+    def release(self):
+        if self.held:
+            self.held = False
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    @contextmanager
+    def keep_alive(self):
+        """
+        Renew the lease from a background thread while the enclosed block runs
+        """
+        stopped = threading.Event()
+
+        def renew_until_stopped():
+            while not stopped.wait(self.ttl_in_seconds / 3.0):
+                self.renew()
+
+        renewer = threading.Thread(target=renew_until_stopped)
+        renewer.daemon = True
+        renewer.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            renewer.join()
+
+
+def merge_exports(source_directory, export_path):
+    """
+    Move the files exported by a shard into the export path. CSV files are appended to the existing file of the
+    same name without repeating their header row, every other file replaces the existing one. Files are merged in
+    sorted order, so merging the shards in order always gives the same result.
+    :param source_directory:  exports directory of the shard
+    :param export_path:       export path of the configuration
+    :return:                  number of files merged
+    """
+    merged_files = 0
+    for directory, sub_directories, filenames in os.walk(source_directory):
+        sub_directories.sort()
+        target_directory = os.path.join(export_path, os.path.relpath(directory, source_directory))
+        if not os.path.isdir(target_directory):
+            os.makedirs(target_directory)
+        for filename in sorted(filenames):
+            source_path = os.path.join(directory, filename)
+            target_path = os.path.join(target_directory, filename)
+            if filename.endswith('.csv') and os.path.isfile(target_path) and os.path.getsize(target_path) > 0:
+                with open(source_path, 'rb') as source_file:
+                    source_file.readline()
+                    with open(target_path, 'ab') as target_file:
+                        shutil.copyfileobj(source_file, target_file)
+                os.remove(source_path)
+            else:
+                if os.path.isfile(target_path):
+                    os.remove(target_path)
+                shutil.move(source_path, target_path)
+            merged_files += 1
+    return merged_files
@@ -0,0 +1,121 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import logging
+import threading
+import time
+
+
+class TenantLoggerAdapter(logging.LoggerAdapter):
+    """
+    Prefixes every message with the name of the tenant it relates to
+    """
+
+    def process(self, msg, kwargs):
+        return '[{0}] {1}'.format(self.extra['tenant'], msg), kwargs
+
+
+class Tenant:
+    """
+    A single exporter configuration (API token, settings, sync markers) run alongside others in one process
+    """
+
+    def __init__(self, name, settings, sc_client, logger, sync_scheduler, request_metrics=None):
+        """
+        :param name:                   name of the tenant, used in log messages and metric labels
+        :param settings:               settings of the tenant, with its own state directory and export path
+        :param sc_client:              SafetyCulture client of the tenant, with its own rate limiter
+        :param logger:                 the logger
+        :param sync_scheduler:         AdaptiveScheduler deciding the wait between two sync cycles of the tenant
+        :param request_metrics:        RequestMetrics of the tenant's API requests, if any
+        """
+        self.name = name
+        self.settings = settings
+        self.sc_client = sc_client
+        self.logger = TenantLoggerAdapter(logger, {'tenant': name})
+        self.scheduler = sync_scheduler
+        self.request_metrics = request_metrics
+        self.next_run_at = 0
+        self.runs = 0
+        self.running = False
+
+
+class TenantRunner:
+    """
+    Syncs several tenants on a bounded number of threads. A tenant is never synced twice at the same time, and is
+    synced again when the delay returned by its last sync has elapsed.
+    """
+
+    def __init__(self, tenants, sync_tenant, max_workers):
+        """
+        :param tenants:      list of Tenant
+        :param sync_tenant:  callable syncing a tenant once and returning the number of seconds until its next sync
+        :param max_workers:  number of tenants synced at the same time, 1 syncs them one by one on the calling thread
+        """
+        self.tenants = tenants
+        self.sync_tenant = sync_tenant
+        self.max_workers = max(1, max_workers)
+        self.active_workers = 0
+        self.loop_enabled = False
+        self.condition = threading.Condition()
+
+    def run(self, loop_enabled):
+        """
+        Sync every tenant once, or keep syncing them until interrupted
+        :param loop_enabled:  if True, run until interrupted
+        """
+        self.loop_enabled = loop_enabled
+        while True:
+            with self.condition:
+                if not loop_enabled and self.active_workers == 0 and \
+                        all(tenant.runs > 0 for tenant in self.tenants):
+                    return
+                now = time.time()
+                due_tenants = []
+                for tenant in sorted(self.tenants, key=lambda tenant: tenant.next_run_at):
+                    if self.active_workers >= self.max_workers:
+                        break
+                    if tenant.running or tenant.next_run_at > now or (not loop_enabled and tenant.runs > 0):
+                        continue
+                    tenant.running = True
+                    self.active_workers += 1
+                    due_tenants.append(tenant)
+                if not due_tenants:
+                    self.condition.wait(self.get_wait_time(now, loop_enabled))
+                    continue
+            for tenant in due_tenants:
+                if self.max_workers == 1:
+                    self.work(tenant)
+                else:
+                    worker = threading.Thread(target=self.work, args=(tenant,), name='tenant-' + tenant.name)
+                    worker.daemon = True
+                    worker.start()
+
+    def get_wait_time(self, now, loop_enabled):
+        """
+        Must be called with the condition held
+        :return:  seconds until the next idle tenant is due, None to wait for a running tenant to finish
+        """
+        if not loop_enabled or self.active_workers >= self.max_workers:
+            return None
+        idle_tenants = [tenant for tenant in self.tenants if not tenant.running]
+        if not idle_tenants:
+            return None
+        return max(0, min(tenant.next_run_at for tenant in idle_tenants) - now)
+
+    def work(self, tenant):
+        delay = tenant.scheduler.sync_delay
+        try:
+            delay = self.sync_tenant(tenant)
+        except Exception as ex:
+            tenant.logger.exception('Sync failed: {0}'.format(ex))
+        finally:
+            with self.condition:
+                tenant.running = False
+                tenant.runs += 1
+                tenant.next_run_at = time.time() + delay
+                self.active_workers -= 1
+                self.condition.notify_all()
+        if self.loop_enabled:
+            tenant.logger.info('Next check will be in ' + str(int(round(delay))) + ' seconds')
@@ -0,0 +1,114 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'exporter'))
+import deferred_queue as dq
+import exporter as exp
+
+
+def modified_at(seconds_ago):
+    return (datetime.utcnow() - timedelta(seconds=seconds_ago)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class FakeClient:
+
+    def __init__(self, audits):
+        self.audits = audits
+        self.downloaded = []
+
+    def discover_audits(self, modified_after=None, modified_before=None, template_id=None):
+        audits = [audit for audit in self.audits if audit['modified_at'] > modified_after]
+        return {'total': len(audits), 'count': len(audits), 'audits': audits}
+
+    def get_audit(self, audit_id):
+        self.downloaded.append(audit_id)
+        return {'audit_id': audit_id, 'template_id': 'template_1', 'header_items': [], 'items': []}
+
+
+class DeferredAuditQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'deferred_audits.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_pops_eligible_audits_in_order_and_persists(self):
+        queue = dq.DeferredAuditQueue(self.path)
+        queue.push({'audit_id': 'audit_2', 'modified_at': 'b'}, 200)
+        queue.push({'audit_id': 'audit_1', 'modified_at': 'a'}, 100)
+        queue.push({'audit_id': 'audit_3', 'modified_at': 'c'}, 300)
+        reloaded = dq.DeferredAuditQueue(self.path)
+        self.assertEqual(len(reloaded), 3)
+        self.assertEqual(reloaded.next_eligible_at(), 100)
+        self.assertEqual([audit['audit_id'] for audit in reloaded.pop_eligible(250)], ['audit_1', 'audit_2'])
+        self.assertEqual(len(dq.DeferredAuditQueue(self.path)), 1)
+
+    def test_pushing_again_replaces_the_earlier_entry(self):
+        queue = dq.DeferredAuditQueue(self.path)
+        queue.push({'audit_id': 'audit_1', 'modified_at': 'a'}, 100)
+        queue.push({'audit_id': 'audit_1', 'modified_at': 'b'}, 500)
+        self.assertEqual(queue.pop_eligible(250), [])
+        self.assertEqual(queue.pop_eligible(500), [{'audit_id': 'audit_1', 'modified_at': 'b'}])
+
+    def test_discarded_audits_are_not_popped(self):
+        queue = dq.DeferredAuditQueue(self.path)
+        queue.push({'audit_id': 'audit_1', 'modified_at': 'a'}, 100)
+        queue.discard(['audit_1', 'audit_unknown'])
+        self.assertEqual(queue.pop_eligible(1000), [])
+        self.assertIsNone(queue.next_eligible_at())
+
+
+class SyncWithDeferredAuditsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.working_directory = os.getcwd()
+        self.temp_dir = tempfile.mkdtemp()
+        os.chdir(self.temp_dir)
+        self.logger = logging.getLogger('test_deferred_queue')
+        self.logger.addHandler(logging.NullHandler())
+        self.settings = {
+            exp.EXPORT_PATH: self.temp_dir,
+            exp.PREFERENCES: {},
+            exp.FILENAME_ITEM_ID: None,
+            exp.MEDIA_SYNC_OFFSET_IN_SECONDS: 600,
+            exp.EXPORT_FORMATS: ['json']
+        }
+
+    def tearDown(self):
+        os.chdir(self.working_directory)
+        shutil.rmtree(self.temp_dir)
+
+    def test_marker_moves_past_deferred_audits_which_are_exported_once_eligible(self):
+        sc_client = FakeClient([
+            {'audit_id': 'audit_old', 'modified_at': modified_at(3600)},
+            {'audit_id': 'audit_recent', 'modified_at': modified_at(60)}
+        ])
+        summary = exp.sync_exports(self.logger, self.settings, sc_client)
+        self.assertEqual(sc_client.downloaded, ['audit_old'])
+        self.assertEqual(summary['deferred_audits'], 1)
+        self.assertEqual(summary['backlog'], 0)
+        self.assertEqual(exp.get_last_successful(self.logger), sc_client.audits[1]['modified_at'])
+
+        self.settings[exp.MEDIA_SYNC_OFFSET_IN_SECONDS] = 0
+        queue = dq.DeferredAuditQueue(exp.DEFERRED_AUDITS_FILENAME)
+        queue.push(sc_client.audits[1], 0)
+        summary = exp.sync_exports(self.logger, self.settings, sc_client)
+        self.assertEqual(sc_client.downloaded, ['audit_old', 'audit_recent'])
+        self.assertEqual(summary['audits_discovered'], 0)
+        self.assertEqual(summary['audits_processed'], 1)
+        self.assertEqual(summary['deferred_audits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
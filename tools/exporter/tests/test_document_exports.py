@@ -0,0 +1,129 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'exporter'))
+import exporter as exp
+import deferred_queue as dq
+import run_summary as rs
+
+logger = logging.getLogger('test_document_exports')
+logger.addHandler(logging.NullHandler())
+
+
+class FakeExportClient(object):
+    """
+    Exports every audit of a batch at once, failing the audits listed in failing_audit_ids
+    """
+
+    def __init__(self, failing_audit_ids=(), preference_ids=()):
+        self.failing_audit_ids = failing_audit_ids
+        self.preference_ids = preference_ids
+        self.exported_audit_ids = []
+        self.preference_requests = []
+        self.template_cache = exp.sp.TemplateCache(self)
+
+    def get_preference_ids(self, template_id=None):
+        self.preference_requests.append(template_id)
+        return {'preferences': [{'id': preference_id} for preference_id in self.preference_ids]}
+
+    def get_exports(self, audit_ids, preference_id=None, export_format='pdf', export_paths=None, timing_hook=None,
+                    fsync=False):
+        for audit_id in audit_ids:
+            self.exported_audit_ids.append((audit_id, preference_id))
+            if audit_id in self.failing_audit_ids:
+                yield audit_id, None
+                continue
+            with open(export_paths[audit_id], 'wb') as export_file:
+                export_file.write(b'%PDF ' + audit_id.encode('utf-8'))
+            yield audit_id, export_paths[audit_id]
+
+
+def create_audit(index):
+    return {'audit_id': 'audit_{0}'.format(index), 'template_id': 'template_1',
+            'modified_at': '2018-01-0{0}T00:00:00.000Z'.format(index)}
+
+
+class DocumentExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings = {
+            exp.EXPORT_PATH: self.temp_dir,
+            exp.EXPORT_FORMATS: ['pdf'],
+            exp.PREFERENCES: None,
+            exp.FILENAME_ITEM_ID: None,
+            exp.MEDIA_SYNC_OFFSET_IN_SECONDS: 0,
+            exp.STATE_DIRECTORY: self.temp_dir
+        }
+        self.sync_marker_path = exp.get_state_path(self.settings, exp.SYNC_MARKER_FILENAME)
+        self.deferred_audits = dq.DeferredAuditQueue(os.path.join(self.temp_dir, exp.DEFERRED_AUDITS_FILENAME))
+        self.run_summary = rs.RunSummary()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def export(self, sc_client, audits):
+        exp.export_discovered_audits(logger, self.settings, sc_client, {'total': len(audits), 'audits': audits},
+                                     self.deferred_audits, self.run_summary)
+
+    def read_sync_marker(self):
+        with open(self.sync_marker_path) as sync_marker_file:
+            return sync_marker_file.read()
+
+    def test_sync_marker_moves_past_exported_audits(self):
+        audits = [create_audit(index) for index in range(1, 4)]
+        self.export(FakeExportClient(), audits)
+        self.assertEqual(self.read_sync_marker(), audits[2]['modified_at'])
+        self.assertEqual(sorted(filename for filename in os.listdir(self.temp_dir) if filename.endswith('.pdf')),
+                         ['audit_1.pdf', 'audit_2.pdf', 'audit_3.pdf'])
+
+    def test_sync_marker_stops_before_the_first_failed_export(self):
+        audits = [create_audit(index) for index in range(1, 4)]
+        self.export(FakeExportClient(failing_audit_ids=['audit_2']), audits)
+        self.assertEqual(self.read_sync_marker(), audits[0]['modified_at'])
+        self.assertEqual(self.run_summary.counters[rs.AUDITS_FAILED], 1)
+        self.assertEqual(self.run_summary.counters[rs.AUDITS_PROCESSED], 1)
+
+    def test_exports_left_by_a_stopped_cycle_are_removed(self):
+        self.export(FakeExportClient(failing_audit_ids=['audit_2']), [create_audit(index) for index in range(1, 4)])
+        self.assertEqual(sorted(filename for filename in os.listdir(self.temp_dir)
+                                if filename.endswith('.pdf') or filename.startswith(exp.BATCH_DIRECTORY_PREFIX)),
+                         ['audit_1.pdf'])
+
+    def test_existing_report_is_replaced(self):
+        with open(os.path.join(self.temp_dir, 'audit_1.pdf'), 'wb') as report_file:
+            report_file.write(b'%PDF previous')
+        self.export(FakeExportClient(), [create_audit(1)])
+        with open(os.path.join(self.temp_dir, 'audit_1.pdf'), 'rb') as report_file:
+            self.assertEqual(report_file.read(), b'%PDF audit_1')
+
+    def test_configured_preference_is_checked_once_against_the_template_preferences(self):
+        preference_id = 'template_1:preference_1'
+        self.settings[exp.PREFERENCES] = {'template_1': preference_id}
+        sc_client = FakeExportClient(preference_ids=[preference_id])
+        self.export(sc_client, [create_audit(1)])
+        self.export(sc_client, [create_audit(2)])
+        self.assertEqual(sc_client.exported_audit_ids, [('audit_1', preference_id), ('audit_2', preference_id)])
+        self.assertEqual(sc_client.preference_requests, ['template_1'])
+
+    def test_deleted_preference_is_replaced_by_the_default_preference(self):
+        self.settings[exp.PREFERENCES] = {'template_1': 'template_1:deleted'}
+        sc_client = FakeExportClient(preference_ids=['template_1:preference_1'])
+        self.export(sc_client, [create_audit(1)])
+        self.assertEqual(sc_client.exported_audit_ids, [('audit_1', None)])
+
+    def test_failed_export_of_the_first_audit_leaves_the_sync_marker(self):
+        self.export(FakeExportClient(failing_audit_ids=['audit_1']), [create_audit(1), create_audit(2)])
+        self.assertFalse(os.path.isfile(self.sync_marker_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
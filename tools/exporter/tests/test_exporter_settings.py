@@ -75,5 +75,26 @@ class ExporterTestCase(unittest.TestCase):
         for config_setting in config_settings:
             self.assertEqual(exp.load_setting_media_sync_offset(logger, config_setting), config_setting['media_sync_offset_in_seconds'])
 
+    def test_templates_setting_is_a_list_of_unique_template_ids(self):
+        config_settings = [{'export_options': {'templates': ['template_1', 'template_2', 'template_1']}},
+                           {'export_options': {'templates': 'template_1 template_2'}}]
+        for config_setting in config_settings:
+            self.assertEqual(exp.load_setting_templates(logger, config_setting), ['template_1', 'template_2'])
+
+    def test_return_None_if_no_templates_were_given(self):
+        config_settings = [{'export_options': {}}, {'export_options': {'templates': None}}, {}]
+        for config_setting in config_settings:
+            self.assertIsNone(exp.load_setting_templates(logger, config_setting))
+
+    def test_audit_json_is_only_downloaded_for_formats_built_from_it(self):
+        audit = {'audit_id': 'audit_1', 'modified_at': '2018-01-01T00:00:00.000Z', 'template_id': 'template_1'}
+        settings = {exp.FILENAME_ITEM_ID: None, exp.EXPORT_FORMATS: ['pdf', 'docx']}
+        self.assertFalse(exp.is_audit_json_needed(settings, audit))
+        self.assertTrue(exp.is_audit_json_needed(settings, {'audit_id': 'audit_1'}))
+        settings[exp.EXPORT_FORMATS] = ['pdf', 'csv']
+        self.assertTrue(exp.is_audit_json_needed(settings, audit))
+        settings = {exp.FILENAME_ITEM_ID: exp.AUDIT_TITLE_ITEM_ID, exp.EXPORT_FORMATS: ['pdf']}
+        self.assertTrue(exp.is_audit_json_needed(settings, audit))
+
 if __name__ == '__main__':
     unittest.main()
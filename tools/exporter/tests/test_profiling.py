@@ -0,0 +1,57 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'exporter'))
+import profiling
+
+
+def profiled_function():
+    return sum(range(100))
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.profile_path = os.path.join(self.temp_dir, 'profile.pstats')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_only_the_first_samples_are_profiled(self):
+        profiler = profiling.Profiler(self.profile_path, sample_limit=2)
+        for _ in range(5):
+            with profiler.sample():
+                profiled_function()
+        self.assertEqual(profiler.samples_taken, 2)
+        self.assertTrue(os.path.isfile(self.profile_path))
+        calls = [stats[1] for function, stats in pstats.Stats(self.profile_path).stats.items()
+                 if function[2] == 'profiled_function']
+        self.assertEqual(calls, [2])
+
+    def test_partial_sample_is_saved_on_close(self):
+        profiler = profiling.Profiler(self.profile_path, sample_limit=10)
+        with profiler.sample():
+            profiled_function()
+        self.assertFalse(os.path.isfile(self.profile_path))
+        self.assertTrue(profiler.close())
+        self.assertTrue(os.path.isfile(self.profile_path))
+
+    def test_profile_is_saved_when_block_raises(self):
+        profiler = profiling.Profiler(self.profile_path)
+        with self.assertRaises(KeyboardInterrupt):
+            with profiler.profile():
+                raise KeyboardInterrupt()
+        self.assertTrue(os.path.isfile(self.profile_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'exporter'))
+import run_summary as rs
+
+
+class RunSummaryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.json_lines_path = os.path.join(self.temp_dir, 'run_summary.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_stages_accumulate_time_calls_and_bytes(self):
+        run_summary = rs.RunSummary()
+        for _ in range(3):
+            with run_summary.stage('pdf'):
+                with run_summary.stage('export_queue_wait'):
+                    pass
+            run_summary.add_bytes_written('pdf', 100)
+        summary = run_summary.as_dict()
+        self.assertEqual(summary['stages']['pdf']['count'], 3)
+        self.assertEqual(summary['stages']['pdf']['bytes_written'], 300)
+        self.assertEqual(summary['stages']['export_queue_wait']['count'], 3)
+        self.assertEqual(summary['bytes_written'], 300)
+
+    def test_stage_time_is_recorded_when_the_stage_raises(self):
+        run_summary = rs.RunSummary()
+        with self.assertRaises(ValueError):
+            with run_summary.stage('csv'):
+                raise ValueError()
+        self.assertEqual(run_summary.as_dict()['stages']['csv']['count'], 1)
+
+    def test_events_are_written_as_json_lines(self):
+        run_summary = rs.RunSummary(self.json_lines_path)
+        run_summary.increment(rs.AUDITS_PROCESSED, 2)
+        run_summary.emit('audit', audit_id='audit_1', seconds=0.5)
+        run_summary.record_failure('media', 'audit_1', 'Unable to save media')
+        summary = run_summary.finish()
+        events = [json.loads(line) for line in open(self.json_lines_path)]
+        self.assertEqual([event['event'] for event in events], ['audit', 'failure', 'run_summary'])
+        self.assertEqual(events[1]['stage'], 'media')
+        self.assertEqual(events[2]['audits_processed'], 2)
+        self.assertEqual(summary['failures'], 1)
+
+    def test_no_file_is_written_without_path(self):
+        run_summary = rs.RunSummary()
+        run_summary.emit('audit', audit_id='audit_1')
+        run_summary.finish()
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_backlog_and_next_eligible_time(self):
+        run_summary = rs.RunSummary()
+        run_summary.increment(rs.AUDITS_DISCOVERED, 10)
+        run_summary.increment(rs.AUDITS_PROCESSED, 5)
+        run_summary.defer('audit_2', 2000)
+        run_summary.defer('audit_1', 1000)
+        summary = run_summary.as_dict()
+        self.assertEqual(summary[rs.AUDITS_SKIPPED], 2)
+        self.assertEqual(summary['backlog'], 3)
+        self.assertEqual(summary['next_eligible_at'], 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'exporter'))
+import scheduler
+
+
+class AdaptiveSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = scheduler.AdaptiveScheduler(900, min_delay_in_seconds=60, max_delay_in_seconds=3600)
+
+    def test_configured_delay_when_all_discovered_audits_were_processed(self):
+        self.assertEqual(self.scheduler.next_delay(10), 900)
+
+    def test_minimum_delay_while_backlog_remains(self):
+        self.assertEqual(self.scheduler.next_delay(1500, backlog=500), 60)
+
+    def test_backs_off_while_searches_are_empty_and_resets_on_new_audits(self):
+        delays = [self.scheduler.next_delay(0) for _ in range(4)]
+        self.assertEqual(delays, [900, 1800, 3600, 3600])
+        self.assertEqual(self.scheduler.next_delay(3), 900)
+        self.assertEqual(self.scheduler.next_delay(0), 900)
+
+    def test_configured_delay_when_no_search_succeeded(self):
+        self.scheduler.next_delay(0)
+        self.assertEqual(self.scheduler.next_delay(None), 900)
+
+    def test_wakes_up_when_the_first_deferred_audit_becomes_eligible(self):
+        delay = self.scheduler.next_delay(5, next_eligible_at=1120, now=1000)
+        self.assertEqual(delay, 120 + scheduler.ELIGIBILITY_MARGIN_IN_SECONDS)
+        delay = self.scheduler.next_delay(5, next_eligible_at=990, now=1000)
+        self.assertEqual(delay, scheduler.ELIGIBILITY_MARGIN_IN_SECONDS)
+        self.assertEqual(self.scheduler.next_delay(5, next_eligible_at=5000, now=1000), 900)
+
+    def test_delay_bounds_follow_a_short_sync_delay(self):
+        short_scheduler = scheduler.AdaptiveScheduler(30)
+        self.assertEqual(short_scheduler.next_delay(100, backlog=1), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'exporter'))
+import sharding
+
+
+class ShardingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_split_time_range_covers_the_range_without_gaps(self):
+        ranges = sharding.split_time_range('2018-01-01T00:00:00.000Z', '2018-01-04T00:00:00.000Z', 3)
+        self.assertEqual(ranges, [
+            ('2018-01-01T00:00:00.000Z', '2018-01-02T00:00:00.001Z'),
+            ('2018-01-02T00:00:00.000Z', '2018-01-03T00:00:00.001Z'),
+            ('2018-01-03T00:00:00.000Z', '2018-01-04T00:00:00.001Z')
+        ])
+
+    def test_audit_modified_on_a_boundary_is_in_exactly_one_range(self):
+        ranges = sharding.split_time_range('2018-01-01T00:00:00.000Z', '2018-01-04T00:00:00.000Z', 3)
+        for modified_at in ['2018-01-02T00:00:00.000Z', '2018-01-03T00:00:00.000Z', '2018-01-04T00:00:00.000Z',
+                            '2018-01-02T00:00:00.001Z', '2018-01-03T23:59:59.999Z']:
+            # discover_audits excludes both bounds of the range
+            matching_ranges = [modified_range for modified_range in ranges
+                               if modified_range[0] < modified_at < modified_range[1]]
+            self.assertEqual(len(matching_ranges), 1, modified_at)
+        self.assertFalse(any(modified_range[0] < '2018-01-01T00:00:00.000Z' < modified_range[1]
+                             for modified_range in ranges))
+
+    def test_split_templates_deals_templates_out_and_drops_empty_shards(self):
+        self.assertEqual(sharding.split_templates(['t3', 't1', 't2'], 2), [['t1', 't3'], ['t2']])
+        self.assertEqual(sharding.split_templates(['t1'], 3), [['t1']])
+
+    def test_plan_is_saved_and_loaded(self):
+        plan = sharding.create_plan(self.temp_dir, '2018-01-01T00:00:00.000Z', '2018-01-03T00:00:00.000Z', 2,
+                                    ['json'])
+        self.assertEqual([shard['shard_id'] for shard in plan['shards']], ['shard_0000', 'shard_0001'])
+        self.assertEqual(sharding.load_plan(self.temp_dir), plan)
+        self.assertIsNone(sharding.load_plan(os.path.join(self.temp_dir, 'missing')))
+
+    def test_lease_is_exclusive_until_released_or_abandoned(self):
+        shard = {'shard_id': 'shard_0000'}
+        first = sharding.ShardLease(self.temp_dir, shard, 'host:1', ttl_in_seconds=60)
+        second = sharding.ShardLease(self.temp_dir, shard, 'host:2', ttl_in_seconds=60)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertTrue(sharding.is_leased(self.temp_dir, shard))
+        first.release()
+        self.assertTrue(second.acquire())
+
+        abandoned_at = time.time() - 120
+        os.utime(second.path, (abandoned_at, abandoned_at))
+        self.assertFalse(sharding.is_leased(self.temp_dir, shard, 60))
+        self.assertTrue(first.acquire())
+
+    def test_merge_appends_csv_rows_without_header_and_replaces_other_files(self):
+        export_path = os.path.join(self.temp_dir, 'exports')
+        for shard_id, row in [('shard_0000', 'a'), ('shard_0001', 'b')]:
+            source = os.path.join(self.temp_dir, shard_id)
+            os.makedirs(source)
+            with open(os.path.join(source, 'template_1.csv'), 'w') as csv_file:
+                csv_file.write('header\n' + row + '\n')
+            with open(os.path.join(source, 'audit_1.json'), 'w') as json_file:
+                json_file.write(row)
+            self.assertEqual(sharding.merge_exports(source, export_path), 2)
+        with open(os.path.join(export_path, 'template_1.csv')) as csv_file:
+            self.assertEqual(csv_file.read(), 'header\na\nb\n')
+        with open(os.path.join(export_path, 'audit_1.json')) as json_file:
+            self.assertEqual(json_file.read(), 'b')
+
+
+if __name__ == '__main__':
+    unittest.main()
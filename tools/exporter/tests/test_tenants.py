@@ -0,0 +1,106 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'exporter'))
+import exporter as exp
+import scheduler
+import tenants as tn
+
+logger = logging.getLogger('test_tenants')
+logger.addHandler(logging.NullHandler())
+
+
+def create_tenant(name):
+    return tn.Tenant(name, {}, None, logger, scheduler.AdaptiveScheduler(900))
+
+
+class TenantRunnerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.synced = []
+
+    def sync_tenant(self, tenant):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+            self.synced.append(tenant.name)
+        return 900
+
+    def test_every_tenant_is_synced_once_within_the_concurrency_limit(self):
+        tenants = [create_tenant('tenant_' + str(index)) for index in range(5)]
+        tn.TenantRunner(tenants, self.sync_tenant, 2).run(False)
+        self.assertEqual(sorted(self.synced), sorted(tenant.name for tenant in tenants))
+        self.assertEqual(self.max_running, 2)
+        for tenant in tenants:
+            self.assertFalse(tenant.running)
+            self.assertGreater(tenant.next_run_at, time.time() + 800)
+
+    def test_one_worker_syncs_tenants_on_the_calling_thread(self):
+        threads = []
+        tenants = [create_tenant('tenant_1'), create_tenant('tenant_2')]
+        tn.TenantRunner(tenants, lambda tenant: threads.append(threading.current_thread()) or 0, 1).run(False)
+        self.assertEqual(threads, [threading.current_thread()] * 2)
+
+    def test_failing_tenant_does_not_stop_the_others(self):
+        def sync_tenant(tenant):
+            if tenant.name == 'failing':
+                raise ValueError('boom')
+            return self.sync_tenant(tenant)
+        tenants = [create_tenant('failing'), create_tenant('working')]
+        tn.TenantRunner(tenants, sync_tenant, 2).run(False)
+        self.assertEqual(self.synced, ['working'])
+        self.assertEqual([tenant.runs for tenant in tenants], [1, 1])
+
+
+class TemplateStreamsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings = {
+            exp.STATE_DIRECTORY: self.temp_dir,
+            exp.SYNC_DELAY_IN_SECONDS: 900,
+            exp.EXPORT_FORMATS: ['csv', 'actions'],
+            exp.TEMPLATES: None
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_configuration_without_templates_is_a_single_tenant(self):
+        tenants = exp.create_tenants(logger, 'acme', self.settings, None)
+        self.assertEqual([tenant.name for tenant in tenants], ['acme'])
+        self.assertIs(tenants[0].settings, self.settings)
+
+    def test_every_template_has_its_own_stream_starting_from_the_sync_marker(self):
+        exp.update_sync_marker_file('2018-01-01T00:00:00.000Z', exp.get_state_path(self.settings,
+                                                                                   exp.SYNC_MARKER_FILENAME))
+        self.settings[exp.TEMPLATES] = ['template_1', 'template_2']
+        tenants = exp.create_tenants(logger, None, self.settings, None)
+        self.assertEqual([tenant.name for tenant in tenants], ['actions', 'template_1', 'template_2'])
+        self.assertEqual(tenants[0].settings[exp.EXPORT_FORMATS], ['actions'])
+        for tenant in tenants[1:]:
+            self.assertEqual(tenant.settings[exp.EXPORT_FORMATS], ['csv'])
+            self.assertEqual(tenant.settings[exp.TEMPLATE_ID], tenant.name)
+            sync_marker_path = exp.get_state_path(tenant.settings, exp.SYNC_MARKER_FILENAME)
+            self.assertEqual(exp.get_last_successful(logger, sync_marker_path), '2018-01-01T00:00:00.000Z')
+        self.assertNotEqual(tenants[1].scheduler, tenants[2].scheduler)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import csv
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'exporter'))
+import exporter as exp
+
+logger = logging.getLogger('test_web_report_links')
+logger.addHandler(logging.NullHandler())
+
+
+class WebReportLinksTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.export_dir = os.path.join(self.temp_dir, 'exports')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read_rows(self):
+        with io.open(os.path.join(self.export_dir, 'web-report-links.csv'), encoding='utf-8', newline='') as csv_file:
+            return list(csv.reader(csv_file))
+
+    def test_links_of_concurrent_template_streams_are_all_kept(self):
+        def save_links(template_index):
+            for audit_index in range(20):
+                exp.save_web_report_link_to_file(logger, self.export_dir, [
+                    'template_{0}'.format(template_index), 'Template', 'audit_{0}_{1}'.format(template_index,
+                                                                                          audit_index),
+                    'Audit', 'https://app.safetyculture.io/report/audit_{0}'.format(audit_index)])
+
+        workers = [threading.Thread(target=save_links, args=(index,)) for index in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        rows = self.read_rows()
+        self.assertEqual(rows[0], ['Template ID', 'Template Name', 'Audit ID', 'Audit Name', 'Web Report Link'])
+        self.assertEqual(sorted(row[2] for row in rows[1:]),
+                         sorted('audit_{0}_{1}'.format(template_index, audit_index)
+                                for template_index in range(4) for audit_index in range(20)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,32 @@
 import argparse
 import datetime
 import errno
+import hashlib
+import json
 import logging
 import os
 import re
 import sys
-import yaml
-from xlrd import open_workbook
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 from safetypy import safetypy as sp
+from tools.import_grs import readers
 
 # Possible values here are DEBUG, INFO, WARN, ERROR and CRITICAL
 LOG_LEVEL = logging.DEBUG
 
 DEFAULT_CONFIG_FILENAME = 'config.yaml'
 
+# Responses created or deleted at the same time
+MAX_REQUESTS_IN_FLIGHT = 8
+
+# Hashes of the response sets as last imported, in the current working directory
+RESPONSE_SET_CACHE_FILENAME = 'import_grs_cache.json'
+
 
 def configure_logging(path_to_log_directory):
     """
@@ -116,12 +128,13 @@ def load_setting_input_filename(logger, config_settings):
 
     try:
         filename = config_settings['input_filename']
-        filename_is_valid = re.match('.+xls|.+xlsx', filename)
+        filename_is_valid = re.match('.+xls|.+xlsx|.+csv|.+tsv', filename) or os.path.isdir(filename)
         if filename_is_valid:
             logger.debug('Filename matched expected pattern')
             return filename
         else:
-            logger.error('Filename failed to match expected pattern, acceptable formats are xls and xlsx')
+            logger.error('Filename failed to match expected pattern, acceptable formats are xls, xlsx, csv, tsv '
+                         'and directories of csv and tsv files')
             return None
     except Exception as ex:
         log_critical_error(logger, ex, 'Exception parsing input filename from config.yaml')
@@ -136,6 +149,7 @@ def load_config_settings(logger, path_to_config_file):
     :return:                    settings dictionary containing values for:
                                 api_token, input_filename
     """
+    import yaml
     config_settings = yaml.safe_load(open(path_to_config_file))
     settings = {
         'api_token': load_setting_api_access_token(logger, config_settings),
@@ -149,78 +163,325 @@ def read_workbook(logger, input_filename):
     """
     Read the contents of input_filename and return
     :param logger:         The logger
-    :param input_filename: Filepath of the spreadsheet to read
+    :param input_filename: Filepath of the spreadsheet, CSV or TSV file, or directory of CSV and TSV files to read
     :return:  Dict of response sets
     """
-    wb_response_sets = {}
-    if os.path.isfile(input_filename):
-        wb = open_workbook(input_filename)
-        for sheet in wb.sheets():
-            name = sheet.name
-            wb_response_sets[name] = []
-
-            number_of_rows = sheet.nrows
-            for row in range(1, number_of_rows):
-                if sheet.cell(row, 0).value != "":
-                    label_object = {
-                        'label': sheet.cell(row, 0).value,
-                    }
-                    wb_response_sets[name].append(label_object)
-        return wb_response_sets
-    else:
-        logger.error('{0} does not appear to be a valid file'.format(input_filename))
+    response_sets = iter_workbook(logger, input_filename)
+    if response_sets is not None:
+        return dict((name, list(labels)) for name, labels in response_sets)
 
 
-def get_rs_id_by_name(name, response_sets):
+def iter_workbook(logger, input_filename):
     """
-    Return the response_set that matches the passed name
-    :param name:          Name of response_set to return
-    :param response_sets: List of response_sets to check
-    :return:              Response_set with the passed name
+    Read the response sets of input_filename one at a time, see readers.iter_response_sets
+    :param logger:         The logger
+    :param input_filename: Filepath of the spreadsheet, CSV or TSV file, or directory of CSV and TSV files to read
+    :return:  generator of (response set name, label objects) tuples, None if the file cannot be read
     """
+    if not os.path.exists(input_filename):
+        logger.error('{0} does not appear to be a valid file'.format(input_filename))
+        return None
+    try:
+        return readers.iter_response_sets(input_filename)
+    except ValueError as ex:
+        logger.error(ex)
+        return None
 
+
+def index_response_sets_by_name(response_sets):
+    """
+    :param response_sets: List of response_sets pulled from API
+    :return:              Dict of response_sets by name. Of response_sets sharing a name, the first one is used.
+    """
+    response_sets_by_name = {}
     for rs in response_sets:
-        if rs['name'] == name:
-            return rs
+        response_sets_by_name.setdefault(rs['name'], rs)
+    return response_sets_by_name
 
 
-def handle_matching_rs(logger, local_response_sets, remote_response_sets, response_set_name, sc_client):
+def diff_responses(local_response_set, remote_responses):
+    """
+    :param local_response_set: Responses of the response_set in the spreadsheet
+    :param remote_responses:   Responses of the response_set on the server
+    :return:                   Tuple of the labels to create, in spreadsheet order, and the IDs of the responses to
+                               delete
+    """
+    remote_labels = set(str(x['label']) for x in remote_responses)
+    local_labels = []
+    for label in (str(x['label']) for x in local_response_set):
+        if label not in remote_labels:
+            local_labels.append(label)
+            # create each missing label once, even if the spreadsheet repeats it
+            remote_labels.add(label)
+    local_label_set = set(str(x['label']) for x in local_response_set)
+    remote_diff_ids = [x['id'] for x in remote_responses if str(x['label']) not in local_label_set]
+    return local_labels, remote_diff_ids
+
+
+def run_concurrently(function, arguments, max_in_flight=MAX_REQUESTS_IN_FLIGHT):
+    """
+    Call function with each of arguments, up to max_in_flight calls at a time
+    :param function:      Function to call
+    :param arguments:     List of the arguments of every call, each a tuple
+    :param max_in_flight: Number of calls made at the same time
+    :return:              List of the results of the calls, in the order of arguments
+    """
+    pending_calls = queue.Queue()
+    for index, call_arguments in enumerate(arguments):
+        pending_calls.put((index, call_arguments))
+    results = [None] * len(arguments)
+
+    def make_pending_calls():
+        while True:
+            try:
+                index, call_arguments = pending_calls.get_nowait()
+            except queue.Empty:
+                return
+            results[index] = function(*call_arguments)
+
+    workers = [threading.Thread(target=make_pending_calls) for _ in range(min(max_in_flight, len(arguments)))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def handle_matching_rs(logger, local_response_sets, remote_response_sets, response_set_name, sc_client,
+                       max_in_flight=MAX_REQUESTS_IN_FLIGHT, remote_response_set=None):
     """
     :param logger:               The logger
     :param local_response_sets:  Response_set data pulled from spreadsheet
-    :param remote_response_sets: Response_set data pulled from API
+    :param remote_response_sets: Response_set data pulled from API, indexed by index_response_sets_by_name
     :param response_set_name:    Name of the response_set
     :param sc_client:            Instance of SDK client
-    :return:                     None
+    :param max_in_flight:        Number of responses created or deleted at the same time
+    :param remote_response_set:  Response_set already fetched from the API, None to fetch it
+    :return:                     Summary of the responses created and deleted and of the changes that failed
     """
     local_response_set = local_response_sets[response_set_name]
-    responseset_id = get_rs_id_by_name(response_set_name, remote_response_sets)['responseset_id']
+    responseset_id = remote_response_sets[response_set_name]['responseset_id']
+
+    if remote_response_set is None:
+        remote_response_set = sc_client.get_response_set(responseset_id)
+    local_diff, remote_diff_ids = diff_responses(local_response_set, remote_response_set['responses'])
+
+    if len(local_diff) > 0:
+        logger.debug('there are {0} local responses to create in {1}'.format(len(local_diff), responseset_id))
+    if len(remote_diff_ids) > 0:
+        logger.debug('there are {0} remote responses to delete in {1}'.format(len(remote_diff_ids), responseset_id))
+    if len(local_diff) == 0 and len(remote_diff_ids) == 0:
+        logger.debug('{0} on server matches local responseset - no changes to make'.format(responseset_id))
+
+    def apply_change(label, response_id):
+        try:
+            if label is not None:
+                return sc_client.create_response(responseset_id, {'label': label}) is not None
+            return sc_client.delete_response(responseset_id, response_id) is not None
+        except Exception as ex:
+            log_critical_error(logger, ex, 'Exception updating {0}'.format(responseset_id))
+            return False
+
+    results = run_concurrently(apply_change, [(label, None) for label in local_diff] +
+                               [(None, response_id) for response_id in remote_diff_ids], max_in_flight)
+    summary = {
+        'created': sum(1 for succeeded in results[:len(local_diff)] if succeeded),
+        'deleted': sum(1 for succeeded in results[len(local_diff):] if succeeded),
+        'failed': sum(1 for succeeded in results if not succeeded)
+    }
+    logger.info('{0}: {1} responses created, {2} deleted, {3} failed'.format(
+        response_set_name, summary['created'], summary['deleted'], summary['failed']))
+    return summary
+
+
+def hash_labels(labels):
+    """
+    :param labels: label objects of a response_set
+    :return:       hash of the distinct labels, independent of their order
+    """
+    distinct_labels = sorted(set(str(x['label']) for x in labels))
+    return hashlib.sha256('\n'.join(distinct_labels).encode('utf-8')).hexdigest()
+
+
+def load_response_set_cache(logger, path):
+    """
+    :param logger: The logger
+    :param path:   Filepath of the cache
+    :return:       Dict of the cache entry of every response_set by name, empty if there is no readable cache
+    """
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as cache_file:
+            return json.load(cache_file)
+    except ValueError:
+        logger.warning('Ignoring unreadable cache ' + path)
+        return {}
+
+
+def save_response_set_cache(path, cache):
+    """
+    Write the cache, replacing the previous version atomically where the platform allows it
+    :param path:  Filepath of the cache
+    :param cache: Dict of the cache entry of every response_set by name
+    """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as cache_file:
+        json.dump(cache, cache_file, indent=2, sort_keys=True)
+    if hasattr(os, 'replace'):
+        os.replace(temp_path, path)
+    else:
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
+
 
+def create_cache_entry(local_hash, responseset_id, remote_response_set, modified_at=None):
+    """
+    :param local_hash:          hash of the labels imported
+    :param responseset_id:      ID of the remote response_set
+    :param remote_response_set: remote response_set fetched from the API once the import completed
+    :param modified_at:         time the server listing reports the response_set was last modified, None until the
+                                response_sets are listed again, see record_modification_times
+    :return:                    cache entry of the response_set
+    """
+    return {
+        'responseset_id': responseset_id,
+        'modified_at': modified_at,
+        'local_hash': local_hash,
+        'remote_hash': hash_labels(remote_response_set['responses'])
+    }
+
+
+def fetch_cache_entry(sc_client, responseset_id, local_hash):
+    """
+    :param sc_client:      Instance of SDK client
+    :param responseset_id: ID of the response_set just imported
+    :param local_hash:     hash of the labels imported
+    :return:               cache entry of the response_set as the server now holds it, None if it cannot be fetched
+    """
     remote_response_set = sc_client.get_response_set(responseset_id)
-    remote_responses = remote_response_set['responses']
+    if remote_response_set is None:
+        return None
+    return create_cache_entry(local_hash, responseset_id, remote_response_set)
 
-    local_labels = [str(x['label']) for x in local_response_set]
-    remote_labels = [str(x['label']) for x in remote_response_set['responses']]
 
-    local_diff = [x for x in local_labels if x not in remote_labels]
-    remote_diff = [x for x in remote_labels if x not in local_labels]
+def is_unchanged(cache_entry, remote_response_set, local_hash):
+    """
+    A response_set is unchanged when its labels are the ones last imported and the remote response_set is the one
+    the last import left. A response_set fetched from the API is compared with the labels it held after the last
+    import. A response_set of the server listing has no labels, it is only known to be unchanged when the listing
+    reports the time it was last modified and that time has not changed.
+    :param cache_entry:         cache entry of the response_set, None if it was never imported
+    :param remote_response_set: response_set fetched from the API, or of the server listing
+    :param local_hash:          hash of the labels to import
+    :return:                    True if the response_set does not need to be reconciled
+    """
+    if cache_entry is None or cache_entry['local_hash'] != local_hash:
+        return False
+    if cache_entry['responseset_id'] != remote_response_set.get('responseset_id', cache_entry['responseset_id']):
+        return False
+    if 'responses' in remote_response_set:
+        return hash_labels(remote_response_set['responses']) == cache_entry['remote_hash']
+    if remote_response_set.get('modified_at') is None:
+        return False
+    return cache_entry.get('modified_at') == remote_response_set['modified_at']
+
+
+def get_created_responseset_id(content):
+    """
+    :param content: content of the response to the creation of a response_set
+    :return:        ID of the response_set created, None if the content does not hold it
+    """
+    try:
+        return json.loads(content).get('responseset_id')
+    except (ValueError, TypeError, AttributeError):
+        return None
 
-    if len(local_diff) > 0:
-        logger.debug('there is a local response to create in {0}'.format(responseset_id))
-        for label in local_diff:
-            payload = {
-                'label': label
-            }
-            sc_client.create_response(responseset_id, payload)
-
-    if len(remote_diff) > 0:
-        logger.debug('there is a remote response to delete in {0}'.format(responseset_id))
-        remote_diff_ids = [x['id'] for x in remote_responses if x['label'] in remote_diff]
-        for response_id in remote_diff_ids:
-            sc_client.delete_response(responseset_id, response_id)
-
-    if len(local_diff) == 0 and len(remote_diff) == 0:
-        logger.debug('{0} on server matches local responseset - no changes to make'.format(responseset_id))
+
+def import_response_set(logger, sc_client, local_response_sets, remote_response_sets, response_set_name,
+                        cache_entry):
+    """
+    Create the response_set, or reconcile it unless it is unchanged since the last import. A response_set whose
+    listing shows it was not modified is skipped without fetching it, any other is fetched and compared with the
+    labels it held after the last import.
+    :param logger:               The logger
+    :param sc_client:            Instance of SDK client
+    :param local_response_sets:  Response_set data pulled from spreadsheet
+    :param remote_response_sets: Response_set data pulled from API, indexed by index_response_sets_by_name
+    :param response_set_name:    Name of the response_set
+    :param cache_entry:          cache entry of the response_set, None if it was never imported
+    :return:                     Tuple of the cache entry to keep, None if the import failed, and True if the
+                                 response_set was unchanged
+    """
+    local_hash = hash_labels(local_response_sets[response_set_name])
+    if response_set_name not in remote_response_sets:
+        content = sc_client.create_response_set(response_set_name, local_response_sets[response_set_name])
+        responseset_id = get_created_responseset_id(content)
+        if responseset_id is None:
+            return None, False
+        return fetch_cache_entry(sc_client, responseset_id, local_hash), False
+
+    responseset_id = remote_response_sets[response_set_name]['responseset_id']
+    if is_unchanged(cache_entry, remote_response_sets[response_set_name], local_hash):
+        return cache_entry, True
+    remote_response_set = sc_client.get_response_set(responseset_id)
+    if remote_response_set is not None and is_unchanged(cache_entry, remote_response_set, local_hash):
+        return dict(cache_entry, modified_at=remote_response_sets[response_set_name].get('modified_at')), True
+    summary = handle_matching_rs(logger, local_response_sets, remote_response_sets, response_set_name, sc_client,
+                                 remote_response_set=remote_response_set)
+    if summary['failed'] > 0:
+        return None, False
+    return fetch_cache_entry(sc_client, responseset_id, local_hash), False
+
+
+def record_modification_times(cache, remote_response_sets, response_set_names):
+    """
+    Record the time the server listing reports each response_set was last modified, so that the next import can
+    skip it without fetching it
+    :param cache:                Dict of the cache entry of every response_set by name
+    :param remote_response_sets: Response_set data pulled from API, indexed by index_response_sets_by_name
+    :param response_set_names:   Names of the response_sets to record the modification time of
+    """
+    for response_set_name in response_set_names:
+        cache_entry = cache.get(response_set_name)
+        remote_response_set = remote_response_sets.get(response_set_name)
+        if cache_entry is not None and remote_response_set is not None and \
+                cache_entry['responseset_id'] == remote_response_set['responseset_id']:
+            cache_entry['modified_at'] = remote_response_set.get('modified_at')
+
+
+def import_response_sets(logger, sc_client, local_response_sets, cache):
+    """
+    Import every response_set of the spreadsheet, updating the cache. Importing a response_set changes the time it
+    was last modified, so the response_sets are listed again once they are all imported to record that time.
+    :param logger:              The logger
+    :param sc_client:           Instance of SDK client
+    :param local_response_sets: generator of (response_set name, labels) tuples, as returned by iter_workbook
+    :param cache:               Dict of the cache entry of every response_set by name, as last imported
+    :return:                    Number of response_sets unchanged since the last import
+    """
+    remote_response_sets = index_response_sets_by_name(sc_client.get_response_sets())
+    unchanged_count = 0
+    imported_names = []
+    for response_set_name, labels in local_response_sets:
+        # only the response set being imported is held in memory
+        local_response_set = {response_set_name: list(labels)}
+        cache_entry, unchanged = import_response_set(logger, sc_client, local_response_set, remote_response_sets,
+                                                     response_set_name, cache.pop(response_set_name, None))
+        if cache_entry is None:
+            continue
+        cache[response_set_name] = cache_entry
+        if unchanged:
+            unchanged_count += 1
+        else:
+            imported_names.append(response_set_name)
+    if imported_names:
+        response_sets = sc_client.get_response_sets()
+        if response_sets is not None:
+            record_modification_times(cache, index_response_sets_by_name(response_sets), imported_names)
+    return unchanged_count
 
 
 def main():
@@ -231,6 +492,9 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-f', '--file', required=True)
     parser.add_argument('-t', '--token', required=True)
+    parser.add_argument('-c', '--cache', default=RESPONSE_SET_CACHE_FILENAME,
+                        help='file keeping the hashes of the response sets imported, to skip those that did not change')
+    parser.add_argument('--no-cache', action='store_true', help='fetch and reconcile every response set')
     args = parser.parse_args()
     file_path = args.file
     api_token = args.token
@@ -239,18 +503,17 @@ def main():
     sc_client = sp.SafetyCulture(api_token)
 
     if file_path is not None:
-        local_response_sets = read_workbook(logger, file_path)
+        local_response_sets = iter_workbook(logger, file_path)
         if local_response_sets is not None:
-            remote_response_sets = sc_client.get_response_sets()
-            remote_rs_names = [x['name'] for x in remote_response_sets]
-
-            for response_set_name in local_response_sets:
-                if response_set_name in remote_rs_names:
-                    handle_matching_rs(logger, local_response_sets, remote_response_sets, response_set_name, sc_client)
-                else:
-                    name = response_set_name
-                    responses = local_response_sets[response_set_name]
-                    sc_client.create_response_set(name, responses)
+            cache = {} if args.no_cache else load_response_set_cache(logger, args.cache)
+            unchanged_count = 0
+
+            try:
+                unchanged_count = import_response_sets(logger, sc_client, local_response_sets, cache)
+            except ImportError as ex:
+                log_critical_error(logger, ex, 'Unable to read ' + file_path)
+            logger.info('{0} response sets unchanged since the last import'.format(unchanged_count))
+            save_response_set_cache(args.cache, cache)
 
 
 if __name__ == '__main__':
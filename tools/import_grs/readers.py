@@ -0,0 +1,123 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+"""
+Streaming readers of the response sets to import. Every sheet of a workbook, or every CSV or TSV file of a directory,
+is a response set named after the sheet or file, whose labels are the values of its first column below the header.
+Labels are read lazily, one response set at a time, so large spreadsheets never need to fit in memory at once.
+"""
+
+import csv
+import io
+import os
+import sys
+
+# Extensions of the spreadsheet files read, and the delimiter of the text formats among them
+XLSX_EXTENSIONS = ['.xlsx', '.xlsm']
+XLS_EXTENSIONS = ['.xls']
+DELIMITERS = {'.csv': ',', '.tsv': '\t'}
+
+
+def iter_response_sets(path):
+    """
+    :param path:  path of an xlsx, xls, CSV or TSV file, or of a directory of CSV and TSV files
+    :return:      generator of (response set name, generator of label objects) tuples. The labels of a response set
+                  must be read before moving on to the next response set.
+    """
+    if os.path.isdir(path):
+        return iter_directory(path)
+    extension = os.path.splitext(path)[1].lower()
+    if extension in XLSX_EXTENSIONS:
+        return iter_xlsx(path)
+    if extension in XLS_EXTENSIONS:
+        return iter_xls(path)
+    if extension in DELIMITERS:
+        return iter_text_files([path])
+    raise ValueError('{0} is not an xlsx, xls, csv or tsv file, or a directory'.format(path))
+
+
+def label_objects(values):
+    """
+    Every reader passes its values through here, so that a sheet reconciles the same way whatever its format
+    :param values:  cell values of the first column, header excluded
+    :return:        generator of the label objects of the values that are not empty, text values without
+                    surrounding whitespace
+    """
+    for value in values:
+        if hasattr(value, 'strip'):
+            value = value.strip()
+        if value is not None and value != '':
+            yield {'label': value}
+
+
+def iter_xlsx(path):
+    """
+    Read an xlsx workbook row by row with openpyxl in read-only mode, falling back to xlrd when openpyxl is not
+    installed
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        import xlrd
+        # xlrd dropped xlsx support in version 2
+        if int(xlrd.__VERSION__.split('.')[0]) >= 2:
+            raise ImportError('openpyxl is required to read xlsx files: pip install openpyxl')
+        for response_set in iter_xls(path):
+            yield response_set
+        return
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            rows = worksheet.iter_rows(min_row=2, max_col=1, values_only=True)
+            yield worksheet.title, label_objects(row[0] for row in rows)
+    finally:
+        workbook.close()
+
+
+def iter_xls(path):
+    """
+    Read a workbook with xlrd, loading one sheet at a time
+    """
+    try:
+        from xlrd import open_workbook
+    except ImportError:
+        raise ImportError('xlrd is required to read xls files: pip install xlrd')
+    workbook = open_workbook(path, on_demand=True)
+    try:
+        for index, name in enumerate(workbook.sheet_names()):
+            sheet = workbook.sheet_by_index(index)
+            yield name, label_objects(sheet.col_values(0, 1) if sheet.ncols else [])
+            workbook.unload_sheet(index)
+    finally:
+        workbook.release_resources()
+
+
+def iter_directory(path):
+    """
+    Read every CSV and TSV file of a directory, in name order
+    """
+    filenames = sorted(filename for filename in os.listdir(path)
+                       if os.path.splitext(filename)[1].lower() in DELIMITERS)
+    return iter_text_files([os.path.join(path, filename) for filename in filenames])
+
+
+def iter_text_files(paths):
+    """
+    Read CSV and TSV files, each holding one response set named after the file
+    """
+    for path in paths:
+        name, extension = os.path.splitext(os.path.basename(path))
+        with open_text_file(path) as text_file:
+            rows = csv.reader(text_file, delimiter=DELIMITERS[extension.lower()])
+            next(rows, None)
+            yield name, label_objects(row[0] if row else '' for row in rows)
+
+
+def open_text_file(path):
+    """
+    Open a file for the csv reader of the running Python version
+    """
+    if sys.version_info[0] < 3:
+        return open(path, 'rb')
+    return io.open(path, 'r', encoding='utf-8-sig', newline='')
@@ -0,0 +1,90 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import json
+
+
+def labels(*names):
+    """
+    :return:  label objects, as read from a spreadsheet
+    """
+    return [{'label': name} for name in names]
+
+
+def responses(*names):
+    """
+    :return:  responses of a response_set on the server
+    """
+    return [{'id': 'response_{0}'.format(index), 'label': name} for index, name in enumerate(names)]
+
+
+class FakeResponseSetClient:
+    """
+    Holds response_sets by ID, changing them with the requests made to it like the API. Every change moves the time
+    the listing reports the response_set was last modified, which the response_set fetched on its own does not
+    report. Deleting the responses listed in failing_response_ids fails.
+    """
+
+    def __init__(self, response_sets=None, failing_response_ids=(), names=None, lists_modification_times=True):
+        """
+        :param response_sets:             dictionary of the responses of every response_set by ID
+        :param failing_response_ids:      IDs of the responses whose deletion fails
+        :param names:                     dictionary of the name of every response_set by ID, the ID if missing
+        :param lists_modification_times:  if False, the listing does not report when response_sets were modified
+        """
+        self.response_sets = response_sets or {}
+        self.failing_response_ids = failing_response_ids
+        self.names = names or {}
+        self.lists_modification_times = lists_modification_times
+        self.modified_at = dict((responseset_id, 0) for responseset_id in self.response_sets)
+        self.next_response_id = 1000
+        self.requests = []
+
+    def get_response_sets(self):
+        self.requests.append(('list',))
+        response_sets = []
+        for responseset_id in sorted(self.response_sets):
+            response_set = {'responseset_id': responseset_id, 'name': self.names.get(responseset_id, responseset_id)}
+            if self.lists_modification_times:
+                response_set['modified_at'] = '2018-01-01T00:00:00.{0:03d}Z'.format(self.modified_at[responseset_id])
+            response_sets.append(response_set)
+        return response_sets
+
+    def get_response_set(self, responseset_id):
+        self.requests.append(('get', responseset_id))
+        return {'responseset_id': responseset_id,
+                'responses': [dict(response) for response in self.response_sets[responseset_id]]}
+
+    def create_response_set(self, name, responses):
+        self.requests.append(('create', name))
+        self.response_sets['responseset_' + name] = []
+        self.names['responseset_' + name] = name
+        for response in responses:
+            self.add_response('responseset_' + name, response['label'])
+        return json.dumps({'responseset_id': 'responseset_' + name}).encode('utf-8')
+
+    def create_response(self, responseset_id, response):
+        self.requests.append(('create response', response['label']))
+        self.add_response(responseset_id, response['label'])
+        return b'{}'
+
+    def delete_response(self, responseset_id, response_id):
+        self.requests.append(('delete response', response_id))
+        if response_id in self.failing_response_ids:
+            return None
+        self.response_sets[responseset_id] = [response for response in self.response_sets[responseset_id]
+                                              if response['id'] != response_id]
+        self.touch(responseset_id)
+        return True
+
+    def add_response(self, responseset_id, label):
+        """
+        Add a response without recording a request, as a change made in iAuditor
+        """
+        self.next_response_id += 1
+        self.response_sets[responseset_id].append({'id': str(self.next_response_id), 'label': label})
+        self.touch(responseset_id)
+
+    def touch(self, responseset_id):
+        self.modified_at[responseset_id] = self.modified_at.get(responseset_id, 0) + 1
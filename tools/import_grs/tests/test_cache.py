@@ -0,0 +1,150 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import logging
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import import_grs as ig
+from tools.import_grs.tests.fakes import FakeResponseSetClient, labels, responses
+
+logger = logging.getLogger('test_cache')
+logger.addHandler(logging.NullHandler())
+
+
+class HashTestCase(unittest.TestCase):
+
+    def test_hash_ignores_order_and_repeated_labels(self):
+        self.assertEqual(ig.hash_labels(labels('Yes', 'No')), ig.hash_labels(labels('No', 'Yes', 'No')))
+        self.assertNotEqual(ig.hash_labels(labels('Yes', 'No')), ig.hash_labels(labels('Yes')))
+
+    def test_labels_are_compared_as_strings(self):
+        self.assertEqual(ig.hash_labels(labels(1, 2)), ig.hash_labels(labels('1', '2')))
+
+
+class IsUnchangedTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.local_hash = ig.hash_labels(labels('Yes', 'No'))
+        self.cache_entry = ig.create_cache_entry(self.local_hash, 'responseset_1',
+                                                 {'responses': labels('Yes', 'No', 'N/A')},
+                                                 '2018-01-01T00:00:00.000Z')
+
+    def test_cache_entry_holds_the_hash_of_the_remote_responses(self):
+        self.assertEqual(self.cache_entry['remote_hash'], ig.hash_labels(labels('N/A', 'No', 'Yes')))
+        self.assertNotEqual(self.cache_entry['remote_hash'], self.local_hash)
+
+    def test_listing_without_modification_time_needs_a_fetch(self):
+        self.assertFalse(ig.is_unchanged(self.cache_entry, {'responseset_id': 'responseset_1'}, self.local_hash))
+
+    def test_listing_with_the_same_modification_time_is_unchanged(self):
+        listing = {'responseset_id': 'responseset_1', 'modified_at': '2018-01-01T00:00:00.000Z'}
+        self.assertTrue(ig.is_unchanged(self.cache_entry, listing, self.local_hash))
+        listing['modified_at'] = '2018-01-02T00:00:00.000Z'
+        self.assertFalse(ig.is_unchanged(self.cache_entry, listing, self.local_hash))
+
+    def test_fetched_response_set_is_compared_with_the_remote_hash(self):
+        fetched = {'responseset_id': 'responseset_1', 'responses': labels('N/A', 'Yes', 'No')}
+        self.assertTrue(ig.is_unchanged(self.cache_entry, fetched, self.local_hash))
+        fetched['responses'] = labels('Yes', 'No')
+        self.assertFalse(ig.is_unchanged(self.cache_entry, fetched, self.local_hash))
+
+    def test_changed_labels_or_response_set_are_not_unchanged(self):
+        fetched = {'responseset_id': 'responseset_1', 'responses': labels('N/A', 'Yes', 'No')}
+        self.assertFalse(ig.is_unchanged(None, fetched, self.local_hash))
+        self.assertFalse(ig.is_unchanged(self.cache_entry, fetched, ig.hash_labels(labels('Yes'))))
+        fetched['responseset_id'] = 'responseset_2'
+        self.assertFalse(ig.is_unchanged(self.cache_entry, fetched, self.local_hash))
+
+
+class ImportResponseSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.local_response_sets = {'Answers': labels('Yes', 'No')}
+        self.remote_response_sets = {'Answers': {'name': 'Answers', 'responseset_id': 'responseset_1'}}
+        self.sc_client = FakeResponseSetClient({'responseset_1': responses('Yes', 'Maybe')})
+
+    def import_response_set(self, cache_entry=None):
+        return ig.import_response_set(logger, self.sc_client, self.local_response_sets, self.remote_response_sets,
+                                      'Answers', cache_entry)
+
+    def test_created_response_set_is_cached(self):
+        cache_entry, unchanged = ig.import_response_set(logger, self.sc_client, self.local_response_sets, {},
+                                                        'Answers', None)
+        self.assertFalse(unchanged)
+        self.assertEqual(cache_entry['responseset_id'], 'responseset_Answers')
+        self.assertEqual(self.sc_client.requests, [('create', 'Answers'), ('get', 'responseset_Answers')])
+
+    def test_response_set_changed_in_iauditor_is_reconciled_again(self):
+        cache_entry, unchanged = self.import_response_set()
+        self.assertFalse(unchanged)
+        self.assertEqual(sorted(response['label'] for response in self.sc_client.response_sets['responseset_1']),
+                         ['No', 'Yes'])
+
+        self.sc_client.requests = []
+        self.assertEqual(self.import_response_set(cache_entry), (cache_entry, True))
+        self.assertEqual(self.sc_client.requests, [('get', 'responseset_1')])
+
+        self.sc_client.add_response('responseset_1', 'Added in iAuditor')
+        self.sc_client.requests = []
+        cache_entry, unchanged = self.import_response_set(cache_entry)
+        self.assertFalse(unchanged)
+        self.assertEqual(self.sc_client.requests, [('get', 'responseset_1'), ('delete response', '1002'),
+                                                   ('get', 'responseset_1')])
+
+    def test_failed_reconciliation_is_not_cached(self):
+        self.sc_client.failing_response_ids = ['response_1']
+        self.assertEqual(self.import_response_set(), (None, False))
+
+
+class ImportResponseSetsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.local_response_sets = [('Answers', labels('Yes', 'No')), ('Colours', labels('Red'))]
+        self.cache = {}
+
+    def import_response_sets(self, sc_client):
+        sc_client.requests = []
+        return ig.import_response_sets(logger, sc_client, iter(self.local_response_sets), self.cache)
+
+    def test_response_sets_the_listing_shows_unmodified_are_not_fetched(self):
+        sc_client = FakeResponseSetClient({'responseset_1': responses('Yes', 'Maybe')},
+                                          names={'responseset_1': 'Answers'})
+        self.assertEqual(self.import_response_sets(sc_client), 0)
+        # the response_sets are listed again, as the import changed when they were last modified
+        self.assertEqual(sc_client.requests[-1], ('list',))
+
+        self.assertEqual(self.import_response_sets(sc_client), 2)
+        self.assertEqual(sc_client.requests, [('list',)])
+
+        sc_client.add_response('responseset_1', 'Added in iAuditor')
+        self.assertEqual(self.import_response_sets(sc_client), 1)
+        self.assertEqual(sc_client.requests, [('list',), ('get', 'responseset_1'), ('delete response', '1003'),
+                                              ('get', 'responseset_1'), ('list',)])
+        self.assertEqual(self.import_response_sets(sc_client), 2)
+        self.assertEqual(sc_client.requests, [('list',)])
+
+    def test_response_sets_are_fetched_when_the_listing_has_no_modification_time(self):
+        sc_client = FakeResponseSetClient({'responseset_1': responses('Yes', 'No')},
+                                          names={'responseset_1': 'Answers'}, lists_modification_times=False)
+        self.assertEqual(self.import_response_sets(sc_client), 0)
+        self.assertEqual(self.import_response_sets(sc_client), 2)
+        self.assertEqual(sc_client.requests, [('list',), ('get', 'responseset_1'), ('get', 'responseset_Colours')])
+
+        sc_client.add_response('responseset_1', 'Added in iAuditor')
+        self.assertEqual(self.import_response_sets(sc_client), 1)
+        self.assertIn(('delete response', '1002'), sc_client.requests)
+
+    def test_failed_import_is_not_cached(self):
+        sc_client = FakeResponseSetClient({'responseset_1': responses('Yes', 'Maybe')},
+                                          names={'responseset_1': 'Answers'}, failing_response_ids=['response_1'])
+        self.import_response_sets(sc_client)
+        self.assertEqual(sorted(self.cache), ['Colours'])
+        self.assertIsNotNone(self.cache['Colours']['modified_at'])
+
+
+if __name__ == '__main__':
+    unittest.main()
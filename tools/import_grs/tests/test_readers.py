@@ -0,0 +1,94 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+from tools.import_grs import readers
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+def read_all(path):
+    return [(name, [label['label'] for label in labels]) for name, labels in readers.iter_response_sets(path)]
+
+
+class ReadersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, filename, text):
+        path = os.path.join(self.temp_dir, filename)
+        with io.open(path, 'w', encoding='utf-8', newline='') as text_file:
+            text_file.write(text)
+        return path
+
+    def test_csv_file_is_a_response_set_named_after_the_file(self):
+        path = self.write('Answers.csv', u'\ufeffResponses,Notes\r\nYes,first\r\n No \r\n\r\n"A, quoted label"\r\n')
+        self.assertEqual(read_all(path), [('Answers', ['Yes', 'No', 'A, quoted label'])])
+
+    def test_tsv_file_is_split_on_tabs(self):
+        path = self.write('Colours.TSV', u'Responses\tNotes\nRed, dark\tfirst\nGréen\n')
+        self.assertEqual(read_all(path), [('Colours', ['Red, dark', u'Gréen'])])
+
+    def test_directory_reads_its_csv_and_tsv_files_in_name_order(self):
+        self.write('b.csv', u'Responses\nB1\nB2\n')
+        self.write('a.tsv', u'Responses\nA1\n')
+        self.write('notes.txt', u'Responses\nignored\n')
+        self.assertEqual(read_all(self.temp_dir), [('a', ['A1']), ('b', ['B1', 'B2'])])
+
+    def test_labels_are_read_lazily(self):
+        self.write('a.csv', u'Responses\nA1\n')
+        response_sets = readers.iter_response_sets(self.temp_dir)
+        name, labels = next(response_sets)
+        self.assertEqual(name, 'a')
+        self.assertEqual(next(labels), {'label': 'A1'})
+
+    def test_unsupported_file_is_rejected(self):
+        self.assertRaises(ValueError, readers.iter_response_sets, self.write('answers.txt', u'Responses\n'))
+
+    @unittest.skipIf(openpyxl is None, 'openpyxl is not installed')
+    def test_every_sheet_of_a_workbook_is_a_response_set(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.title = 'Answers'
+        for row in [['Responses'], ['Yes'], [None], [1]]:
+            workbook.active.append(row)
+        workbook.create_sheet('Empty').append(['Responses'])
+        path = os.path.join(self.temp_dir, 'responses.xlsx')
+        workbook.save(path)
+        self.assertEqual(read_all(path), [('Answers', ['Yes', 1]), ('Empty', [])])
+
+
+    @unittest.skipIf(openpyxl is None, 'openpyxl is not installed')
+    def test_labels_are_the_same_in_every_format(self):
+        values = [u' No ', u'Yes\t', u'  ', u'N/A']
+        workbook = openpyxl.Workbook()
+        workbook.active.title = 'Answers'
+        for value in [u'Responses'] + values:
+            workbook.active.append([value])
+        xlsx_path = os.path.join(self.temp_dir, 'Answers.xlsx')
+        workbook.save(xlsx_path)
+        csv_path = self.write('Answers.csv', u'Responses\n' + u''.join(u'"{0}"\n'.format(value) for value in values))
+        self.assertEqual(read_all(xlsx_path), [('Answers', ['No', 'Yes', 'N/A'])])
+        self.assertEqual(read_all(csv_path), read_all(xlsx_path))
+
+    def test_label_objects_strip_text_and_skip_empty_values(self):
+        self.assertEqual(list(readers.label_objects([u' No ', None, u' ', 1, 0.5])),
+                         [{'label': u'No'}, {'label': 1}, {'label': 0.5}])
+
+
+if __name__ == '__main__':
+    unittest.main()
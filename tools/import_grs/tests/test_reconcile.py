@@ -0,0 +1,69 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import logging
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import import_grs as ig
+from tools.import_grs.tests.fakes import FakeResponseSetClient, labels, responses
+
+logger = logging.getLogger('test_reconcile')
+logger.addHandler(logging.NullHandler())
+
+
+class DiffResponsesTestCase(unittest.TestCase):
+
+    def test_missing_labels_are_created_in_spreadsheet_order(self):
+        self.assertEqual(ig.diff_responses(labels('C', 'A', 'B'), responses('A')), (['C', 'B'], []))
+
+    def test_labels_missing_from_the_spreadsheet_are_deleted(self):
+        self.assertEqual(ig.diff_responses(labels('A'), responses('A', 'B', 'C')), ([], ['response_1', 'response_2']))
+
+    def test_label_repeated_in_the_spreadsheet_is_created_once(self):
+        self.assertEqual(ig.diff_responses(labels('A', 'B', 'A', 'B'), responses()), (['A', 'B'], []))
+
+    def test_every_remote_response_of_a_deleted_label_is_deleted(self):
+        self.assertEqual(ig.diff_responses(labels('A', 'A'), responses('A', 'B', 'A', 'B')),
+                         ([], ['response_1', 'response_3']))
+
+    def test_labels_are_compared_as_strings(self):
+        self.assertEqual(ig.diff_responses(labels(1, 2.5), responses('1', '2.5')), ([], []))
+
+
+class HandleMatchingResponseSetTestCase(unittest.TestCase):
+
+    def reconcile(self, sc_client, local_labels):
+        return ig.handle_matching_rs(logger, {'Answers': local_labels},
+                                     {'Answers': {'name': 'Answers', 'responseset_id': 'responseset_1'}}, 'Answers',
+                                     sc_client, max_in_flight=3)
+
+    def test_changes_are_applied_and_counted(self):
+        sc_client = FakeResponseSetClient({'responseset_1': responses('A', 'B', 'C')})
+        self.assertEqual(self.reconcile(sc_client, labels('A', 'D', 'E', 'D')),
+                         {'created': 2, 'deleted': 2, 'failed': 0})
+        self.assertEqual(sorted(sc_client.requests[1:]), [('create response', 'D'), ('create response', 'E'),
+                                                          ('delete response', 'response_1'),
+                                                          ('delete response', 'response_2')])
+        self.assertEqual(sorted(response['label'] for response in sc_client.response_sets['responseset_1']),
+                         ['A', 'D', 'E'])
+
+    def test_failed_changes_are_counted(self):
+        sc_client = FakeResponseSetClient({'responseset_1': responses('A', 'B', 'C')},
+                                          failing_response_ids=['response_2'])
+        self.assertEqual(self.reconcile(sc_client, labels('A')), {'created': 0, 'deleted': 1, 'failed': 1})
+
+
+class RunConcurrentlyTestCase(unittest.TestCase):
+
+    def test_results_keep_the_order_of_the_arguments(self):
+        self.assertEqual(ig.run_concurrently(lambda x, y: x * y, [(index, 2) for index in range(20)], 4),
+                         [index * 2 for index in range(20)])
+        self.assertEqual(ig.run_concurrently(lambda: None, []), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,157 +2,531 @@
 import argparse
 import datetime
 import errno
+import hashlib
 import logging
 import os
 import re
 import sys
-import yaml
 import json
 import csv
-import pydash
-from pydash import _
-from xlrd import open_workbook
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from collections import namedtuple, OrderedDict
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 from safetypy import safetypy as sp
 from tools.export_users import export_users
 from tools.import_grs import import_grs
 # Possible values here are DEBUG, INFO, WARN, ERROR and CRITICAL
 LOG_LEVEL = logging.DEBUG
-actions = {}
 
-def process_desired_state(server_state, desired_state):
+# Actions applied at the same time
+MAX_ACTIONS_IN_FLIGHT = 8
+
+# Journal of the changes made by an interrupted sync, in the current working directory
+SYNC_JOURNAL_FILENAME = 'sync_users_journal.jsonl'
+
+# Snapshot of the server state and of the input file of the last sync, in the current working directory
+SNAPSHOT_FILENAME = 'sync_users_snapshot.json'
+
+# A snapshot older than this is not used, and the whole organisation is downloaded again
+DEFAULT_SNAPSHOT_MAX_AGE_IN_HOURS = 24
+
+# Header the input CSV file must start with
+CSV_HEADER = ['email', 'lastname', 'firstname', 'groups']
+
+# Actions of a sync plan
+ADD_USER = 'add'
+ADD_TO_GROUPS = 'add to group'
+DEACTIVATE_USER = 'deactivate'
+REMOVE_FROM_GROUPS = 'remove from group'
+
+# A change sync_users makes to a single user. user_id is empty for users that are yet to be added, user_data
+# holds the details of those users and is None for every other action.
+UserAction = namedtuple('UserAction', ['action', 'email', 'user_id', 'groups', 'user_data'])
+
+
+class SyncPlan:
     """
-    Processes the user provided input file and determines any actions that need to happen because the server state is different than the desired state
-    :param server_state: The list of all users and their associated groups in the server
-    :param desired_state: The input provided by the user
-    :return: None
+    Actions needed to bring the users of the organisation in line with the input file
     """
-    group_id =[]
+
+    def __init__(self):
+        self.actions = []
+
+    def add(self, action, email, user_id='', groups=None, user_data=None):
+        self.actions.append(UserAction(action, email, user_id, groups or [], user_data))
+
+    def get_actions(self, action):
+        """
+        :param action:  one of ADD_USER, ADD_TO_GROUPS, DEACTIVATE_USER or REMOVE_FROM_GROUPS
+        :return:        the actions of the plan of that kind, in the order they were planned
+        """
+        return [user_action for user_action in self.actions if user_action.action == action]
+
+    def __len__(self):
+        return len(self.actions)
+
+    def __iter__(self):
+        return iter(self.actions)
+
+
+def parse_groups(groups):
+    """
+    :param groups: comma-separated group names from the groups column of the input file
+    :return: list of the group names, without surrounding spaces and empty names
+    """
+    return [group.strip(' ') for group in groups.split(',') if group.strip(' ') != '']
+
+
+def read_desired_state(logger, desired_state):
+    """
+    Validates and reads the user provided input file in a single pass
+    :param logger: the logger
+    :param desired_state: path of the input file
+    :return: dictionary of user details and group names by email, None if the file is not valid
+    """
+    users = OrderedDict()
     with open(desired_state) as csvDataFile:
         csvReader = csv.reader(csvDataFile)
-        next(csvReader, None)
-        for email, lastname, firstname, groups in csvReader:
-            group_list = []
-            if groups != "":
-                group_list = groups.split(",")
-                group_list = [group.strip(' ') for group in group_list]
-            if email not in [user for user in server_state]:
-                actions[email] = {'action': 'add', 'groups': group_list, 'user_id':'', 'user_data': {'firstname': firstname, 'lastname': lastname, 'email': email, 'reset_password_required': True} }
-            else:
-                group_names_server = server_state[email]['groups'][0::2]
-                group_names_desired = groups.split(',')
-                group_names_desired = [group.strip(' ') for group in group_names_desired]
-                group_diff = [i for i in group_names_desired if i not in group_names_server]
-                if group_diff != [] and group_diff != ['']:
-                    actions[email] = {'action': 'add to group', 'groups': group_diff, 'user_id': server_state[email]['user_id'] }
-
-def process_server_state(server_state, desired_state):
-    """
-    Determines any actions that need to happen because the server state is different than the desired state
+        if next(csvReader, None) != CSV_HEADER:
+            logger.info('Header Missing')
+            return None
+        for row in csvReader:
+            if len(row) != 4:
+                logger.info('Invalid row length: %s' % row)
+                return None
+            email, lastname, firstname, groups = [str(value) for value in row]
+            users[email] = {'lastname': lastname, 'firstname': firstname, 'groups': parse_groups(groups)}
+    return users
+
+
+def compute_sync_plan(server_state, desired_state):
+    """
+    Determines the actions that need to happen because the server state is different than the desired state
     :param server_state: The list of all users and their associated groups in the server
-    :param desired_state: The input provided by the user
-    :return: None
+    :param desired_state: The users of the input file, as returned by read_desired_state
+    :return: SyncPlan of the actions
     """
-    with open(desired_state) as csvDataFile:
-        csvReader = csv.reader(csvDataFile)
-        next(csvReader, None)
-        userlist = {}
+    plan = SyncPlan()
+    for email, desired_user in desired_state.items():
+        if email not in server_state:
+            user_data = {'firstname': desired_user['firstname'], 'lastname': desired_user['lastname'],
+                         'email': email, 'reset_password_required': True}
+            plan.add(ADD_USER, email, groups=desired_user['groups'], user_data=user_data)
+            continue
+        group_names_server = set(server_state[email]['groups'][0::2])
+        group_diff = [group for group in desired_user['groups'] if group not in group_names_server]
+        if group_diff:
+            plan.add(ADD_TO_GROUPS, email, server_state[email]['user_id'], group_diff)
 
-        for row in csvReader:
-            email = row[0]
-            userlist[email] = {'groups': row[3]}
+    for email, server_user in server_state.items():
+        if email not in desired_state:
+            plan.add(DEACTIVATE_USER, email, server_user['user_id'])
+            continue
+        group_names_desired = set(desired_state[email]['groups'])
+        group_diff = [group for group in server_user['groups'][0::2] if group not in group_names_desired]
+        if group_diff:
+            plan.add(REMOVE_FROM_GROUPS, email, server_user['user_id'], group_diff)
+    return plan
+
+
+class ActionJournal:
+    """
+    Record of the completed steps of a sync, one JSON object per line, so that a sync interrupted by a crash can be
+    run again without repeating them. Without a path, completed steps are only kept in memory.
+
+    The first line of the journal holds the ID of the sync it was written for, see get_sync_id. A sync run again
+    after a failure plans only the steps still needed, from a server state that includes the completed ones, so
+    the journal is bound to the input file and snapshot the sync started from rather than to its plan. A journal
+    written for another input file or snapshot is discarded, as its steps may be needed again, e.g. to remove a
+    user from a group it was added back to since.
+    """
+
+    def __init__(self, path=None, sync_id=None):
+        """
+        :param path:     journal file, None to keep the completed steps in memory only
+        :param sync_id:  ID of the sync, see get_sync_id
+        """
+        self.path = path
+        self.sync_id = sync_id
+        self.completed = {}
+        self.discarded = False
+        self.lock = threading.Lock()
+        self.journal_file = None
+        if path is None:
+            return
+        if os.path.isfile(path):
+            journal_sync_id = None
+            entries = []
+            with open(path) as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line of a journal may have been cut short by the crash
+                        continue
+                    if 'sync_id' in entry:
+                        journal_sync_id = entry['sync_id']
+                    elif 'key' in entry:
+                        entries.append(entry)
+            if journal_sync_id == sync_id:
+                self.completed = dict((entry['key'], entry) for entry in entries)
+                self.journal_file = open(path, 'a')
+                return
+            self.discarded = True
+        self.journal_file = open(path, 'w')
+        self.journal_file.write(json.dumps({'sync_id': sync_id}) + '\n')
+        self.journal_file.flush()
+
+    @staticmethod
+    def key(action, email, group_name=''):
+        return '|'.join([action, email, group_name])
+
+    def get(self, key):
+        """
+        :return:  the entry recorded for a completed step, None if the step has not been completed
+        """
+        with self.lock:
+            return self.completed.get(key)
+
+    def record(self, key, **details):
+        entry = dict(details, key=key)
+        with self.lock:
+            self.completed[key] = entry
+            if self.journal_file is not None:
+                self.journal_file.write(json.dumps(entry) + '\n')
+                self.journal_file.flush()
+
+    def close(self, remove=False):
+        """
+        :param remove:  if True, delete the journal file, once every step of the sync has been completed
+        """
+        if self.journal_file is None:
+            return
+        self.journal_file.close()
+        self.journal_file = None
+        if remove:
+            os.remove(self.path)
+
+
+def index_groups_by_name(all_group_details):
+    """
+    :param all_group_details: All the group details in the organisation of requesting user
+    :return: dictionary of group IDs by group name. Of groups sharing a name, the first one is used.
+    """
+    group_ids_by_name = {}
+    for group in all_group_details['groups']:
+        group_ids_by_name.setdefault(group['name'], group['id'])
+    return group_ids_by_name
+
+
+def execute_action(user_action, group_ids_by_name, sc_client, journal):
+    """
+    Applies a single action of the plan. A user is added to the organisation before it is added to its groups.
+    Steps recorded as completed in the journal are skipped. A user the journal records as added is not active, or
+    the plan would not add it again, so it is activated instead.
+    :param user_action: UserAction to apply
+    :param group_ids_by_name: group IDs indexed by index_groups_by_name
+    :param sc_client: Client to access the SafetyCulture methods
+    :param journal: ActionJournal recording the completed steps
+    :return: number of steps that failed
+    """
+    failures = 0
+    email = user_action.email
+    user_id = user_action.user_id
+    if user_action.action == ADD_USER:
+        key = ActionJournal.key(ADD_USER, email)
+        entry = journal.get(key)
+        if entry is not None:
+            user_id = entry['user_id']
+            if sc_client.update_user(user_id, {'status': 'active'}) is None:
+                return 1
+        else:
+            response = sc_client.add_user_to_org(user_action.user_data)
+            if response is None:
+                return 1
+            user_id = json.loads(response)['user']['user_id']
+            journal.record(key, user_id=user_id)
 
-        emails = userlist.keys()
+    if user_action.action == DEACTIVATE_USER:
+        key = ActionJournal.key(DEACTIVATE_USER, email)
+        if journal.get(key) is None:
+            if sc_client.update_user(user_id, {'status': 'inactive'}) is None:
+                return 1
+            journal.record(key)
+        return 0
 
-        for user, _ in server_state.items():
+    for group_name in user_action.groups:
+        if group_name not in group_ids_by_name:
+            continue
+        if user_action.action == REMOVE_FROM_GROUPS:
+            key = ActionJournal.key(REMOVE_FROM_GROUPS, email, group_name)
+            if journal.get(key) is None:
+                if sc_client.remove_user(group_ids_by_name[group_name], user_id) is None:
+                    failures += 1
+                    continue
+                journal.record(key)
+        else:
+            key = ActionJournal.key(ADD_TO_GROUPS, email, group_name)
+            if journal.get(key) is None:
+                if sc_client.add_user_to_group(group_ids_by_name[group_name], {'user_id': user_id}) is None:
+                    failures += 1
+                    continue
+                journal.record(key)
+    return failures
 
-            if user not in emails:
-                actions[user] = {'action': 'deactivate', 'groups': [], 'user_id': server_state[user]['user_id']}
-            else:
-                group_diff = []
-                group_names_server = server_state[user]['groups'][0::2]
-                group_names_desired = userlist[user]['groups'].split(',')
-                group_names_desired = [group.strip(' ') for group in group_names_desired]
-                group_diff = [i for i in group_names_server if i not in group_names_desired]
-                if group_diff != [] and group_diff != ['']:
-                    actions[user] = {'action': 'remove from group', 'groups': group_diff, 'user_id': server_state[user]['user_id']}
 
-def execute_actions(all_group_details, sc_client):
+def execute_actions(logger, plan, all_group_details, sc_client, journal=None,
+                    max_actions_in_flight=MAX_ACTIONS_IN_FLIGHT):
     """
-    Syncs the user base as per the user provided input file
+    Syncs the user base as per the user provided input file, applying up to max_actions_in_flight actions at a time
+    :param logger: the logger
+    :param plan: SyncPlan of the actions to execute
     :param all_group_details: All the group details in the organisation of requesting user
     :param sc_client: Client to access the SafetyCulture methods
-    :return: None
-    """
-    for keys in actions.keys():
-        group_list = actions[keys]['groups']
-        if actions[keys]['action'] == 'add':
-            data = actions[keys]['user_data']
-            response = json.loads(sc_client.add_user_to_org(data))
-            if response:
-                user_id = response['user']['user_id']
-                if group_list != []:
-                    for group_name in group_list:
-                        target_group = _.find(all_group_details['groups'], {'name': group_name})
-                        if target_group:
-                            data = {'user_id': user_id}
-                            sc_client.add_user_to_group(target_group['id'], data)
-
-        if actions[keys]['action'] == 'add to group':
-            user_id = actions[keys]['user_id']
-            for group_name in group_list:
-                target_group = _.find(all_group_details['groups'], {'name': group_name})
-                if target_group:
-                    sc_client.add_user_to_group(target_group['id'], {'user_id': user_id})
-
-        if actions[keys]['action'] == 'deactivate':
-            user_id = actions[keys]['user_id']
-            data = {'status': 'inactive'}
-            sc_client.update_user(user_id, data)
-
-        if actions[keys]['action'] == 'remove from group':
-            user_id = actions[keys]['user_id']
-            for group_name in group_list:
-                target_group = _.find(all_group_details['groups'], {'name': group_name})
-                if target_group:
-                    sc_client.remove_user(target_group['id'], user_id)
-
-
-def sync_users(api_token, input_filepath):
-    """
-    Load local User data, get system User data, compare and add users to system
-    """
-    sc_client = sp.SafetyCulture(api_token)
-    logger = import_grs.configure_logger()
+    :param journal: ActionJournal recording the completed steps, to skip them when the sync is run again
+    :param max_actions_in_flight: number of actions applied at the same time
+    :return: number of steps that failed
+    """
+    journal = journal or ActionJournal()
+    group_ids_by_name = index_groups_by_name(all_group_details)
+    pending_actions = queue.Queue()
+    for user_action in plan:
+        pending_actions.put(user_action)
+    failures = []
+
+    def execute_pending_actions():
+        while True:
+            try:
+                user_action = pending_actions.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                failed_steps = execute_action(user_action, group_ids_by_name, sc_client, journal)
+            except Exception as ex:
+                logger.error('Unable to {0} {1}: {2}'.format(user_action.action, user_action.email, ex))
+                failed_steps = 1
+            if failed_steps:
+                failures.append(failed_steps)
+
+    workers = [threading.Thread(target=execute_pending_actions)
+               for _ in range(min(max_actions_in_flight, len(plan)))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(failures)
+
+
+def load_snapshot(logger, snapshot_filepath, max_age_in_hours=DEFAULT_SNAPSHOT_MAX_AGE_IN_HOURS):
+    """
+    :param logger: the logger
+    :param snapshot_filepath: path of the snapshot saved by the last sync
+    :param max_age_in_hours: age beyond which the snapshot is not used
+    :return: the snapshot, None if there is none or it is too old or unreadable
+    """
+    if not os.path.isfile(snapshot_filepath):
+        return None
+    try:
+        with open(snapshot_filepath) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except ValueError:
+        logger.warning('Ignoring unreadable snapshot ' + snapshot_filepath)
+        return None
+    taken_at = datetime.datetime.strptime(snapshot['taken_at'], '%Y-%m-%dT%H:%M:%SZ')
+    if datetime.datetime.utcnow() - taken_at > datetime.timedelta(hours=max_age_in_hours):
+        logger.info('Snapshot taken at {0} is too old, downloading all users'.format(snapshot['taken_at']))
+        return None
+    return snapshot
+
+
+def save_snapshot(snapshot_filepath, taken_at, server_state, desired_state):
+    """
+    Write the snapshot, replacing the previous one atomically where the platform allows it
+    :param snapshot_filepath: path of the snapshot
+    :param taken_at: datetime the server state was downloaded at
+    :param server_state: all users and their associated groups in the server
+    :param desired_state: The users of the input file, as returned by read_desired_state
+    """
+    temp_path = snapshot_filepath + '.tmp'
+    with open(temp_path, 'w') as snapshot_file:
+        json.dump({'taken_at': taken_at.strftime('%Y-%m-%dT%H:%M:%SZ'), 'users': server_state,
+                   'desired': desired_state}, snapshot_file)
+    if hasattr(os, 'replace'):
+        os.replace(temp_path, snapshot_filepath)
+    else:
+        if os.path.exists(snapshot_filepath):
+            os.remove(snapshot_filepath)
+        os.rename(temp_path, snapshot_filepath)
+
+
+def get_sync_id(input_filepath, snapshot):
+    """
+    :param input_filepath: path of the input file
+    :param snapshot: snapshot the sync started from, None for a full sync
+    :return: hash of the contents of the input file and of the time the snapshot was taken, which stay the same
+             until a sync completes and saves a new snapshot
+    """
+    sync_hash = hashlib.sha1()
+    with open(input_filepath, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(65536), b''):
+            sync_hash.update(chunk)
+    sync_hash.update(json.dumps(None if snapshot is None else snapshot['taken_at']).encode('utf-8'))
+    return sync_hash.hexdigest()
+
+
+def get_changed_emails(previous_desired_state, desired_state):
+    """
+    :return: set of the emails added to, removed from or changed in the input file since the last sync
+    """
+    changed_emails = set(email for email in previous_desired_state if email not in desired_state)
+    for email, desired_user in desired_state.items():
+        if previous_desired_state.get(email) != desired_user:
+            changed_emails.add(email)
+    return changed_emails
+
+
+def refresh_server_state(sc_client, snapshot, desired_state, group_ids_by_name):
+    """
+    Update the server state of a snapshot with the current state of the users changed in the input file since the
+    last sync, downloading only the groups those users belong or belonged to. The user listing downloaded with them
+    covers the whole organisation, so users activated on the server that are not in the input file, and users no
+    longer active, are handled as changed too. Group memberships changed on the server for other users are only
+    picked up by a full sync.
+    :param sc_client: Client to access the SafetyCulture methods
+    :param snapshot: snapshot saved by the last sync
+    :param desired_state: The users of the input file, as returned by read_desired_state
+    :param group_ids_by_name: group IDs indexed by index_groups_by_name
+    :return: tuple of the server state and the set of emails of the changed users
+    """
+    server_state = snapshot['users']
+    changed_emails = get_changed_emails(snapshot['desired'], desired_state)
+    group_names = set()
+    for email in changed_emails:
+        for state in [snapshot['desired'], desired_state]:
+            group_names.update(state.get(email, {}).get('groups', []))
+        group_names.update(server_state.get(email, {}).get('groups', [])[0::2])
+    group_ids = set(group_ids_by_name[group_name] for group_name in group_names if group_name in group_ids_by_name)
+    current_users = export_users.get_all_users_and_groups(sc_client=sc_client, group_ids=group_ids)
+    changed_emails.update(email for email in current_users if email not in server_state and
+                          email not in desired_state)
+    changed_emails.update(email for email in server_state if email not in current_users)
+    for email in changed_emails:
+        if email in current_users:
+            server_state[email] = current_users[email]
+        else:
+            server_state.pop(email, None)
+    return server_state, changed_emails
+
+
+def apply_plan_to_state(server_state, plan, desired_state, group_ids_by_name, journal):
+    """
+    Update the server state with the changes made by a plan that was executed without failures
+    :param server_state: all users and their associated groups in the server
+    :param plan: SyncPlan that was executed
+    :param desired_state: The users of the input file, as returned by read_desired_state
+    :param group_ids_by_name: group IDs indexed by index_groups_by_name
+    :param journal: ActionJournal recording the IDs of the users added
+    """
+    for user_action in plan:
+        email = user_action.email
+        if user_action.action == DEACTIVATE_USER:
+            server_state.pop(email, None)
+            continue
+        desired_user = desired_state[email]
+        groups = []
+        for group_name in desired_user['groups']:
+            if group_name in group_ids_by_name:
+                groups += [group_name, group_ids_by_name[group_name]]
+        if user_action.action == ADD_USER:
+            server_state[email] = {'firstname': desired_user['firstname'], 'lastname': desired_user['lastname'],
+                                   'user_id': journal.get(ActionJournal.key(ADD_USER, email))['user_id']}
+        server_state[email]['groups'] = groups
+
+
+def print_plan(plan):
+    """
+    Print the actions of a plan, one per line
+    :param plan: SyncPlan to print
+    """
+    for user_action in plan:
+        print('{0}: {1} {2}'.format(user_action.action, user_action.email, ', '.join(user_action.groups)).rstrip())
+    print('{0} changes planned'.format(len(plan)))
+
+
+def sync_users(api_token, input_filepath, journal_filepath=SYNC_JOURNAL_FILENAME,
+               snapshot_filepath=SNAPSHOT_FILENAME, full_sync=False, dry_run=False, sc_client=None, logger=None):
+    """
+    Load local User data, get system User data, compare and add users to system. When a recent snapshot of the
+    last sync exists, only the users changed in the input file since then are downloaded and compared.
+    :param api_token: API token of the organisation
+    :param input_filepath: path of the input file
+    :param journal_filepath: path of the journal of completed changes, removed once every change has been made
+    :param snapshot_filepath: path of the snapshot of the server state after the last sync
+    :param full_sync: if True, ignore the snapshot and download all users
+    :param dry_run: if True, print the changes that would be made instead of making them
+    :param sc_client: Client to access the SafetyCulture methods, created with api_token if None
+    :param logger: the logger, configured in the current working directory if None
+    """
+    sc_client = sc_client or sp.SafetyCulture(api_token)
+    logger = logger or import_grs.configure_logger()
 
     # Validating the CSV input first
-    dataValidator = open(input_filepath,'r')
-    reader= csv.reader(dataValidator)
-    header = next(reader)
-    if header != ['email', 'lastname', 'firstname', 'groups']:
-        logger.info('Header Missing')
+    desired_users = read_desired_state(logger, input_filepath)
+    if desired_users is None:
         return
-    for data in reader:
-        if len(data) != 4:
-            logger.info('Invalid row length: %s' % data)
-            return
-        data[0] = str(data[0])
-        data[1] = str(data[1])
-        data[2] = str(data[2])
-        data[3] = str(data[3])
 
+    taken_at = datetime.datetime.utcnow()
     all_group_details = json.loads(sc_client.get_all_groups_in_org().content)
-    server_users = export_users.get_all_users_and_groups(api_token)
+    group_ids_by_name = index_groups_by_name(all_group_details)
+    snapshot = None if full_sync else load_snapshot(logger, snapshot_filepath)
+    if snapshot is None:
+        server_users = export_users.get_all_users_and_groups(sc_client=sc_client)
+        plan = compute_sync_plan(server_users, desired_users)
+    else:
+        taken_at = datetime.datetime.strptime(snapshot['taken_at'], '%Y-%m-%dT%H:%M:%SZ')
+        server_users, changed_emails = refresh_server_state(sc_client, snapshot, desired_users, group_ids_by_name)
+        logger.info('{0} users changed since the snapshot taken at {1}'.format(len(changed_emails),
+                                                                               snapshot['taken_at']))
+        plan = compute_sync_plan(dict((email, server_users[email]) for email in changed_emails
+                                      if email in server_users),
+                                 OrderedDict((email, desired_users[email]) for email in desired_users
+                                             if email in changed_emails))
+
+    if dry_run:
+        print_plan(plan)
+        return
 
-    process_desired_state(server_users, input_filepath)
-    process_server_state(server_users, input_filepath)
-    execute_actions(all_group_details, sc_client)
+    journal = ActionJournal(journal_filepath, get_sync_id(input_filepath, snapshot))
+    if journal.discarded:
+        logger.info('Discarding the journal of a sync of another input file or snapshot')
+    elif journal.completed:
+        logger.info('Resuming the sync, {0} completed changes are skipped'.format(len(journal.completed)))
+    failures = execute_actions(logger, plan, all_group_details, sc_client, journal)
+    if failures:
+        logger.error('{0} changes failed, run the sync again to retry them'.format(failures))
+    else:
+        apply_plan_to_state(server_users, plan, desired_users, group_ids_by_name, journal)
+        save_snapshot(snapshot_filepath, taken_at, server_users, desired_users)
+    journal.close(remove=failures == 0)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-t', '--token', required=True)
     parser.add_argument('-f', '--file', required=True)
+    parser.add_argument('-j', '--journal', default=SYNC_JOURNAL_FILENAME,
+                        help='file recording completed changes, so that an interrupted sync can be resumed')
+    parser.add_argument('-s', '--snapshot', default=SNAPSHOT_FILENAME,
+                        help='file keeping the server state between syncs, so that only users changed in the input '
+                             'file are downloaded. Group memberships changed in iAuditor are only corrected by a full '
+                             'sync, once the snapshot is 24 hours old or with --full')
+    parser.add_argument('--full', action='store_true', help='ignore the snapshot and download all users')
+    parser.add_argument('--dry-run', action='store_true', help='print the changes without making them')
     args = parser.parse_args()
     api_token = args.token
     input_filepath = args.file
-    sync_users(api_token, input_filepath)
\ No newline at end of file
+    sync_users(api_token, input_filepath, args.journal, args.snapshot, args.full, args.dry_run)
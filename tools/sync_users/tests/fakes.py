@@ -0,0 +1,80 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import json
+from collections import OrderedDict
+
+GROUPS = [{'name': 'Group A', 'id': 'role_a'}, {'name': 'Group B', 'id': 'role_b'}, {'name': 'Group C', 'id': 'role_c'}]
+
+
+class GroupsResponse:
+
+    def __init__(self, groups):
+        self.content = json.dumps({'groups': groups})
+
+
+class FakeOrganisation:
+    """
+    Organisation whose users and group memberships change with the requests made to it, like the API. Changes to
+    the users listed in failing_user_ids fail.
+    """
+
+    def __init__(self, users=(), groups=GROUPS, failing_user_ids=()):
+        """
+        :param users:             list of (email, status, list of group IDs) tuples, in the order of the user listing
+        :param groups:            list of group dictionaries with a name and an id
+        :param failing_user_ids:  IDs of the users whose changes fail
+        """
+        self.groups = groups
+        self.failing_user_ids = failing_user_ids
+        self.users = OrderedDict()
+        self.memberships = dict((group['id'], []) for group in groups)
+        for email, status, group_ids in users:
+            self.users[email] = {'email': email, 'status': status, 'firstname': 'First', 'lastname': 'Last',
+                                 'user_id': 'user_' + email}
+            for group_id in group_ids:
+                self.memberships[group_id].append('user_' + email)
+        self.requests = []
+        self.requested_group_ids = []
+
+    def get_my_org(self):
+        return 'organisation'
+
+    def get_all_groups_in_org(self):
+        return GroupsResponse(self.groups)
+
+    def get_users_of_group(self, group_id):
+        self.requested_group_ids.append(group_id)
+        return json.dumps({'users': [dict(user) for user in self.users.values()
+                                     if group_id == 'organisation' or user['user_id'] in self.memberships[group_id]]})
+
+    def add_user_to_org(self, user_data):
+        self.requests.append(('add', user_data['email']))
+        self.users[user_data['email']] = {'email': user_data['email'], 'status': 'active',
+                                          'firstname': user_data['firstname'], 'lastname': user_data['lastname'],
+                                          'user_id': 'user_' + user_data['email']}
+        return json.dumps({'user': {'user_id': 'user_' + user_data['email']}})
+
+    def add_user_to_group(self, group_id, user_data):
+        self.requests.append(('add to group', group_id, user_data['user_id']))
+        if user_data['user_id'] in self.failing_user_ids:
+            return None
+        self.memberships[group_id].append(user_data['user_id'])
+        return json.dumps({'ok': True})
+
+    def remove_user(self, role_id, user_id):
+        self.requests.append(('remove from group', role_id, user_id))
+        if user_id in self.failing_user_ids:
+            return None
+        self.memberships[role_id].remove(user_id)
+        return {'ok': True}
+
+    def update_user(self, user_id, user_data):
+        self.requests.append(('update', user_id, user_data['status']))
+        if user_id in self.failing_user_ids:
+            return None
+        for user in self.users.values():
+            if user['user_id'] == user_id:
+                user['status'] = user_data['status']
+        return {'ok': True}
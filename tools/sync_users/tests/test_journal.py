@@ -0,0 +1,168 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import csv
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import sync_users as su
+from tools.sync_users.tests.fakes import FakeOrganisation, GROUPS
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def create_plan():
+    plan = su.SyncPlan()
+    plan.add(su.ADD_USER, 'new@example.com', groups=['Group A'],
+             user_data={'email': 'new@example.com', 'firstname': 'New', 'lastname': 'User'})
+    plan.add(su.REMOVE_FROM_GROUPS, 'moved@example.com', 'user_moved@example.com', ['Group A', 'Group B'])
+    plan.add(su.DEACTIVATE_USER, 'gone@example.com', 'user_gone@example.com')
+    return plan
+
+
+def create_organisation():
+    return FakeOrganisation([('kept@example.com', 'active', ['role_a']),
+                             ('moved@example.com', 'active', ['role_a', 'role_b']),
+                             ('gone@example.com', 'active', [])])
+
+
+class JournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.temp_dir, su.SYNC_JOURNAL_FILENAME)
+        self.logger = logging.getLogger('test_journal')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.handler = RecordingHandler()
+        self.logger.handlers = [self.handler]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+
+class ActionJournalTestCase(JournalTestCase):
+
+    def test_journal_is_removed_once_every_change_is_made(self):
+        journal = su.ActionJournal(self.journal_path, 'sync_1')
+        failures = su.execute_actions(self.logger, create_plan(), {'groups': GROUPS}, create_organisation(),
+                                      journal)
+        journal.close(remove=failures == 0)
+        self.assertEqual(failures, 0)
+        self.assertFalse(os.path.exists(self.journal_path))
+
+    def test_completed_steps_are_skipped(self):
+        journal = su.ActionJournal(self.journal_path, 'sync_1')
+        journal.record(su.ActionJournal.key(su.ADD_USER, 'new@example.com'), user_id='user_new@example.com')
+        journal.record(su.ActionJournal.key(su.REMOVE_FROM_GROUPS, 'moved@example.com', 'Group A'))
+        journal.record(su.ActionJournal.key(su.DEACTIVATE_USER, 'gone@example.com'))
+        journal.close()
+
+        sc_client = create_organisation()
+        journal = su.ActionJournal(self.journal_path, 'sync_1')
+        self.assertFalse(journal.discarded)
+        su.execute_actions(self.logger, create_plan(), {'groups': GROUPS}, sc_client, journal,
+                           max_actions_in_flight=1)
+        # a user the journal records as added is activated rather than added again
+        self.assertEqual(sc_client.requests, [
+            ('update', 'user_new@example.com', 'active'),
+            ('add to group', 'role_a', 'user_new@example.com'),
+            ('remove from group', 'role_b', 'user_moved@example.com')
+        ])
+
+    def test_journal_of_another_sync_is_discarded(self):
+        journal = su.ActionJournal(self.journal_path, 'sync_1')
+        journal.record(su.ActionJournal.key(su.DEACTIVATE_USER, 'gone@example.com'))
+        journal.close()
+        journal = su.ActionJournal(self.journal_path, 'sync_2')
+        self.assertTrue(journal.discarded)
+        self.assertEqual(journal.completed, {})
+        journal.close()
+        self.assertFalse(su.ActionJournal(self.journal_path, 'sync_2').discarded)
+
+    def test_line_cut_short_by_a_crash_is_ignored(self):
+        journal = su.ActionJournal(self.journal_path, 'sync_1')
+        journal.record(su.ActionJournal.key(su.DEACTIVATE_USER, 'gone@example.com'))
+        journal.close()
+        with open(self.journal_path, 'a') as journal_file:
+            journal_file.write('{"key": "remove from gr')
+        self.assertEqual(len(su.ActionJournal(self.journal_path, 'sync_1').completed), 1)
+
+
+class ResumedSyncTestCase(JournalTestCase):
+
+    def setUp(self):
+        JournalTestCase.setUp(self)
+        self.input_path = os.path.join(self.temp_dir, 'users.csv')
+        self.snapshot_path = os.path.join(self.temp_dir, su.SNAPSHOT_FILENAME)
+        self.sc_client = create_organisation()
+
+    def write_input_file(self, rows):
+        with open(self.input_path, 'w') as input_file:
+            writer = csv.writer(input_file)
+            writer.writerow(su.CSV_HEADER)
+            for email, groups in rows:
+                writer.writerow([email, 'Last', 'First', groups])
+
+    def sync(self, failing_user_ids=()):
+        self.sc_client.failing_user_ids = failing_user_ids
+        self.sc_client.requests = []
+        self.handler.messages = []
+        su.sync_users(None, self.input_path, self.journal_path, self.snapshot_path, sc_client=self.sc_client,
+                      logger=self.logger)
+
+    def test_sync_run_again_after_a_failure_resumes_its_journal(self):
+        self.write_input_file([('kept@example.com', 'Group A'), ('moved@example.com', ''),
+                               ('new@example.com', 'Group A')])
+        self.sync(failing_user_ids=['user_moved@example.com'])
+        self.assertTrue(os.path.isfile(self.journal_path))
+        self.assertFalse(os.path.exists(self.snapshot_path))
+
+        self.sync()
+        # the rerun plans only the failed changes, from a server state holding the completed ones
+        self.assertEqual(sorted(self.sc_client.requests), [('remove from group', 'role_a', 'user_moved@example.com'),
+                                                           ('remove from group', 'role_b', 'user_moved@example.com')])
+        self.assertIn('Resuming the sync, 3 completed changes are skipped', self.handler.messages)
+        self.assertFalse(os.path.exists(self.journal_path))
+        self.assertTrue(os.path.isfile(self.snapshot_path))
+
+    def test_incremental_sync_run_again_after_a_failure_resumes_its_journal(self):
+        self.write_input_file([('kept@example.com', 'Group A'), ('moved@example.com', 'Group A, Group B')])
+        self.sync()
+        self.assertEqual(self.sc_client.requests, [('update', 'user_gone@example.com', 'inactive')])
+
+        self.write_input_file([('kept@example.com', 'Group A, Group C'), ('moved@example.com', 'Group C')])
+        self.sync(failing_user_ids=['user_moved@example.com'])
+        self.sync()
+        self.assertEqual(sorted(self.sc_client.requests), [('add to group', 'role_c', 'user_moved@example.com'),
+                                                           ('remove from group', 'role_a', 'user_moved@example.com'),
+                                                           ('remove from group', 'role_b', 'user_moved@example.com')])
+        self.assertIn('Resuming the sync, 1 completed changes are skipped', self.handler.messages)
+        self.assertEqual(self.sc_client.memberships['role_c'], ['user_kept@example.com', 'user_moved@example.com'])
+
+    def test_journal_is_discarded_when_the_input_file_changes(self):
+        self.write_input_file([('kept@example.com', 'Group A'), ('moved@example.com', '')])
+        self.sync(failing_user_ids=['user_moved@example.com'])
+        self.write_input_file([('kept@example.com', 'Group A'), ('moved@example.com', 'Group B')])
+        self.sync()
+        self.assertIn('Discarding the journal of a sync of another input file or snapshot', self.handler.messages)
+        self.assertEqual(self.sc_client.requests, [('remove from group', 'role_a', 'user_moved@example.com')])
+        self.assertFalse(os.path.exists(self.journal_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import os
+import sys
+import unittest
+from collections import OrderedDict
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import sync_users as su
+from tools.sync_users.tests.fakes import FakeOrganisation, GROUPS
+
+
+def desired_user(*groups):
+    return {'firstname': 'First', 'lastname': 'Last', 'groups': list(groups)}
+
+
+def server_user(email, *groups):
+    group_ids = dict((group['name'], group['id']) for group in GROUPS)
+    memberships = []
+    for group in groups:
+        memberships += [group, group_ids[group]]
+    return {'firstname': 'First', 'lastname': 'Last', 'user_id': 'user_' + email, 'groups': memberships}
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.group_ids_by_name = su.index_groups_by_name({'groups': GROUPS})
+        self.previous_desired_state = OrderedDict([
+            ('kept@example.com', desired_user('Group A')),
+            ('moved@example.com', desired_user('Group A')),
+            ('removed@example.com', desired_user('Group C'))
+        ])
+        self.snapshot = {
+            'taken_at': '2018-01-01T00:00:00Z',
+            'desired': self.previous_desired_state,
+            'users': dict((email, server_user(email, *user['groups']))
+                          for email, user in self.previous_desired_state.items())
+        }
+        self.desired_state = OrderedDict([
+            ('kept@example.com', desired_user('Group A')),
+            ('moved@example.com', desired_user('Group B')),
+            ('added@example.com', desired_user('Group B'))
+        ])
+
+    def test_changed_emails_are_added_removed_or_changed_rows(self):
+        self.assertEqual(su.get_changed_emails(self.previous_desired_state, self.desired_state),
+                         {'moved@example.com', 'removed@example.com', 'added@example.com'})
+        self.assertEqual(su.get_changed_emails(self.desired_state, self.desired_state), set())
+
+    def test_refresh_downloads_only_the_groups_of_changed_users(self):
+        sc_client = FakeOrganisation([('kept@example.com', 'active', ['role_a']),
+                                      ('moved@example.com', 'active', ['role_a']),
+                                      ('removed@example.com', 'active', ['role_c'])])
+        server_state, changed_emails = su.refresh_server_state(sc_client, self.snapshot, self.desired_state,
+                                                               self.group_ids_by_name)
+        self.assertEqual(changed_emails, {'moved@example.com', 'removed@example.com', 'added@example.com'})
+        self.assertEqual(sorted(sc_client.requested_group_ids), ['organisation', 'role_a', 'role_b', 'role_c'])
+        self.assertEqual(server_state['moved@example.com']['groups'], ['Group A', 'role_a'])
+        self.assertNotIn('added@example.com', server_state)
+
+        plan = su.compute_sync_plan(dict((email, server_state[email]) for email in changed_emails
+                                         if email in server_state),
+                                    OrderedDict((email, user) for email, user in self.desired_state.items()
+                                                if email in changed_emails))
+        self.assertEqual(sorted((user_action.action, user_action.email) for user_action in plan), [
+            (su.ADD_USER, 'added@example.com'),
+            (su.ADD_TO_GROUPS, 'moved@example.com'),
+            (su.DEACTIVATE_USER, 'removed@example.com'),
+            (su.REMOVE_FROM_GROUPS, 'moved@example.com')
+        ])
+
+    def test_users_activated_or_deactivated_on_the_server_are_changed(self):
+        self.desired_state = self.previous_desired_state
+        sc_client = FakeOrganisation([('kept@example.com', 'inactive', ['role_a']),
+                                      ('moved@example.com', 'active', ['role_a']),
+                                      ('removed@example.com', 'active', ['role_c']),
+                                      ('server@example.com', 'active', [])])
+        server_state, changed_emails = su.refresh_server_state(sc_client, self.snapshot, self.desired_state,
+                                                               self.group_ids_by_name)
+        self.assertEqual(changed_emails, {'kept@example.com', 'server@example.com'})
+        self.assertEqual(sorted(server_state), ['moved@example.com', 'removed@example.com', 'server@example.com'])
+        # no group is downloaded, the users changed on the server are found in the user listing
+        self.assertEqual(sc_client.requested_group_ids, ['organisation'])
+
+
+if __name__ == '__main__':
+    unittest.main()
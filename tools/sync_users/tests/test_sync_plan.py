@@ -0,0 +1,86 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from collections import OrderedDict
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import sync_users as su
+
+logger = logging.getLogger('test_sync_plan')
+logger.addHandler(logging.NullHandler())
+
+
+def server_user(user_id, *groups):
+    memberships = []
+    for group in groups:
+        memberships += [group, 'role_' + group]
+    return {'firstname': 'First', 'lastname': 'Last', 'user_id': user_id, 'groups': memberships}
+
+
+def desired_user(*groups):
+    return {'firstname': 'First', 'lastname': 'Last', 'groups': list(groups)}
+
+
+class SyncPlanTestCase(unittest.TestCase):
+
+    def plan_actions(self, server_state, desired_state):
+        return sorted((user_action.action, user_action.email, user_action.user_id, user_action.groups)
+                      for user_action in su.compute_sync_plan(server_state, desired_state))
+
+    def test_matching_states_need_no_action(self):
+        self.assertEqual(self.plan_actions({'a@example.com': server_user('user_a', 'Group A', 'Group B')},
+                                           {'a@example.com': desired_user('Group B', 'Group A')}), [])
+
+    def test_user_moved_between_groups_is_added_and_removed(self):
+        server_state = {'a@example.com': server_user('user_a', 'Group A', 'Group B')}
+        desired_state = {'a@example.com': desired_user('Group B', 'Group C', 'Group D')}
+        self.assertEqual(self.plan_actions(server_state, desired_state), [
+            (su.ADD_TO_GROUPS, 'a@example.com', 'user_a', ['Group C', 'Group D']),
+            (su.REMOVE_FROM_GROUPS, 'a@example.com', 'user_a', ['Group A'])
+        ])
+
+    def test_new_users_are_added_and_missing_users_deactivated(self):
+        server_state = {'old@example.com': server_user('user_old', 'Group A')}
+        desired_state = OrderedDict([('new@example.com', desired_user('Group A'))])
+        plan = su.compute_sync_plan(server_state, desired_state)
+        self.assertEqual(self.plan_actions(server_state, desired_state), [
+            (su.ADD_USER, 'new@example.com', '', ['Group A']),
+            (su.DEACTIVATE_USER, 'old@example.com', 'user_old', [])
+        ])
+        self.assertEqual(plan.get_actions(su.ADD_USER)[0].user_data,
+                         {'firstname': 'First', 'lastname': 'Last', 'email': 'new@example.com',
+                          'reset_password_required': True})
+
+
+class ReadDesiredStateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'users.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read(self, lines):
+        with open(self.path, 'w') as csv_file:
+            csv_file.write('\n'.join(lines) + '\n')
+        return su.read_desired_state(logger, self.path)
+
+    def test_group_names_are_split_and_stripped(self):
+        users = self.read(['email,lastname,firstname,groups', 'a@example.com,Last,First," Group A,, Group B "'])
+        self.assertEqual(users['a@example.com'], desired_user('Group A', 'Group B'))
+
+    def test_invalid_files_are_rejected(self):
+        self.assertIsNone(self.read(['email,firstname,lastname,groups', 'a@example.com,First,Last,Group A']))
+        self.assertIsNone(self.read(['email,lastname,firstname,groups', 'a@example.com,Last,First']))
+
+
+if __name__ == '__main__':
+    unittest.main()